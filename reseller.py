@@ -7,15 +7,51 @@ Includes FTP server for user file access
 
 import os
 import sys
+import csv
+import filecmp
+import gzip
 import json
+import argparse
+import atexit
+import bisect
+import cProfile
 import hashlib
+import hmac
+import importlib
+import logging
+import queue
+import random
 import sqlite3
+import shutil
+import stat
 import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from functools import wraps
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import util as multiprocessing_util
 from datetime import datetime
 from pathlib import Path
-from pyftpdlib.authorizers import DummyAuthorizer
-from pyftpdlib.handlers import FTPHandler
-from pyftpdlib.servers import FTPServer
+try:
+    import fcntl
+except ImportError:  # Windows: no reflink support
+    fcntl = None
+try:
+    import brotli
+except ImportError:  # Only .gz variants are written
+    brotli = None
+# The FTP server (pyftpdlib) and the HTTP server (asyncio) live in
+# reseller_ftp.py and reseller_http.py and are imported only by the commands
+# that run them; see __getattr__ below.
+
+if __name__ == "__main__":
+    # Those modules import this file as "reseller": hand them the running
+    # script instead of letting them load a second copy with its own state
+    sys.modules.setdefault("reseller", sys.modules[__name__])
 
 # Configuration
 RESELLER_DB = "reseller_accounts.db"
@@ -23,134 +59,2219 @@ CMS_DB = "AGP_CMS/agp_cms.db"
 SITES_ROOT = "reseller_sites"
 FTP_PORT = 21
 FTP_HOST = "0.0.0.0"
+FTP_PERMISSIONS = "elradfmwMT"  # Full permissions inside the site folder
+
+# FTP concurrency
+FTP_MODE = "async"  # "async", "threaded" (thread per session) or "multiprocess" (process per session)
+FTP_WORKERS = 1  # Pre-forked async processes; 0 = one per CPU core (async mode, Unix only)
+FTP_MAX_CONS = 256  # Max simultaneous sessions per server process
+FTP_MAX_CONS_PER_IP = 5  # Max simultaneous sessions from one client address
+FTP_MODES = ("async", "threaded", "multiprocess")
+
+# FTP event logging (JSON lines on stdout, written by a background thread)
+FTP_LOG_LEVEL = "INFO"  # DEBUG also forwards pyftpdlib's per-command log
+FTP_LOG_QUEUE_SIZE = 10000  # Events buffered before new ones are dropped
+FTP_LOG_SAMPLING = {}  # Fraction of events kept per event name, e.g. {"download": 0.1}
+
+# FTP bandwidth (bytes/second, 0 = unlimited). "read" is data received from
+# clients (uploads), "write" is data sent to them (downloads), as in pyftpdlib.
+FTP_GLOBAL_READ_LIMIT = 0  # All uploads together, split across pre-forked workers
+FTP_GLOBAL_WRITE_LIMIT = 0  # All downloads together, split across pre-forked workers
+FTP_THROUGHPUT_LOG_INTERVAL = 60  # Seconds between per-account throughput log events
+
+# Prometheus metrics endpoint (off unless a port is set or --metrics-port is given)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = None
+METRICS_SNAPSHOT_INTERVAL = 5  # Seconds between metric snapshots from worker processes
+
+# Profiling (off by default): timing spans around provisioning, startup and FTP
+# callbacks, summarized when the process exits. --profile* flags and the
+# RESELLER_PROFILE* environment variables override these.
+PROFILE = False
+PROFILE_OUTPUT = None  # JSON file for the span summary; None = print a table to stderr
+PROFILE_CPROFILE = None  # Also write cProfile stats (pstats format) for the main thread here
+PROFILE_WINDOW = 0  # Seconds servers are cProfiled after startup; 0 = the whole run
+PROFILE_SAMPLES = 2048  # Durations kept per span for percentiles
+
+# SQLite tuning for the reseller database
+SQLITE_BUSY_TIMEOUT = 5000  # Milliseconds to wait for a lock before failing
+SQLITE_CACHE_KB = 16384  # Page cache size per connection
+SQLITE_SYNCHRONOUS = "NORMAL"  # Durable at checkpoints, fast commits in WAL mode
+SQLITE_STATEMENT_CACHE = 256  # Prepared statements kept per connection
+
+# FTP credential cache (accounts are looked up lazily on login)
+AUTH_CACHE_SIZE = 10000  # Max cached accounts
+AUTH_CACHE_TTL = 60  # Seconds before a cached account is re-read
+AUTH_VERIFY_CACHE_TTL = 300  # Seconds a successful password check is remembered
+AUTH_KDF_WORKERS = 4  # Threads checking passwords off the event loop (async mode)
+
+# Password hashing: scrypt, or PBKDF2-SHA256 where OpenSSL lacks scrypt.
+# Hashes made with other parameters are upgraded on the next login.
+PASSWORD_SCRYPT_N = 2 ** 14  # CPU/memory cost (16 MB with r=8)
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_PBKDF2_ITERATIONS = 600000
+
+# Hot reload of account changes into a running FTP server
+RELOAD_INTERVAL = 5  # Seconds between checks for account changes
+CHANGE_LOG_RETENTION = 3600  # Seconds to keep rows in account_changes
+
+# Account listing
+LIST_PAGE_SIZE = 500  # Rows fetched per keyset page
+EXPORT_FIELDS = ("id", "username", "email", "site_name", "package_type", "package",
+                 "status", "ftp_enabled", "site_path", "created_at")
+
+# Linux ioctl for reflink (copy-on-write) clones: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# Bulk provisioning
+BULK_CHUNK_SIZE = 500  # Accounts inserted per transaction
+BULK_WORKERS = 8  # Threads building site folders in parallel
+
+# Account import from CSV / JSON Lines exports (reseller.py import)
+IMPORT_CHUNK_SIZE = 500  # Rows committed together with their checkpoint
+IMPORT_SHOW_ERRORS = 20  # Rejected rows printed per run (--errors keeps all of them)
+
+# Asynchronous provisioning queue
+PROVISION_WORKERS = 4  # Jobs that may run at once per queue process
+PROVISION_MAX_ATTEMPTS = 5  # Tries before a job is marked failed
+PROVISION_RETRY_DELAY = 2  # Seconds before the first retry (doubles each time)
+PROVISION_LEASE = 300  # Seconds a running job is owned before others may take it over
+PROVISION_POLL_INTERVAL = 1  # Seconds an idle worker waits before checking again
+
+# Account termination: FTP servers drop the account within RELOAD_INTERVAL, the queue reaps its folder later
+TERMINATE_ARCHIVE = False  # Keep terminated sites in ARCHIVE_DIR instead of deleting them
+ARCHIVE_DIR = ".archive"  # Terminated sites kept for restore, inside SITES_ROOT
+TRASH_DIR = ".trash"  # Terminated sites being deleted, inside SITES_ROOT
+REAP_BATCH = 1000  # Files and folders deleted between pauses
+REAP_PAUSE = 0.1  # Seconds to sleep between batches, so deletes don't starve FTP disk I/O
+
+# Disk usage tracking
+USAGE_FLUSH_INTERVAL = 2  # Seconds between writes of batched FTP usage changes
+USAGE_RECONCILE_INTERVAL = 60  # Seconds between background re-measure passes
+USAGE_RECONCILE_BATCH = 200  # Sites re-measured per pass, least recently measured first
+
+# FTP file history (upload/download/delete/rename), one file_events_YYYYMM table per month
+FILE_EVENTS_BATCH = 500  # Events written per executemany
+FILE_EVENTS_FLUSH_INTERVAL = 1  # Max seconds an event waits before it is written
+FILE_EVENTS_BUFFER = 50000  # Events held in memory before new ones are dropped
+FILE_EVENTS_RETENTION_MONTHS = 12  # Calendar months kept (0 = forever); older tables are dropped
+FILE_EVENT_COLUMNS = ("time", "account_id", "username", "event", "path", "target", "bytes", "ip")
+
+# Content manifest (path, size, mtime, SHA-256) of every site's public folder
+MANIFEST_DIR = "wwwroot"  # Folder inside each site covered by the manifest
+MANIFEST_UPDATE_INTERVAL = 1  # Seconds between manifest updates for files changed over FTP
+MANIFEST_HASH_WORKERS = 0  # Processes hashing files during a rescan; 0 = one per CPU core
+MANIFEST_RESCAN_BATCH = 64  # Sites compared before their changed files are hashed together
+MANIFEST_HASH_CHUNK = 1024 * 1024  # Bytes read at a time while hashing
+
+# Cross-site deduplication: identical wwwroot files become hardlinks to one blob
+DEDUP_DIR = ".dedup"  # Content-addressed blob store inside SITES_ROOT (same filesystem)
+DEDUP_MIN_SIZE = 4096  # Smaller files are left alone; they save a block at most
+DEDUP_MIN_AGE = 60  # Seconds since a file last changed before it may be linked
+DEDUP_ON_UPLOAD = False  # Link FTP uploads to existing blobs when the manifest indexes them
+
+# Static site hosting (reseller.py serve). Sites are served from MANIFEST_DIR, so
+# files changed over FTP reach the cache through manifest versions.
+HTTP_HOST = "0.0.0.0"
+HTTP_PORT = 8080
+HTTP_DOMAINS = {}  # Host name -> username, e.g. {"www.example.com": "alice"}; else the first label is the username
+HTTP_INDEX = "index.html"  # File served for a folder
+HTTP_CACHE_MB = 64  # Memory for small files kept in the LRU cache
+HTTP_CACHE_MAX_FILE = 256 * 1024  # Larger files are streamed from disk with sendfile()
+HTTP_CACHE_REVALIDATE = 30  # Seconds before a cached file is re-checked on disk (changes made outside FTP)
+HTTP_INVALIDATE_INTERVAL = 1  # Seconds between checks for sites changed over FTP
+HTTP_KEEPALIVE_TIMEOUT = 15  # Seconds an idle keep-alive connection is kept open
+
+# Precompressed copies of text assets uploaded over FTP (file.css -> file.css.gz / .br)
+COMPRESS_EXTENSIONS = (".html", ".htm", ".css", ".js", ".mjs", ".svg", ".json", ".xml", ".txt")
+COMPRESS_MIN_SIZE = 256  # Smaller files are left alone
+COMPRESS_MAX_SIZE = 16 * 1024 * 1024  # Larger files are left alone (compressed in memory)
+COMPRESS_MIN_SAVING = 0.1  # A variant must be at least this fraction smaller than its source
+COMPRESS_WORKERS = 2  # Threads compressing uploads per FTP process (0 = off)
+COMPRESS_QUEUE = 1000  # Files waiting for compression before new uploads are skipped
+COMPRESS_GZIP_LEVEL = 9
+COMPRESS_BROTLI_QUALITY = 11  # Only used when the brotli module is installed
+
+# Folders created inside every site
+SITE_DIRS = ("wwwroot", "data", "uploads", "logs")
+
+# Where new site folders go. "flat" puts them directly in SITES_ROOT;
+# "sharded" spreads them over hash-prefix buckets so no directory grows to
+# hundreds of thousands of entries. reseller_accounts.site_path is always
+# authoritative; `reseller.py relayout` moves existing sites.
+SITES_LAYOUT = "flat"  # "flat" (SITES_ROOT/<site>) or "sharded" (SITES_ROOT/.shards/<ab>/<cd>/<site>)
+SITES_SHARD_DIR = ".shards"  # Buckets live here; dot-prefixed so it can never be a site name
+SITES_SHARD_LEVELS = 2  # Bucket levels
+SITES_SHARD_WIDTH = 2  # Hex digits per bucket name (2 levels x 2 = 65536 buckets)
+SITES_LAYOUTS = ("flat", "sharded")
+RELAYOUT_BATCH = 200  # Sites moved per batch by `relayout`
+RELAYOUT_PAUSE = 0.5  # Seconds between batches, to leave disk time for FTP sessions
+
+# Pre-rendered per-package site skeletons, cloned into new sites. Kept under
+# SITES_ROOT so hardlinks/reflinks stay on the same filesystem.
+SKELETONS_DIR = ".skeletons"
+
+# Stylesheet shared by every default site (served from the site skeleton)
+DEFAULT_STYLESHEET = """body {
+    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+    margin: 0;
+    padding: 0;
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: #333;
+    min-height: 100vh;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+}
+.container {
+    background: white;
+    padding: 40px;
+    border-radius: 10px;
+    box-shadow: 0 10px 30px rgba(0,0,0,0.3);
+    max-width: 600px;
+    text-align: center;
+}
+h1 {
+    color: #667eea;
+    margin-bottom: 20px;
+}
+.features {
+    margin: 30px 0;
+    text-align: left;
+}
+.feature {
+    background: #f7f7f7;
+    padding: 10px;
+    margin: 10px 0;
+    border-radius: 5px;
+    border-left: 4px solid #667eea;
+}
+.footer {
+    margin-top: 30px;
+    color: #666;
+    font-size: 0.9em;
+}
+"""
 
 # Package types
+# quota_mb is the storage limit for the site folder (None = unlimited);
+# reseller_accounts.quota_bytes overrides it per account. read_limit_kb and
+# write_limit_kb cap FTP upload/download speed in KB/s (0 = unlimited);
+# reseller_accounts.read_limit/write_limit (bytes/s) override them.
 PACKAGES = {
-    "1": {"name": "Forum", "features": ["forum"]},
-    "2": {"name": "Blog", "features": ["blog"]},
-    "3": {"name": "Website", "features": ["website"]},
-    "4": {"name": "Full Suite", "features": ["forum", "blog", "website", "downloads"]}
+    "1": {"name": "Forum", "features": ["forum"], "quota_mb": 1024,
+          "read_limit_kb": 0, "write_limit_kb": 0},
+    "2": {"name": "Blog", "features": ["blog"], "quota_mb": 1024,
+          "read_limit_kb": 0, "write_limit_kb": 0},
+    "3": {"name": "Website", "features": ["website"], "quota_mb": 2048,
+          "read_limit_kb": 0, "write_limit_kb": 0},
+    "4": {"name": "Full Suite", "features": ["forum", "blog", "website", "downloads"], "quota_mb": 10240,
+          "read_limit_kb": 0, "write_limit_kb": 0}
 }
 
 
+# Schema migrations, applied in order. The number of applied migrations is
+# stored in PRAGMA user_version; never edit a released entry, append a new one.
+SCHEMA_MIGRATIONS = [
+    # v1: accounts and their package features
+    [
+        """
+        CREATE TABLE IF NOT EXISTS reseller_accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            email TEXT NOT NULL,
+            site_name TEXT UNIQUE NOT NULL,
+            package_type TEXT NOT NULL,
+            site_path TEXT NOT NULL,
+            ftp_enabled INTEGER DEFAULT 1,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            status TEXT DEFAULT 'active'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS site_features (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER NOT NULL,
+            feature_name TEXT NOT NULL,
+            enabled INTEGER DEFAULT 1,
+            FOREIGN KEY (account_id) REFERENCES reseller_accounts(id)
+        )
+        """
+    ],
+    # v2: change log filled by triggers so running FTP servers can pick up
+    # account edits from any writer (this script, the CMS, sqlite3 CLI)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS account_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER,
+            username TEXT,
+            changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS reseller_accounts_insert_log
+        AFTER INSERT ON reseller_accounts
+        BEGIN
+            INSERT INTO account_changes (account_id, username) VALUES (NEW.id, NEW.username);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS reseller_accounts_update_log
+        AFTER UPDATE ON reseller_accounts
+        BEGIN
+            INSERT INTO account_changes (account_id, username) VALUES (OLD.id, OLD.username);
+            INSERT INTO account_changes (account_id, username)
+            SELECT NEW.id, NEW.username WHERE NEW.username != OLD.username;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS reseller_accounts_delete_log
+        AFTER DELETE ON reseller_accounts
+        BEGIN
+            INSERT INTO account_changes (account_id, username) VALUES (OLD.id, OLD.username);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS site_features_insert_log
+        AFTER INSERT ON site_features
+        BEGIN
+            INSERT INTO account_changes (account_id, username)
+            SELECT id, username FROM reseller_accounts WHERE id = NEW.account_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS site_features_update_log
+        AFTER UPDATE ON site_features
+        BEGIN
+            INSERT INTO account_changes (account_id, username)
+            SELECT id, username FROM reseller_accounts WHERE id = NEW.account_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS site_features_delete_log
+        AFTER DELETE ON site_features
+        BEGIN
+            INSERT INTO account_changes (account_id, username)
+            SELECT id, username FROM reseller_accounts WHERE id = OLD.account_id;
+        END
+        """
+    ],
+    # v3: indexes for FTP lookups, listings and change log pruning
+    [
+        "CREATE INDEX IF NOT EXISTS idx_reseller_accounts_status_ftp ON reseller_accounts(status, ftp_enabled)",
+        "CREATE INDEX IF NOT EXISTS idx_reseller_accounts_created_at ON reseller_accounts(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_site_features_account ON site_features(account_id)",
+        "CREATE INDEX IF NOT EXISTS idx_account_changes_changed_at ON account_changes(changed_at)"
+    ],
+    # v4: keyset pagination of listings filtered by status
+    [
+        "CREATE INDEX IF NOT EXISTS idx_reseller_accounts_status_created_at ON reseller_accounts(status, created_at)"
+    ],
+    # v5: durable provisioning job queue
+    [
+        """
+        CREATE TABLE IF NOT EXISTS provisioning_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            account_id INTEGER,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            last_error TEXT,
+            run_after REAL NOT NULL DEFAULT 0,
+            locked_until REAL NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (account_id) REFERENCES reseller_accounts(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_provisioning_jobs_status_run_after ON provisioning_jobs(status, run_after)",
+        "CREATE INDEX IF NOT EXISTS idx_reseller_accounts_site_path ON reseller_accounts(site_path)"
+    ],
+    # v6: per-account disk usage index and quota overrides
+    [
+        """
+        CREATE TABLE IF NOT EXISTS account_usage (
+            account_id INTEGER PRIMARY KEY,
+            bytes_used INTEGER NOT NULL DEFAULT 0,
+            file_count INTEGER NOT NULL DEFAULT 0,
+            reconciled_at TEXT,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (account_id) REFERENCES reseller_accounts(id)
+        )
+        """,
+        "ALTER TABLE reseller_accounts ADD COLUMN quota_bytes INTEGER"
+    ],
+    # v7: per-account FTP bandwidth overrides (bytes/second)
+    [
+        "ALTER TABLE reseller_accounts ADD COLUMN read_limit INTEGER",
+        "ALTER TABLE reseller_accounts ADD COLUMN write_limit INTEGER"
+    ],
+    # v8: content manifest of each site's wwwroot; removed files stay as
+    # tombstones so "changed since version N" also reports deletions
+    [
+        """
+        CREATE TABLE IF NOT EXISTS site_manifest (
+            account_id INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER,
+            mtime_ns INTEGER,
+            hash TEXT,
+            version INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (account_id, path),
+            FOREIGN KEY (account_id) REFERENCES reseller_accounts(id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_site_manifest_version ON site_manifest(account_id, version)",
+        """
+        CREATE TABLE IF NOT EXISTS manifest_versions (
+            account_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            scanned_at TEXT,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (account_id) REFERENCES reseller_accounts(id)
+        )
+        """
+    ],
+    # v9: resume points of account imports, one row per input file
+    [
+        """
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            format TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            committed_offset INTEGER NOT NULL DEFAULT 0,
+            chunk_end INTEGER,
+            rows INTEGER NOT NULL DEFAULT 0,
+            created INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'running',
+            started_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    ]
+]
+SCHEMA_VERSION = len(SCHEMA_MIGRATIONS)
+
+
+def register_exit_hook(obj, fn):
+    """Run fn once when this process exits, whether it is the main process or a multiprocessing child"""
+    done = []
+    
+    def hook():
+        # Processes that use multiprocessing run both atexit and finalizers
+        if not done:
+            done.append(True)
+            fn()
+    
+    atexit.register(hook)
+    # multiprocessing children leave through os._exit and skip atexit
+    multiprocessing_util.Finalize(obj, hook, exitpriority=10)
+
+
+def clone_file(src, dst, reflink=True):
+    """Clone src to dst as cheaply as the filesystem allows
+    
+    Tries a reflink (copy-on-write clone, Linux FICLONE), then a hardlink,
+    then a plain copy. Returns the method used.
+    """
+    if reflink and fcntl is not None:
+        try:
+            with open(src, "rb") as fsrc, open(dst, "xb") as fdst:
+                try:
+                    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                    return "reflink"
+                except OSError:
+                    pass
+            os.unlink(dst)
+        except OSError:
+            if os.path.exists(dst):
+                raise
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        shutil.copyfile(src, dst)
+        return "copy"
+
+
+def unshare_file(path, keep_data=True):
+    """Give a hardlinked file its own inode before it is modified
+    
+    Site files cloned from a skeleton (or deduplicated) may share one inode
+    with other sites; writing through the link would change every copy.
+    With keep_data the current bytes are copied first (for appends, REST
+    and chmod); otherwise the link is simply removed (full overwrite).
+    Returns True if the file was unshared.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_nlink < 2 or not os.path.isfile(path):
+        return False
+    if not keep_data:
+        os.unlink(path)
+        return True
+    tmp_path = f"{path}.unshare-{os.getpid()}-{threading.get_ident()}"
+    shutil.copy2(path, tmp_path)
+    os.replace(tmp_path, path)
+    return True
+
+
+def measure_site(path):
+    """Return (bytes, files) for the regular files under path
+    
+    Symlinks are not followed or counted, matching what the FTP handler
+    adds and removes as files are uploaded and deleted.
+    """
+    total = 0
+    files = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                        files += 1
+                except OSError:
+                    # Removed while we were walking
+                    continue
+    return total, files
+
+
+def scan_files(root, rel=""):
+    """Map each regular file under root/rel to (size, mtime_ns)
+    
+    Keys are '/'-separated paths relative to root. rel may name a single
+    file. Symlinks are skipped, as in measure_site.
+    """
+    start = os.path.join(root, rel) if rel else root
+    found = {}
+    try:
+        st = os.lstat(start)
+    except OSError:
+        return found
+    if stat.S_ISREG(st.st_mode):
+        found[rel] = (st.st_size, st.st_mtime_ns)
+        return found
+    if not stat.S_ISDIR(st.st_mode):
+        return found
+    stack = [(start, f"{rel}/" if rel else "")]
+    while stack:
+        path, prefix = stack.pop()
+        try:
+            entries = os.scandir(path)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, f"{prefix}{entry.name}/"))
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        found[prefix + entry.name] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue
+    return found
+
+
+def asset_encodings():
+    """(Content-Encoding, file suffix) of the precompressed variants written here, preferred first"""
+    if brotli is not None:
+        return (("br", ".br"), ("gzip", ".gz"))
+    return (("gzip", ".gz"),)
+
+
+def is_compressible(path):
+    """True for text assets that get precompressed variants"""
+    return os.path.splitext(path)[1].lower() in COMPRESS_EXTENSIONS
+
+
+def remove_compressed(path):
+    """Delete the precompressed variants of path; returns how many were removed"""
+    removed = 0
+    if is_compressible(path):
+        for suffix in (".br", ".gz"):
+            try:
+                os.unlink(path + suffix)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def compress_asset(path, min_saving=COMPRESS_MIN_SAVING):
+    """Write precompressed siblings of path (path.gz, path.br); returns the encodings written
+    
+    A variant that would not be at least min_saving smaller than the file
+    is not written, and an older one is removed. Variants get the source's
+    mtime, so one older than its source is known to be stale.
+    """
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode) or not COMPRESS_MIN_SIZE <= st.st_size <= COMPRESS_MAX_SIZE:
+        remove_compressed(path)
+        return []
+    with open(path, "rb") as f:
+        data = f.read()
+    current = os.stat(path)
+    if (current.st_size, current.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+        # Rewritten while we read it; its own upload queues it again
+        return []
+    written = []
+    for encoding, suffix in asset_encodings():
+        variant = path + suffix
+        if encoding == "br":
+            body = brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            body = gzip.compress(data, COMPRESS_GZIP_LEVEL, mtime=0)
+        if len(body) > len(data) * (1 - min_saving):
+            if os.path.lexists(variant):
+                os.unlink(variant)
+            continue
+        # Written aside and renamed, so readers never see half a variant
+        tmp_path = f"{variant}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp_path, "wb") as out:
+                out.write(body)
+            os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.replace(tmp_path, variant)
+        except OSError:
+            if os.path.lexists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        written.append(encoding)
+    return written
+
+
+def hash_file(path):
+    """SHA-256 hex digest of a file, or None if it can't be read"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(MANIFEST_HASH_CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def package_quota(package_type, quota_bytes=None):
+    """Storage limit in bytes for an account, or None for unlimited"""
+    if quota_bytes is not None:
+        return quota_bytes
+    quota_mb = PACKAGES.get(package_type, {}).get("quota_mb")
+    return quota_mb * 1024 * 1024 if quota_mb is not None else None
+
+
+def package_bandwidth(package_type, read_limit=None, write_limit=None):
+    """(read, write) FTP limits in bytes/second for an account, 0 = unlimited"""
+    package = PACKAGES.get(package_type, {})
+    if read_limit is None:
+        read_limit = package.get("read_limit_kb", 0) * 1024
+    if write_limit is None:
+        write_limit = package.get("write_limit_kb", 0) * 1024
+    return read_limit, write_limit
+
+
+def format_rate(limit):
+    """Human-readable bytes/second limit"""
+    return f"{limit / 1024:g} KB/s" if limit else "unlimited"
+
+
+def read_import_file(path, fmt, start=0):
+    """Yield (record, end_offset) from a CSV or JSON Lines file, starting at byte offset start
+    
+    Records are dicts; CSV columns are named by the header row, which is
+    read first even when resuming. A row that cannot be parsed is yielded
+    as its error message. end_offset is where the next row starts, so it
+    can be stored as the resume point. Only one row is held at a time.
+    """
+    with open(path, "rb") as f:
+        if fmt == "jsonl":
+            f.seek(start)
+            offset = start
+            for line in f:
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield f"Invalid JSON: {e}", offset
+                    continue
+                yield record if isinstance(record, dict) else "Expected a JSON object", offset
+            return
+        
+        # csv.reader pulls one line at a time, so after each row the
+        # position counter is exactly at the end of that row
+        position = [0]
+        
+        def lines():
+            for line in f:
+                position[0] += len(line)
+                yield line.decode("utf-8")
+        
+        reader = csv.reader(lines())
+        header = [name.strip().lstrip("\ufeff") for name in next(reader, [])]
+        if start > position[0]:
+            f.seek(start)
+            position[0] = start
+            reader = csv.reader(lines())
+        for row in reader:
+            if not any(field.strip() for field in row):
+                continue
+            if len(row) != len(header):
+                yield f"Expected {len(header)} columns, got {len(row)}", position[0]
+            else:
+                yield dict(zip(header, row)), position[0]
+
+
+def hash_password(password):
+    """Salted scrypt hash of password (PBKDF2-SHA256 without scrypt support)"""
+    salt = os.urandom(16)
+    if hasattr(hashlib, "scrypt"):
+        n, r, p = PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+        return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+    iterations = PASSWORD_PBKDF2_ITERATIONS
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+
+def verify_password(password, stored):
+    """Check password against a stored hash; returns (matches, needs_rehash)
+    
+    Unsalted SHA-256 digests from older versions still verify, but always
+    need a rehash, as do hashes made with outdated parameters.
+    """
+    scheme, _, params = stored.partition("$")
+    try:
+        if scheme == "scrypt":
+            n, r, p, salt, expected = params.split("$")
+            n, r, p = int(n), int(r), int(p)
+            expected = bytes.fromhex(expected)
+            digest = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=n, r=r, p=p,
+                                    maxmem=256 * n * r, dklen=len(expected))
+            current = (n, r, p) == (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+        elif scheme == "pbkdf2_sha256":
+            iterations, salt, expected = params.split("$")
+            expected = bytes.fromhex(expected)
+            digest = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), int(iterations))
+            current = not hasattr(hashlib, "scrypt") and int(iterations) == PASSWORD_PBKDF2_ITERATIONS
+        elif len(stored) == 64:
+            expected = bytes.fromhex(stored)
+            digest = hashlib.sha256(password.encode()).digest()
+            current = False
+        else:
+            return False, False
+    except (ValueError, AttributeError):
+        # Malformed hash, or scrypt missing from this Python build
+        return False, False
+    matches = hmac.compare_digest(digest, expected)
+    return matches, matches and not current
+
+
+class SiteSkeletonCache:
+    """Pre-rendered default files, cloned into every new site
+    
+    There is one skeleton, shared by all packages, and it holds only the
+    default stylesheet; index.html and README.md name the site and its
+    features, so create_default_files writes them per site. New sites get
+    the stylesheet via clone_file, so on reflink or hardlink capable
+    storage it costs no extra data blocks. The skeleton folder is named by
+    a digest of its contents, so a template change builds a fresh one.
+    """
+    
+    def __init__(self, root):
+        self.root = Path(root)
+        self.clone_counts = {"reflink": 0, "hardlink": 0, "copy": 0}
+        self._path = None
+        self._lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        # Stop probing for reflinks once the filesystem has refused one
+        self._try_reflink = True
+    
+    def render(self):
+        """Return {relative path: bytes} of the shared static files"""
+        return {
+            "wwwroot/style.css": DEFAULT_STYLESHEET.encode()
+        }
+    
+    def get(self):
+        """Return the skeleton folder, building it if needed"""
+        if self._path is not None:
+            return self._path
+        
+        with self._lock:
+            if self._path is not None:
+                return self._path
+            files = self.render()
+            digest = hashlib.sha256()
+            for name in sorted(files):
+                digest.update(name.encode() + b"\0" + files[name] + b"\0")
+            path = self.root / digest.hexdigest()[:16]
+            if not path.exists():
+                # Build in a private folder and rename, so concurrent
+                # processes never clone a half-written skeleton
+                tmp_path = self.root / f".tmp-{os.getpid()}-{threading.get_ident()}"
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                for name, data in files.items():
+                    file_path = tmp_path / name
+                    file_path.parent.mkdir(parents=True, exist_ok=True)
+                    file_path.write_bytes(data)
+                try:
+                    os.rename(tmp_path, path)
+                except OSError:
+                    # Another process built it first
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+            self._path = path
+            return path
+    
+    def clone(self, site_path):
+        """Clone the skeleton files into site_path"""
+        skeleton = self.get()
+        for dirpath, dirnames, filenames in os.walk(skeleton):
+            rel = os.path.relpath(dirpath, skeleton)
+            target_dir = Path(site_path) / rel
+            target_dir.mkdir(parents=True, exist_ok=True)
+            for filename in filenames:
+                if (target_dir / filename).exists():
+                    # Already provisioned (e.g. a retried provisioning job)
+                    continue
+                method = clone_file(
+                    os.path.join(dirpath, filename), target_dir / filename, self._try_reflink
+                )
+                if method != "reflink":
+                    self._try_reflink = False
+                with self._counts_lock:
+                    self.clone_counts[method] += 1
+
+
+class DedupStore:
+    """Content-addressed blob store that lets sites share identical files
+    
+    A blob is named by the SHA-256 of its contents and is simply one more
+    hardlink to the inode of the first file seen with that content; other
+    files with the same bytes are replaced by links to it. Anything that
+    modifies a site file goes through unshare_file first, so a tenant who
+    changes a shared file gets a private copy and every other site keeps
+    the original.
+    """
+    
+    def __init__(self, root):
+        self.root = Path(root)
+    
+    def blob_path(self, digest):
+        return self.root / digest[:2] / digest
+    
+    def link(self, path, digest, create=True):
+        """Replace path with a link to the blob for digest
+        
+        Returns (action, bytes_freed): action is "blob" when path became
+        the blob, "linked" when it now shares the blob's inode, or None
+        when it was left alone (already shared, contents differ, changed
+        meanwhile, or no blob and create is False). Contents are compared
+        byte for byte before linking.
+        """
+        blob = self.blob_path(digest)
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return None, 0
+        if not stat.S_ISREG(st.st_mode):
+            return None, 0
+        try:
+            blob_st = os.stat(blob)
+        except FileNotFoundError:
+            if not create:
+                return None, 0
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, blob)
+                return "blob", 0
+            except FileExistsError:
+                blob_st = os.stat(blob)
+        if (blob_st.st_dev, blob_st.st_ino) == (st.st_dev, st.st_ino):
+            return None, 0
+        if blob_st.st_size != st.st_size or not filecmp.cmp(blob, path, shallow=False):
+            return None, 0
+        # Other links to the old inode (e.g. skeleton files) keep it alive
+        freed = st.st_size if st.st_nlink == 1 else 0
+        
+        tmp_path = f"{path}.dedup-{os.getpid()}-{threading.get_ident()}"
+        os.link(blob, tmp_path)
+        try:
+            # Never swap out a file that was written while we compared it
+            current = os.lstat(path)
+            if (current.st_ino, current.st_size, current.st_mtime_ns) != (st.st_ino, st.st_size, st.st_mtime_ns):
+                os.unlink(tmp_path)
+                return None, 0
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.lexists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return "linked", freed
+    
+    def _blobs(self):
+        try:
+            shards = os.scandir(self.root)
+        except FileNotFoundError:
+            return
+        with shards:
+            for shard in shards:
+                if not shard.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(shard.path) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            yield entry.path, entry.stat(follow_symlinks=False)
+    
+    def collect_garbage(self):
+        """Remove blobs no site links to any more; returns (blobs, bytes) removed"""
+        removed = 0
+        freed = 0
+        for path, st in self._blobs():
+            if st.st_nlink == 1:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                removed += 1
+                freed += st.st_size
+        return removed, freed
+    
+    def stats(self):
+        """Blob count, bytes stored and bytes saved by sharing"""
+        blobs = 0
+        stored = 0
+        saved = 0
+        for _, st in self._blobs():
+            blobs += 1
+            stored += st.st_size
+            # One link is the blob itself; without sharing every other link
+            # would be its own copy
+            saved += st.st_size * max(0, st.st_nlink - 2)
+        return {"blobs": blobs, "bytes_stored": stored, "bytes_saved": saved}
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    """Base class for in-process metrics; values are keyed by a tuple of label values"""
+    
+    kind = None
+    
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+    
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self.values.items()]
+    
+    def merge(self, values):
+        """Add a snapshot taken in another process to this metric"""
+        with self._lock:
+            for key, value in values:
+                self._merge_value(self.values, tuple(key), value)
+    
+    def _merge_value(self, values, key, value):
+        values[key] = values.get(key, 0) + value
+    
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+    
+    def _format_labels(self, key, extra=""):
+        pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+    
+    def render(self, values):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+    
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Gauge updated by deltas, so values from several processes can be summed"""
+    
+    kind = "gauge"
+    
+    def add(self, delta, labels=()):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + delta
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self.values.get(labels)
+            if state is None:
+                # Per-bucket counts (not cumulative), +Inf bucket, then sum
+                state = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+    
+    def _merge_value(self, values, key, value):
+        state = values.get(key)
+        if state is None:
+            values[key] = list(value)
+        else:
+            for i, amount in enumerate(value):
+                state[i] += amount
+    
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(state)] for key, state in self.values.items()]
+    
+    def render(self, values):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), state):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {state[-1]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-local metrics that add up across forked FTP worker processes
+    
+    Updating a metric is a lock and a dict update, cheap enough for every
+    login and transfer. Forked children start from zero; once snapshots are
+    enabled they write their values to snapshot_dir, and render() in the
+    parent adds them to its own. Snapshots of exited children are folded
+    into the parent's values so their counts are not lost.
+    """
+    
+    def __init__(self):
+        self.metrics = []
+        self.snapshot_dir = None
+        self._owner_pid = os.getpid()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+    
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge(name, help_text, labels))
+    
+    def histogram(self, name, help_text, labels=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+    
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+    
+    def _after_fork(self):
+        for metric in self.metrics:
+            # Another thread may have held the lock when we forked
+            metric._lock = threading.Lock()
+            metric.values.clear()
+        if self.snapshot_dir is not None:
+            register_exit_hook(self, self.write_snapshot)
+    
+    def enable_snapshots(self, path):
+        """Collect metrics from processes forked after this call"""
+        os.makedirs(path, exist_ok=True)
+        self.snapshot_dir = path
+        self._owner_pid = os.getpid()
+        atexit.register(self._remove_snapshots)
+    
+    def _remove_snapshots(self):
+        if self.snapshot_dir is not None and os.getpid() == self._owner_pid:
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+            self.snapshot_dir = None
+    
+    def write_snapshot(self):
+        """Write this child's values for the parent to collect"""
+        if self.snapshot_dir is None or os.getpid() == self._owner_pid:
+            return
+        path = os.path.join(self.snapshot_dir, f"{os.getpid()}.json")
+        data = {metric.name: metric.snapshot() for metric in self.metrics}
+        try:
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+    
+    def _child_snapshots(self):
+        """Yield (snapshot, alive) for every child snapshot file"""
+        if self.snapshot_dir is None:
+            return
+        for name in os.listdir(self.snapshot_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.snapshot_dir, name)
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            try:
+                os.kill(int(name[:-5]), 0)
+                alive = True
+            except ProcessLookupError:
+                alive = False
+            except (PermissionError, ValueError):
+                alive = True
+            if not alive:
+                os.unlink(path)
+            yield data, alive
+    
+    def render(self):
+        """Prometheus text exposition of every metric, summed over processes"""
+        live = []
+        for data, alive in self._child_snapshots():
+            if alive:
+                live.append(data)
+            else:
+                for metric in self.metrics:
+                    metric.merge(data.get(metric.name, []))
+        
+        lines = []
+        for metric in self.metrics:
+            values = {}
+            for snapshot in [metric.snapshot()] + [data.get(metric.name, []) for data in live]:
+                for key, value in snapshot:
+                    metric._merge_value(values, tuple(key), value)
+            lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+
+class ResellerMetrics(MetricsRegistry):
+    """Metrics for the FTP server and account provisioning"""
+    
+    def __init__(self):
+        super().__init__()
+        self.ftp_connections = self.gauge(
+            "reseller_ftp_connections_active", "Open FTP control connections")
+        self.ftp_logins = self.counter(
+            "reseller_ftp_logins_total", "FTP login attempts", ("result",))
+        self.ftp_auth_seconds = self.histogram(
+            "reseller_ftp_auth_seconds", "Time to check FTP credentials")
+        self.ftp_bytes = self.counter(
+            "reseller_ftp_bytes_total", "FTP data bytes transferred per account", ("user", "direction"))
+        self.ftp_transfer_seconds = self.histogram(
+            "reseller_ftp_transfer_seconds", "FTP file transfer durations", ("direction",),
+            buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300, 1800))
+        self.ftp_log_dropped = self.counter(
+            "reseller_ftp_log_events_dropped_total", "FTP log events dropped because the log queue was full")
+        self.create_account_seconds = self.histogram(
+            "reseller_create_account_seconds", "create_account latency by phase", ("phase",))
+        self.sqlite_lock_wait_seconds = self.histogram(
+            "reseller_sqlite_lock_wait_seconds", "Time waiting for the SQLite write lock (BEGIN IMMEDIATE)")
+        self.http_requests = self.counter(
+            "reseller_http_requests_total", "Static site HTTP responses", ("status",))
+        self.http_cache = self.counter(
+            "reseller_http_cache_total", "Static file cache lookups", ("result",))
+
+
+METRICS = ResellerMetrics()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "started")
+    
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _Laps:
+    """Consecutive phases of one operation; lap(phase) records the time since the previous lap"""
+    
+    __slots__ = ("profiler", "name", "last")
+    
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.last = time.perf_counter()
+    
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.profiler.record(f"{self.name}.{phase}", now - self.last)
+        self.last = now
+
+
+class _NoSpan:
+    """Stands in for spans and laps while profiling is off"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def lap(self, phase):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Profiler:
+    """Opt-in timing spans and cProfile capture (--profile, RESELLER_PROFILE=1)
+    
+    While profiling is off a span is one attribute check and a shared no-op
+    object. When on, every span name keeps a count, total, max and a
+    reservoir of durations for percentiles. The summary is printed to
+    stderr (or written as JSON) when the process exits; pre-forked workers
+    write their own, with the pid appended to the file name.
+    """
+    
+    def __init__(self, samples=PROFILE_SAMPLES):
+        self.enabled = False
+        self.samples = samples
+        self.output = None
+        self.cprofile_path = None
+        self.window = 0
+        self._cprofile = None
+        self._pid = None
+        self._stats = {}
+        self._lock = threading.Lock()
+    
+    def enable(self, output=None, cprofile_path=None, window=0):
+        """Start recording spans, and cProfile the calling thread if cprofile_path is set"""
+        self.enabled = True
+        self.output = output
+        self.cprofile_path = cprofile_path
+        self.window = window
+        self._pid = os.getpid()
+        if cprofile_path:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        atexit.register(self.report)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _after_fork(self):
+        # A worker reports only what it did itself
+        self._lock = threading.Lock()
+        self._stats = {}
+    
+    def span(self, name):
+        """Context manager timing its block as span `name`"""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+    
+    def laps(self, name):
+        """Phase timer for an operation; each lap(phase) is recorded as span `name.phase`"""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Laps(self, name)
+    
+    def record(self, name, seconds):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                # count, total, max, sampled durations
+                stats = self._stats[name] = [0, 0.0, 0.0, []]
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+            samples = stats[3]
+            if len(samples) < self.samples:
+                samples.append(seconds)
+            else:
+                # Reservoir sampling keeps a uniform sample of every call
+                slot = random.randrange(stats[0])
+                if slot < self.samples:
+                    samples[slot] = seconds
+    
+    def summary(self):
+        """Per-span count, total and latency percentiles in milliseconds"""
+        with self._lock:
+            spans = [(name, stats[0], stats[1], stats[2], sorted(stats[3])) for name, stats in self._stats.items()]
+        result = {}
+        for name, count, total, longest, samples in sorted(spans):
+            def pct(p):
+                return round(samples[min(len(samples) - 1, int(p / 100 * (len(samples) - 1) + 0.5))] * 1000, 3)
+            result[name] = {
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total / count * 1000, 3),
+                "p50_ms": pct(50),
+                "p95_ms": pct(95),
+                "p99_ms": pct(99),
+                "max_ms": round(longest * 1000, 3)
+            }
+        return result
+    
+    def _path(self, path):
+        # Forked workers write next to the main process's file
+        return path if os.getpid() == self._pid else f"{path}.{os.getpid()}"
+    
+    def stop_cprofile(self):
+        """Stop cProfile and write its stats; call on the thread that enabled it"""
+        profile, self._cprofile = self._cprofile, None
+        if profile is None:
+            return
+        profile.disable()
+        path = self._path(self.cprofile_path)
+        profile.dump_stats(path)
+        print(f"✓ cProfile stats written to {path} (view with: python3 -m pstats {path})", file=sys.stderr)
+    
+    def report(self):
+        """Write the cProfile stats and the span summary (runs at exit)"""
+        self.stop_cprofile()
+        summary = self.summary()
+        if not summary:
+            return
+        if self.output:
+            path = self._path(self.output)
+            with open(path, "w") as f:
+                json.dump({"pid": os.getpid(), "argv": sys.argv[1:], "spans": summary}, f, indent=2)
+            print(f"✓ Profile summary written to {path}", file=sys.stderr)
+            return
+        print(f"\nPROFILE (pid {os.getpid()})", file=sys.stderr)
+        print(f"{'SPAN':<36} {'COUNT':>8} {'TOTAL ms':>11} {'MEAN':>9} {'P50':>9} {'P95':>9} {'MAX':>9}",
+              file=sys.stderr)
+        for name, row in summary.items():
+            print(f"{name:<36} {row['count']:>8} {row['total_ms']:>11.1f} {row['mean_ms']:>9.3f} "
+                  f"{row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['max_ms']:>9.3f}", file=sys.stderr)
+
+
+PROFILER = Profiler()
+
+
+def profiled(name):
+    """Decorator timing every call as span `name` while profiling is on"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return fn(*args, **kwargs)
+            with _Span(PROFILER, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _metrics_request_handler(registry):
+    """BaseHTTPRequestHandler class serving `registry` (http.server loads only when metrics are on)"""
+    from http.server import BaseHTTPRequestHandler
+    
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            # Scrapes are not worth a log line
+            pass
+    
+    return MetricsRequestHandler
+
+
+class MetricsServer:
+    """Serves a MetricsRegistry in Prometheus text format from a background thread"""
+    
+    def __init__(self, registry=None, host=None, port=None):
+        self.registry = registry or METRICS
+        self.host = host or METRICS_HOST
+        self.port = port or METRICS_PORT
+        self.httpd = None
+        self.thread = None
+        self._pid = None
+    
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/metrics"
+    
+    def start(self):
+        from http.server import ThreadingHTTPServer
+        self._pid = os.getpid()
+        self.httpd = ThreadingHTTPServer((self.host, self.port), _metrics_request_handler(self.registry))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        # The serving thread only exists in the process that started it
+        if self.httpd is not None and self._pid == os.getpid():
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+def open_connection(db_path):
+    """Open a tuned SQLite connection to the reseller database
+    
+    Connections run in autocommit mode; writes go through explicit
+    BEGIN IMMEDIATE transactions (see ResellerManager.transaction) so
+    readers are never blocked by writers under WAL journaling.
+    """
+    conn = sqlite3.connect(
+        db_path,
+        timeout=SQLITE_BUSY_TIMEOUT / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=SQLITE_STATEMENT_CACHE
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    return conn
+
+
 class ResellerManager:
     """Manages reseller accounts and site provisioning"""
     
-    def __init__(self):
-        self.db_path = RESELLER_DB
-        self.sites_root = Path(SITES_ROOT)
-        self.sites_root.mkdir(exist_ok=True)
-        self.init_database()
+    def __init__(self, db_path=None, sites_root=None):
+        self.db_path = db_path or RESELLER_DB
+        self.sites_root = Path(sites_root or SITES_ROOT)
+        self._local = threading.local()
+        # Thread -> connection, so close() can reach every thread's connection
+        self._connections = weakref.WeakKeyDictionary()
+        self._connections_lock = threading.Lock()
+        # The schema is checked on the first connection rather than here, and
+        # site folders are created with their parents, so constructing a
+        # manager touches neither the database nor the disk
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self.skeletons = SiteSkeletonCache(self.sites_root / SKELETONS_DIR)
+        self.dedup = DedupStore(self.sites_root / DEDUP_DIR)
+    
+    def connect(self):
+        """Return this thread's connection, opening it on first use
+        
+        Each thread (and each forked process) keeps one long-lived
+        connection, so prepared statements and the page cache are reused
+        across calls.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = open_connection(self.db_path)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            with self._connections_lock:
+                self._connections[threading.current_thread()] = conn
+            if not self._schema_ready:
+                self._migrate(conn)
+        return conn
+    
+    @contextmanager
+    def transaction(self):
+        """Run a block inside a write transaction, rolling back on error"""
+        conn = self.connect()
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        METRICS.sqlite_lock_wait_seconds.observe(time.perf_counter() - started)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+    
+    def close(self):
+        """Close every connection opened by this manager"""
+        with self._connections_lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+    
+    def init_database(self):
+        """Initialize the reseller database, applying any pending migrations
+        
+        This happens on the manager's first connection anyway; calling it
+        only moves the check to a known point (e.g. before forking).
+        """
+        self._migrate(self.connect())
+    
+    @profiled("init_database")
+    def _migrate(self, conn):
+        """Bring the schema up to SCHEMA_VERSION, once per manager
+        
+        The schema version lives in PRAGMA user_version, so when the
+        database is already current this is a single pragma read and no DDL
+        runs at all.
+        """
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                self._schema_ready = True
+                return
+            
+            # conn is this thread's connection, so transaction() reuses it
+            with self.transaction() as conn:
+                # Re-read under the write lock in case another process migrated first
+                current = conn.execute("PRAGMA user_version").fetchone()[0]
+                for statements in SCHEMA_MIGRATIONS[current:]:
+                    for statement in statements:
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._schema_ready = True
+        
+        if current < SCHEMA_VERSION:
+            print(f"✓ Reseller database initialized (schema v{current} -> v{SCHEMA_VERSION})")
+    
+    def hash_password(self, password):
+        """Hash password with a salted KDF (see hash_password)"""
+        return hash_password(password)
+    
+    def update_password_hash(self, account_id, old_hash, new_hash):
+        """Replace a stored hash unless it changed meanwhile; returns True if replaced"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE reseller_accounts SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                (new_hash, account_id, old_hash)
+            )
+        return cursor.rowcount == 1
+    
+    def create_account(self, username, password, email, site_name, package_type):
+        """Create a new reseller account"""
+        laps = PROFILER.laps("create_account")
+        # Sanitize site name for folder creation
+        safe_site_name = self.safe_site_name(site_name)
+        site_path = self.site_path_for(safe_site_name)
+        
+        # Check if site already exists in either layout (or is reserved by a queued account)
+        if self.site_path_taken(safe_site_name):
+            print(f"✗ Error: Site folder '{safe_site_name}' already exists")
+            return None
+        laps.lap("check")
+        
+        # Create site directory structure
+        started = time.perf_counter()
+        self.create_site_dirs(site_path)
+        laps.lap("mkdir")
+        
+        # Create default files, and measure them so quota checks start from the real size
+        package = PACKAGES.get(package_type, PACKAGES["4"])
+        self.create_default_files(site_path, site_name, package["features"])
+        usage = measure_site(site_path)
+        fs_seconds = time.perf_counter() - started
+        laps.lap("files")
+        
+        # Hash password
+        password_hash = self.hash_password(password)
+        laps.lap("hash")
+        
+        # Insert account
+        now = datetime.utcnow().isoformat()
+        db_started = time.perf_counter()
+        try:
+            with self.transaction() as conn:
+                cursor = conn.execute("""
+                    INSERT INTO reseller_accounts 
+                    (username, password_hash, email, site_name, package_type, site_path, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (username, password_hash, email, site_name, package_type, str(site_path), now, now))
+                
+                account_id = cursor.lastrowid
+                
+                # Add features based on package
+                conn.executemany("""
+                    INSERT INTO site_features (account_id, feature_name, enabled)
+                    VALUES (?, ?, 1)
+                """, [(account_id, feature) for feature in package["features"]])
+                self._store_usage(conn, [(account_id, *usage)])
+        
+        except sqlite3.Error as e:
+            print(f"✗ Error: {e}")
+            # Cleanup created directories
+            if site_path.exists():
+                shutil.rmtree(site_path)
+            return None
+        finished = time.perf_counter()
+        laps.lap("db")
+        METRICS.create_account_seconds.observe(finished - db_started, ("db",))
+        METRICS.create_account_seconds.observe(fs_seconds, ("filesystem",))
+        METRICS.create_account_seconds.observe(finished - started, ("total",))
+        
+        print(f"✓ Account created successfully!")
+        print(f"  Username: {username}")
+        print(f"  Site Name: {site_name}")
+        print(f"  Site Path: {site_path}")
+        print(f"  Package: {package['name']}")
+        print(f"  FTP Access: ftp://{FTP_HOST}:{FTP_PORT}")
+        
+        return account_id
+    
+    def enqueue_account(self, username, password, email, site_name, package_type,
+                        max_attempts=PROVISION_MAX_ATTEMPTS):
+        """Record a new account and queue its site provisioning; return the job id
+        
+        Only database work happens here, so the call returns quickly
+        however slow the sites storage is. The account stays in status
+        'provisioning' (and cannot log in) until a ProvisioningQueue worker
+        has built its folder, then it becomes 'active'.
+        """
+        safe_site_name = self.safe_site_name(site_name)
+        if not safe_site_name:
+            print("✗ Error: Site name has no usable characters")
+            return None
+        site_path = self.site_path_for(safe_site_name)
+        package = PACKAGES.get(package_type, PACKAGES["4"])
+        password_hash = self.hash_password(password)
+        
+        now = datetime.utcnow().isoformat()
+        try:
+            with self.transaction() as conn:
+                if self.site_path_taken(safe_site_name, conn):
+                    raise sqlite3.IntegrityError(f"Site folder '{safe_site_name}' already exists")
+                cursor = conn.execute("""
+                    INSERT INTO reseller_accounts 
+                    (username, password_hash, email, site_name, package_type, site_path, created_at, updated_at, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'provisioning')
+                """, (username, password_hash, email, site_name, package_type, str(site_path), now, now))
+                account_id = cursor.lastrowid
+                conn.executemany("""
+                    INSERT INTO site_features (account_id, feature_name, enabled)
+                    VALUES (?, ?, 1)
+                """, [(account_id, feature) for feature in package["features"]])
+                
+                payload = {
+                    "site_path": str(site_path),
+                    "site_name": site_name,
+                    "features": package["features"]
+                }
+                cursor = conn.execute("""
+                    INSERT INTO provisioning_jobs
+                    (kind, account_id, payload, max_attempts, created_at, updated_at)
+                    VALUES ('create_site', ?, ?, ?, ?, ?)
+                """, (account_id, json.dumps(payload), max_attempts, now, now))
+                return cursor.lastrowid
+        except sqlite3.Error as e:
+            print(f"✗ Error: {e}")
+            return None
+    
+    def get_job(self, job_id):
+        """Return a provisioning job as a dict, or None"""
+        row = self.connect().execute("""
+            SELECT id, kind, account_id, status, attempts, max_attempts, last_error, created_at, updated_at
+            FROM provisioning_jobs
+            WHERE id = ?
+        """, (job_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "kind", "account_id", "status", "attempts", "max_attempts",
+                "last_error", "created_at", "updated_at")
+        return dict(zip(keys, row))
+    
+    def retry_job(self, job_id):
+        """Send a failed job back to the queue with a fresh set of attempts"""
+        with self.transaction() as conn:
+            cursor = conn.execute("""
+                UPDATE provisioning_jobs
+                SET status = 'queued', attempts = 0, run_after = 0, updated_at = ?
+                WHERE id = ? AND status = 'failed'
+            """, (datetime.utcnow().isoformat(), job_id))
+            return cursor.rowcount == 1
+    
+    def safe_site_name(self, site_name):
+        """Sanitize a site name for use as a folder name"""
+        return "".join(c for c in site_name if c.isalnum() or c in ('-', '_')).lower()
+    
+    def site_path_for(self, safe_site_name, layout=None):
+        """Folder for a new site in layout (default SITES_LAYOUT)"""
+        if (layout or SITES_LAYOUT) == "sharded":
+            digest = hashlib.sha256(safe_site_name.encode()).hexdigest()
+            buckets = [digest[level * SITES_SHARD_WIDTH:(level + 1) * SITES_SHARD_WIDTH]
+                       for level in range(SITES_SHARD_LEVELS)]
+            return self.sites_root.joinpath(SITES_SHARD_DIR, *buckets, safe_site_name)
+        return self.sites_root / safe_site_name
+    
+    def site_path_taken(self, safe_site_name, conn=None):
+        """Whether a site folder by this name exists, or is reserved, in any layout"""
+        paths = [self.site_path_for(safe_site_name, layout) for layout in SITES_LAYOUTS]
+        if any(os.path.lexists(path) for path in paths):
+            return True
+        placeholders = ",".join("?" * len(paths))
+        return (conn or self.connect()).execute(
+            f"SELECT 1 FROM reseller_accounts WHERE site_path IN ({placeholders})", [str(path) for path in paths]
+        ).fetchone() is not None
     
-    def init_database(self):
-        """Initialize the reseller database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS reseller_accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                email TEXT NOT NULL,
-                site_name TEXT UNIQUE NOT NULL,
-                package_type TEXT NOT NULL,
-                site_path TEXT NOT NULL,
-                ftp_enabled INTEGER DEFAULT 1,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL,
-                status TEXT DEFAULT 'active'
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS site_features (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_id INTEGER NOT NULL,
-                feature_name TEXT NOT NULL,
-                enabled INTEGER DEFAULT 1,
-                FOREIGN KEY (account_id) REFERENCES reseller_accounts(id)
-            )
-        """)
+    def create_site_dirs(self, site_path, exist_ok=True):
+        """Create the site folder and its standard subfolders"""
+        site_path.mkdir(parents=True, exist_ok=exist_ok)
+        for name in SITE_DIRS:
+            (site_path / name).mkdir(exist_ok=True)
+    
+    def relayout_sites(self, layout=None, batch_size=RELAYOUT_BATCH, pause=RELAYOUT_PAUSE, limit=None, links=True):
+        """Move existing site folders into layout (default SITES_LAYOUT) while the servers keep running
+        
+        Accounts are read in batches of batch_size, oldest first, with a
+        pause between batches that moved something. Each folder is
+        renamed, a symlink to it is left at the old path, and then
+        site_path is updated. A rename is atomic and keeps open files
+        valid. FTP sessions that were logged in before the move keep
+        working through the link. New logins use the new path once the
+        server reloads the account (within RELOAD_INTERVAL). Remove the
+        links later with prune_site_links(). Only active and suspended
+        accounts are moved; sites still being provisioned or reaped are
+        skipped. Safe to interrupt and run again.
         
-        conn.commit()
-        conn.close()
-        print("✓ Reseller database initialized")
+        Returns {"moved", "skipped", "failed"}.
+        """
+        layout = layout or SITES_LAYOUT
+        moved = skipped = failed = 0
+        last_id = 0
+        started = time.perf_counter()
+        while limit is None or moved < limit:
+            rows = self.connect().execute("""
+                SELECT id, username, site_path, status FROM reseller_accounts
+                WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            moved_before = moved
+            for account_id, username, site_path, status in rows:
+                if limit is not None and moved >= limit:
+                    break
+                last_id = account_id
+                source = Path(site_path)
+                target = self.site_path_for(source.name, layout)
+                if str(target) == site_path:
+                    continue
+                if status not in ("active", "suspended"):
+                    skipped += 1
+                    continue
+                error = self._move_site(account_id, source, target, links)
+                if error:
+                    print(f"✗ {username}: {error}")
+                    failed += 1
+                else:
+                    moved += 1
+            if moved > moved_before:
+                print(f"  {moved} site(s) moved")
+                if pause:
+                    time.sleep(pause)
+        
+        print(f"✓ Moved {moved} site(s) to the {layout} layout in {time.perf_counter() - started:.1f}s"
+              + (f", {skipped} skipped (provisioning or terminated)" if skipped else "")
+              + (f", {failed} failed" if failed else ""))
+        return {"moved": moved, "skipped": skipped, "failed": failed}
     
-    def hash_password(self, password):
-        """Hash password using SHA256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+    def _move_site(self, account_id, source, target, link=True):
+        """Rename one site folder to target and point its account there; returns an error message or None"""
+        if source.is_symlink() or not source.is_dir():
+            return f"Site folder {source} not found"
+        if os.path.lexists(target):
+            # A link left behind by an earlier move in the other direction
+            if target.is_symlink() and os.path.realpath(target) == os.path.realpath(source):
+                target.unlink()
+            else:
+                return f"{target} already exists"
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(source, target)
+        except OSError as e:
+            return str(e)
+        if link:
+            try:
+                os.symlink(os.path.relpath(target, source.parent), source, target_is_directory=True)
+            except OSError:
+                # No symlink support (e.g. unprivileged Windows): only new logins find the site
+                pass
+        
+        try:
+            with self.transaction() as conn:
+                cursor = conn.execute("""
+                    UPDATE reseller_accounts SET site_path = ?, updated_at = ?
+                    WHERE id = ? AND site_path = ?
+                """, (str(target), datetime.utcnow().isoformat(), account_id, str(source)))
+                if cursor.rowcount != 1:
+                    raise sqlite3.IntegrityError("Account changed during the move")
+        except sqlite3.Error as e:
+            if source.is_symlink():
+                source.unlink()
+            os.rename(target, source)
+            self._remove_empty_buckets(target.parent)
+            return str(e)
+        if not link:
+            self._remove_empty_buckets(source.parent)
+        return None
     
-    def create_account(self, username, password, email, site_name, package_type):
-        """Create a new reseller account"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def prune_site_links(self):
+        """Remove the symlinks relayout_sites() left at old site paths; returns how many were removed
         
-        # Sanitize site name for folder creation
-        safe_site_name = "".join(c for c in site_name if c.isalnum() or c in ('-', '_')).lower()
-        site_path = self.sites_root / safe_site_name
+        Run it once no FTP session from before the move is still logged in
+        (for example after the FTP server restarted).
+        """
+        removed = 0
+        last_id = 0
+        while True:
+            rows = self.connect().execute("""
+                SELECT id, site_path FROM reseller_accounts WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, RELAYOUT_BATCH)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            for _, site_path in rows:
+                removed += self.remove_site_links(site_path)
+        print(f"✓ Removed {removed} link(s) to moved sites")
+        return removed
+    
+    def remove_site_links(self, site_path):
+        """Remove symlinks to site_path left at its other-layout paths; returns how many"""
+        current = os.path.realpath(site_path)
+        removed = 0
+        for layout in SITES_LAYOUTS:
+            old = self.site_path_for(Path(site_path).name, layout)
+            if str(old) != str(site_path) and old.is_symlink() and os.path.realpath(old) == current:
+                old.unlink()
+                self._remove_empty_buckets(old.parent)
+                removed += 1
+        return removed
+    
+    def _remove_empty_buckets(self, folder):
+        """Remove folder and its parents up to the shard root while they are empty buckets"""
+        shard_root = self.sites_root / SITES_SHARD_DIR
+        while folder != shard_root and shard_root in folder.parents:
+            try:
+                folder.rmdir()
+            except OSError:
+                break
+            folder = folder.parent
+    
+    def create_accounts_bulk(self, accounts, chunk_size=BULK_CHUNK_SIZE, workers=BULK_WORKERS):
+        """Provision many accounts with chunked transactions and parallel site creation
         
-        # Check if site already exists
-        if site_path.exists():
-            print(f"✗ Error: Site folder '{safe_site_name}' already exists")
-            conn.close()
-            return None
+        accounts is any iterable of dicts with the create_account keyword
+        arguments (username, password, email, site_name, package_type).
+        Each chunk builds its site folders on a thread pool, then inserts
+        every account and feature row in one transaction. Rows that fail
+        have their site folders removed again.
         
-        # Create site directory structure
-        site_path.mkdir(parents=True, exist_ok=True)
-        (site_path / "wwwroot").mkdir(exist_ok=True)
-        (site_path / "data").mkdir(exist_ok=True)
-        (site_path / "uploads").mkdir(exist_ok=True)
-        (site_path / "logs").mkdir(exist_ok=True)
+        Returns one result dict per input row, in input order:
+        {"index", "username", "status": "created" | "failed", "account_id", "error"}
+        """
+        results = []
+        started = time.perf_counter()
+        accounts = iter(accounts)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                chunk = list(islice(accounts, chunk_size))
+                if not chunk:
+                    break
+                results.extend(self._create_accounts_chunk(chunk, len(results), pool))
         
-        # Hash password
-        password_hash = self.hash_password(password)
+        created = sum(1 for result in results if result["status"] == "created")
+        elapsed = time.perf_counter() - started
+        print(f"✓ Bulk provisioning finished: {created} created, "
+              f"{len(results) - created} failed in {elapsed:.1f}s")
+        return results
+    
+    def _create_accounts_chunk(self, chunk, offset, pool, on_commit=None):
+        """Provision one chunk of create_accounts_bulk
         
-        # Insert account
+        on_commit(conn, inserted_rows) runs inside the transaction that
+        inserts the accounts (or an empty one if none survive validation).
+        """
+        results = []
+        pending = []
+        usernames = set()
+        site_names = set()
+        for index, account in enumerate(chunk, offset):
+            result = {
+                "index": index,
+                "username": account.get("username"),
+                "status": "failed",
+                "account_id": None,
+                "error": None
+            }
+            results.append(result)
+            try:
+                username = account["username"]
+                site_name = account["site_name"]
+                row = {
+                    "result": result,
+                    "username": username,
+                    "password": account["password"],
+                    "email": account["email"],
+                    "site_name": site_name,
+                    "package_type": account["package_type"],
+                    "site_path": self.site_path_for(self.safe_site_name(site_name))
+                }
+            except KeyError as e:
+                result["error"] = f"Missing field {e}"
+                continue
+            if not self.safe_site_name(site_name):
+                result["error"] = "Site name has no usable characters"
+            elif username in usernames:
+                result["error"] = f"Duplicate username '{username}' in batch"
+            elif site_name in site_names:
+                result["error"] = f"Duplicate site name '{site_name}' in batch"
+            else:
+                usernames.add(username)
+                site_names.add(site_name)
+                pending.append(row)
+        
+        # Reject rows that already exist before touching the filesystem
+        if pending:
+            conn = self.connect()
+            placeholders = ",".join("?" * len(pending))
+            taken_usernames = {r[0] for r in conn.execute(
+                f"SELECT username FROM reseller_accounts WHERE username IN ({placeholders})",
+                [row["username"] for row in pending]
+            )}
+            taken_sites = {r[0] for r in conn.execute(
+                f"SELECT site_name FROM reseller_accounts WHERE site_name IN ({placeholders})",
+                [row["site_name"] for row in pending]
+            )}
+            available = []
+            for row in pending:
+                if row["username"] in taken_usernames:
+                    row["result"]["error"] = f"Username '{row['username']}' already exists"
+                elif row["site_name"] in taken_sites:
+                    row["result"]["error"] = f"Site name '{row['site_name']}' already exists"
+                else:
+                    available.append(row)
+            pending = available
+        
+        # Build site folders and hash passwords in parallel; the folder mkdir claims the name
+        def build(row):
+            name = row["site_path"].name
+            if any(os.path.lexists(self.site_path_for(name, layout)) for layout in SITES_LAYOUTS):
+                return f"Site folder '{name}' already exists"
+            try:
+                self.create_site_dirs(row["site_path"], exist_ok=False)
+            except FileExistsError:
+                return f"Site folder '{row['site_path'].name}' already exists"
+            except OSError as e:
+                return str(e)
+            try:
+                package = PACKAGES.get(row["package_type"], PACKAGES["4"])
+                self.create_default_files(row["site_path"], row["site_name"], package["features"], verbose=False)
+            except OSError as e:
+                shutil.rmtree(row["site_path"], ignore_errors=True)
+                return str(e)
+            row["usage"] = measure_site(row["site_path"])
+            # The KDF releases the GIL, so hashing here runs in parallel too
+            row["password_hash"] = self.hash_password(row.pop("password"))
+            return None
+        
+        built = []
+        for row, error in zip(pending, pool.map(build, pending)):
+            if error:
+                row["result"]["error"] = error
+            else:
+                built.append(row)
+        
+        failed = self._insert_accounts(built, on_commit)
+        if failed:
+            list(pool.map(lambda row: shutil.rmtree(row["site_path"], ignore_errors=True), failed))
+        return results
+    
+    def _insert_accounts(self, rows, on_commit=None):
+        """Insert account and feature rows in one transaction; return the rows that failed"""
+        if not rows:
+            if on_commit is not None:
+                with self.transaction() as conn:
+                    on_commit(conn, [])
+            return []
         now = datetime.utcnow().isoformat()
         try:
-            cursor.execute("""
-                INSERT INTO reseller_accounts 
-                (username, password_hash, email, site_name, package_type, site_path, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (username, password_hash, email, site_name, package_type, str(site_path), now, now))
-            
-            account_id = cursor.lastrowid
-            
-            # Add features based on package
-            package = PACKAGES.get(package_type, PACKAGES["4"])
-            for feature in package["features"]:
-                cursor.execute("""
+            with self.transaction() as conn:
+                conn.executemany("""
+                    INSERT INTO reseller_accounts 
+                    (username, password_hash, email, site_name, package_type, site_path, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [(row["username"], row["password_hash"], row["email"], row["site_name"],
+                       row["package_type"], str(row["site_path"]), now, now) for row in rows])
+                
+                placeholders = ",".join("?" * len(rows))
+                ids = dict(conn.execute(
+                    f"SELECT username, id FROM reseller_accounts WHERE username IN ({placeholders})",
+                    [row["username"] for row in rows]
+                ))
+                conn.executemany("""
                     INSERT INTO site_features (account_id, feature_name, enabled)
                     VALUES (?, ?, 1)
-                """, (account_id, feature))
-            
-            conn.commit()
-            
-            # Create default files
-            self.create_default_files(site_path, site_name, package["features"])
-            
-            print(f"✓ Account created successfully!")
-            print(f"  Username: {username}")
-            print(f"  Site Name: {site_name}")
-            print(f"  Site Path: {site_path}")
-            print(f"  Package: {package['name']}")
-            print(f"  FTP Access: ftp://{FTP_HOST}:{FTP_PORT}")
-            
-            return account_id
-            
-        except sqlite3.IntegrityError as e:
+                """, [(ids[row["username"]], feature)
+                      for row in rows
+                      for feature in PACKAGES.get(row["package_type"], PACKAGES["4"])["features"]])
+                self._store_usage(conn, [(ids[row["username"]], *row["usage"]) for row in rows])
+                if on_commit is not None:
+                    on_commit(conn, rows)
+            for row in rows:
+                row["result"]["status"] = "created"
+                row["result"]["account_id"] = ids[row["username"]]
+            return []
+        except sqlite3.IntegrityError:
+            # Another writer raced us; fall back to row-by-row so only the
+            # conflicting rows fail
+            pass
+        except sqlite3.Error as e:
+            for row in rows:
+                row["result"]["error"] = str(e)
+            return rows
+        
+        failed = []
+        inserted = []
+        with self.transaction() as conn:
+            for row in rows:
+                conn.execute("SAVEPOINT bulk_row")
+                try:
+                    cursor = conn.execute("""
+                        INSERT INTO reseller_accounts 
+                        (username, password_hash, email, site_name, package_type, site_path, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (row["username"], row["password_hash"], row["email"], row["site_name"],
+                          row["package_type"], str(row["site_path"]), now, now))
+                    account_id = cursor.lastrowid
+                    conn.executemany("""
+                        INSERT INTO site_features (account_id, feature_name, enabled)
+                        VALUES (?, ?, 1)
+                    """, [(account_id, feature)
+                          for feature in PACKAGES.get(row["package_type"], PACKAGES["4"])["features"]])
+                    self._store_usage(conn, [(account_id, *row["usage"])])
+                except sqlite3.IntegrityError as e:
+                    conn.execute("ROLLBACK TO bulk_row")
+                    row["result"]["error"] = str(e)
+                    failed.append(row)
+                else:
+                    row["result"]["status"] = "created"
+                    row["result"]["account_id"] = account_id
+                    inserted.append(row)
+                conn.execute("RELEASE bulk_row")
+            if on_commit is not None:
+                on_commit(conn, inserted)
+        return failed
+    
+    def import_accounts(self, path, fmt=None, chunk_size=IMPORT_CHUNK_SIZE, workers=BULK_WORKERS,
+                        restart=False, errors=None):
+        """Create accounts from a CSV or JSON Lines export, resuming an interrupted import
+        
+        Rows need username, password, email, site_name and package_type and
+        are checked with the interactive prompts' rules. The file is read
+        one row at a time. Each chunk of rows is provisioned like
+        create_accounts_bulk, and its byte offset is committed in the same
+        transaction as its accounts. Running the same import again
+        continues after the last committed chunk. restart=True starts over
+        from the first row. Rejected rows are printed (up to
+        IMPORT_SHOW_ERRORS) and appended to the errors file object, if
+        given, as JSON lines.
+        
+        Returns {"rows", "created", "failed", "resumed_from", "seconds"}, or
+        None if the import cannot start.
+        """
+        source = os.path.abspath(path)
+        try:
+            st = os.stat(source)
+        except OSError as e:
             print(f"✗ Error: {e}")
-            # Cleanup created directories
-            if site_path.exists():
-                import shutil
-                shutil.rmtree(site_path)
             return None
-        finally:
-            conn.close()
+        fmt = fmt or ("csv" if source.lower().endswith(".csv") else "jsonl")
+        now = datetime.utcnow().isoformat()
+        
+        checkpoint = self.connect().execute("""
+            SELECT format, size, mtime_ns, committed_offset, chunk_end, rows, created, failed, status
+            FROM import_checkpoints WHERE source = ?
+        """, (source,)).fetchone()
+        if checkpoint and not restart:
+            if checkpoint[:3] != (fmt, st.st_size, st.st_mtime_ns):
+                print(f"✗ Error: {path} changed since its import started; use --restart to import it from the start")
+                return None
+            if checkpoint[8] == "done":
+                print(f"✓ {path} was already imported: {checkpoint[5]} row(s), {checkpoint[6]} created, "
+                      f"{checkpoint[7]} failed (use --restart to import it again)")
+                return {"rows": checkpoint[5], "created": checkpoint[6], "failed": checkpoint[7],
+                        "resumed_from": checkpoint[5], "seconds": 0.0}
+            offset, chunk_end, rows, created, failed = checkpoint[3:8]
+            if chunk_end is not None:
+                self._remove_import_orphans(source, fmt, offset, chunk_end)
+            print(f"✓ Resuming import of {path} after row {rows}")
+        else:
+            offset, rows, created, failed = 0, 0, 0, 0
+            with self.transaction() as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO import_checkpoints
+                    (source, format, size, mtime_ns, started_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (source, fmt, st.st_size, st.st_mtime_ns, now, now))
+        
+        resumed_from = rows
+        shown = 0
+        started = time.perf_counter()
+        last_report = started
+        records = read_import_file(source, fmt, offset)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                chunk_end = chunk[-1][1]
+                
+                # Validate before anything touches the database or disk
+                accounts = []
+                numbers = []
+                rejected = []
+                for number, (record, _) in enumerate(chunk, rows + 1):
+                    if isinstance(record, str):
+                        rejected.append((number, None, record))
+                        continue
+                    fields = {field: str(record.get(field) or "").strip()
+                              for field in ("username", "email", "site_name", "package_type")}
+                    fields["password"] = str(record.get("password") or "")
+                    problems = validate_account(**fields)
+                    if problems:
+                        rejected.append((number, fields["username"], "; ".join(problems)))
+                    else:
+                        accounts.append(fields)
+                        numbers.append(number)
+                
+                # Mark the chunk in flight so a crash before its commit can
+                # be cleaned up: its site folders exist but its accounts don't
+                with self.transaction() as conn:
+                    conn.execute("UPDATE import_checkpoints SET chunk_end = ?, updated_at = ? WHERE source = ?",
+                                 (chunk_end, datetime.utcnow().isoformat(), source))
+                
+                committed = []
+                
+                def checkpoint_chunk(conn, inserted):
+                    conn.execute("""
+                        UPDATE import_checkpoints
+                        SET committed_offset = ?, chunk_end = NULL, rows = rows + ?, created = created + ?,
+                            failed = failed + ?, updated_at = ?
+                        WHERE source = ?
+                    """, (chunk_end, len(chunk), len(inserted), len(chunk) - len(inserted),
+                          datetime.utcnow().isoformat(), source))
+                    committed.append(len(inserted))
+                
+                results = self._create_accounts_chunk(accounts, 0, pool, on_commit=checkpoint_chunk)
+                if not committed:
+                    error = next((result["error"] for result in results if result["error"]), "database error")
+                    print(f"✗ Import stopped before row {rows + 1}: {error}")
+                    print("  Run the same command again to resume")
+                    return None
+                rejected.extend((numbers[result["index"]], result["username"], result["error"])
+                                for result in results if result["status"] != "created")
+                
+                rows += len(chunk)
+                created += committed[0]
+                failed += len(chunk) - committed[0]
+                offset = chunk_end
+                for number, username, error in sorted(rejected, key=lambda item: item[0]):
+                    if errors is not None:
+                        errors.write(json.dumps({"row": number, "username": username, "error": error}) + "\n")
+                    if shown < IMPORT_SHOW_ERRORS:
+                        print(f"✗ Row {number}{f' ({username})' if username else ''}: {error}")
+                        shown += 1
+                
+                if time.monotonic() - last_report >= 5:
+                    last_report = time.monotonic()
+                    print(f"  {rows} row(s): {created} created, {failed} failed")
+        
+        with self.transaction() as conn:
+            conn.execute("UPDATE import_checkpoints SET status = 'done', updated_at = ? WHERE source = ?",
+                         (datetime.utcnow().isoformat(), source))
+        elapsed = time.perf_counter() - started
+        if failed > shown:
+            print(f"  ... {failed - shown} more rejected row(s)" + ("" if errors is not None else
+                                                                   " (use --errors FILE to keep them all)"))
+        print(f"✓ Import finished: {rows} row(s), {created} created, {failed} failed "
+              f"({rows - resumed_from} row(s) this run in {elapsed:.1f}s)")
+        return {"rows": rows, "created": created, "failed": failed, "resumed_from": resumed_from,
+                "seconds": round(elapsed, 3)}
     
-    def create_default_files(self, site_path, site_name, features):
+    def _remove_import_orphans(self, source, fmt, start, end):
+        """Remove site folders an interrupted import built for rows it never committed"""
+        conn = self.connect()
+        removed = 0
+        for record, offset in read_import_file(source, fmt, start):
+            if offset > end:
+                break
+            if isinstance(record, str):
+                continue
+            safe_site_name = self.safe_site_name(str(record.get("site_name") or "").strip())
+            site_path = self.site_path_for(safe_site_name)
+            if not safe_site_name or not site_path.exists():
+                continue
+            if not conn.execute("SELECT 1 FROM reseller_accounts WHERE site_path = ?",
+                                (str(site_path),)).fetchone():
+                shutil.rmtree(site_path, ignore_errors=True)
+                removed += 1
+        if removed:
+            print(f"✓ Removed {removed} site folder(s) left by the interrupted chunk")
+    
+    @profiled("create_default_files")
+    def create_default_files(self, site_path, site_name, features, verbose=True):
         """Create default files for the site"""
+        laps = PROFILER.laps("create_default_files")
+        # The stylesheet comes from the shared skeleton (reflinked/hardlinked)
+        self.skeletons.clone(site_path)
+        laps.lap("clone")
+        
         # Create index.html
         index_content = f"""<!DOCTYPE html>
 <html lang="en">
@@ -158,47 +2279,7 @@ class ResellerManager:
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>{site_name} - Welcome</title>
-    <style>
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            margin: 0;
-            padding: 0;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: #333;
-            min-height: 100vh;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-        }}
-        .container {{
-            background: white;
-            padding: 40px;
-            border-radius: 10px;
-            box-shadow: 0 10px 30px rgba(0,0,0,0.3);
-            max-width: 600px;
-            text-align: center;
-        }}
-        h1 {{
-            color: #667eea;
-            margin-bottom: 20px;
-        }}
-        .features {{
-            margin: 30px 0;
-            text-align: left;
-        }}
-        .feature {{
-            background: #f7f7f7;
-            padding: 10px;
-            margin: 10px 0;
-            border-radius: 5px;
-            border-left: 4px solid #667eea;
-        }}
-        .footer {{
-            margin-top: 30px;
-            color: #666;
-            font-size: 0.9em;
-        }}
-    </style>
+    <link rel="stylesheet" href="style.css">
 </head>
 <body>
     <div class="container">
@@ -250,183 +2331,1833 @@ Welcome to your AGP CMS Reseller site!
 - `uploads/` - User uploaded files
 - `logs/` - System logs
 
-## FTP Access
-You can access your files via FTP using your username and password.
-- Host: {FTP_HOST}
-- Port: {FTP_PORT}
-- Protocol: FTP
+## FTP Access
+You can access your files via FTP using your username and password.
+- Host: {FTP_HOST}
+- Port: {FTP_PORT}
+- Protocol: FTP
+
+## Getting Started
+1. Upload your website files to the `wwwroot` directory
+2. Customize the default index.html file
+3. Add your content and media files
+
+For support, please contact your reseller provider.
+"""
+        
+        with open(site_path / "README.md", "w") as f:
+            f.write(readme_content)
+        laps.lap("render_write")
+        
+        if verbose:
+            print(f"✓ Default files created in {site_path}")
+    
+    def iter_accounts(self, status=None, package_type=None, feature=None, before=None,
+                      page_size=LIST_PAGE_SIZE):
+        """Yield accounts newest first, one keyset page at a time
+        
+        Filters are optional: status ('active', ...), package_type ('1'-'4'),
+        feature (an enabled site_features name) and before (only accounts
+        created strictly before this ISO timestamp). Pages are fetched with
+        WHERE (created_at, id) < (last seen), so memory use and per-page
+        cost stay flat however many accounts exist.
+        """
+        conditions = []
+        params = []
+        if status is not None:
+            conditions.append("a.status = ?")
+            params.append(status)
+        if package_type is not None:
+            conditions.append("a.package_type = ?")
+            params.append(package_type)
+        if feature is not None:
+            conditions.append("""EXISTS (
+                SELECT 1 FROM site_features f
+                WHERE f.account_id = a.id AND f.feature_name = ? AND f.enabled = 1
+            )""")
+            params.append(feature)
+        if before is not None:
+            conditions.append("a.created_at < ?")
+            params.append(before)
+        
+        conn = self.connect()
+        last = None
+        while True:
+            page_conditions = list(conditions)
+            page_params = list(params)
+            if last is not None:
+                page_conditions.append("(a.created_at, a.id) < (?, ?)")
+                page_params.extend(last)
+            where = "WHERE " + " AND ".join(page_conditions) if page_conditions else ""
+            rows = conn.execute(f"""
+                SELECT a.id, a.username, a.email, a.site_name, a.package_type,
+                       a.status, a.ftp_enabled, a.site_path, a.created_at
+                FROM reseller_accounts a
+                {where}
+                ORDER BY a.created_at DESC, a.id DESC
+                LIMIT ?
+            """, page_params + [page_size]).fetchall()
+            
+            for row in rows:
+                yield {
+                    "id": row[0],
+                    "username": row[1],
+                    "email": row[2],
+                    "site_name": row[3],
+                    "package_type": row[4],
+                    "package": PACKAGES.get(row[4], {}).get("name", row[4]),
+                    "status": row[5],
+                    "ftp_enabled": row[6],
+                    "site_path": row[7],
+                    "created_at": row[8]
+                }
+            if len(rows) < page_size:
+                return
+            last = (rows[-1][8], rows[-1][0])
+    
+    def export_accounts(self, out, fmt="jsonl", limit=None, **filters):
+        """Stream accounts to a file object as JSON Lines or CSV; return the row count"""
+        accounts = islice(self.iter_accounts(**filters), limit)
+        count = 0
+        if fmt == "csv":
+            writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            for account in accounts:
+                writer.writerow(account)
+                count += 1
+        elif fmt == "jsonl":
+            for account in accounts:
+                out.write(json.dumps(account) + "\n")
+                count += 1
+        else:
+            raise ValueError(f"Unknown export format: {fmt}")
+        return count
+    
+    def list_accounts(self, limit=None, **filters):
+        """List reseller accounts (optionally filtered, see iter_accounts)"""
+        count = 0
+        for account in islice(self.iter_accounts(**filters), limit):
+            if count == 0:
+                print("\n" + "="*80)
+                print("RESELLER ACCOUNTS")
+                print("="*80)
+            print(f"\nID: {account['id']}")
+            print(f"Username: {account['username']}")
+            print(f"Email: {account['email']}")
+            print(f"Site Name: {account['site_name']}")
+            print(f"Package: {account['package']}")
+            print(f"Status: {account['status']}")
+            print(f"Created: {account['created_at']}")
+            print("-" * 80)
+            count += 1
+        
+        if count == 0:
+            print("No accounts found.")
+    
+    def get_account_credentials(self, username):
+        """Get account credentials for FTP authorization"""
+        return self.connect().execute("""
+            SELECT username, password_hash, site_path, ftp_enabled
+            FROM reseller_accounts
+            WHERE username = ? AND status = 'active'
+        """, (username,)).fetchone()
+    
+    def get_all_active_accounts(self):
+        """Get all active accounts for FTP server"""
+        return self.connect().execute("""
+            SELECT username, password_hash, site_path
+            FROM reseller_accounts
+            WHERE status = 'active' AND ftp_enabled = 1
+        """).fetchall()
+    
+    def get_ftp_account(self, username):
+        """Get a single FTP-enabled active account, or None if it can't log in"""
+        result = self.connect().execute("""
+            SELECT id, username, password_hash, site_path, package_type, read_limit, write_limit
+            FROM reseller_accounts
+            WHERE username = ? AND status = 'active' AND ftp_enabled = 1
+        """, (username,)).fetchone()
+        if result is None:
+            return None
+        read_limit, write_limit = package_bandwidth(result[4], result[5], result[6])
+        return {
+            "id": result[0],
+            "username": result[1],
+            "password_hash": result[2],
+            "site_path": result[3],
+            "read_limit": read_limit,
+            "write_limit": write_limit
+        }
+    
+    def get_site(self, username):
+        """Id and site path of an active account, or None"""
+        result = self.connect().execute("""
+            SELECT id, site_path FROM reseller_accounts
+            WHERE username = ? AND status = 'active'
+        """, (username,)).fetchone()
+        if result is None:
+            return None
+        return {"id": result[0], "site_path": result[1]}
+    
+    def get_usage(self, account_id):
+        """Indexed disk usage and effective quota for an account, or None"""
+        result = self.connect().execute("""
+            SELECT a.package_type, a.quota_bytes, u.bytes_used, u.file_count, u.reconciled_at
+            FROM reseller_accounts a
+            LEFT JOIN account_usage u ON u.account_id = a.id
+            WHERE a.id = ?
+        """, (account_id,)).fetchone()
+        if result is None:
+            return None
+        return {
+            "account_id": account_id,
+            "bytes_used": result[2] or 0,
+            "file_count": result[3] or 0,
+            "quota_bytes": package_quota(result[0], result[1]),
+            "reconciled_at": result[4]
+        }
+    
+    def set_quota(self, username, quota_bytes):
+        """Override the package storage limit for one account (None = package default)"""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE reseller_accounts SET quota_bytes = ?, updated_at = ? WHERE username = ?",
+                (quota_bytes, datetime.utcnow().isoformat(), username)
+            )
+        return cursor.rowcount > 0
+    
+    def suspend_account(self, username):
+        """Suspend an active account; returns True if it was active
+        
+        Running FTP servers refuse its logins within RELOAD_INTERVAL seconds.
+        Files are kept, and resume_account() reverses it.
+        """
+        return self._change_status(username, "active", "suspended")
+    
+    def resume_account(self, username):
+        """Reactivate a suspended account; returns True if it was suspended"""
+        return self._change_status(username, "suspended", "active")
+    
+    def terminate_account(self, username, archive=None, max_attempts=PROVISION_MAX_ATTEMPTS):
+        """Terminate an active or suspended account; returns the reaper job id, or None
+        
+        The status becomes 'terminated' in the same transaction that queues
+        a remove_site job, so this returns right away. Running FTP servers
+        refuse new logins and close the account's live sessions within
+        RELOAD_INTERVAL seconds. A ProvisioningQueue worker (`reseller.py
+        worker`) then moves the site folder out of place and deletes it in
+        rate-limited batches ('removed'), or with archive=True (default
+        TERMINATE_ARCHIVE) keeps it in ARCHIVE_DIR ('archived'). Once that
+        is done the username and site name are released (see
+        ProvisioningQueue.run_remove_site).
+        """
+        archive = TERMINATE_ARCHIVE if archive is None else archive
+        now = datetime.utcnow().isoformat()
+        with self.transaction() as conn:
+            row = conn.execute("""
+                SELECT id FROM reseller_accounts WHERE username = ? AND status IN ('active', 'suspended')
+            """, (username,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE reseller_accounts SET status = 'terminated', updated_at = ? WHERE id = ?",
+                         (now, row[0]))
+            cursor = conn.execute("""
+                INSERT INTO provisioning_jobs
+                (kind, account_id, payload, max_attempts, created_at, updated_at)
+                VALUES ('remove_site', ?, ?, ?, ?, ?)
+            """, (row[0], json.dumps({"archive": archive}), max_attempts, now, now))
+            return cursor.lastrowid
+    
+    def terminated_usernames(self, usernames):
+        """Those of usernames whose account was terminated or no longer exists (suspended ones don't count)"""
+        usernames = set(usernames)
+        if not usernames:
+            return set()
+        placeholders = ",".join("?" * len(usernames))
+        kept = {row[0] for row in self.connect().execute(f"""
+            SELECT username FROM reseller_accounts
+            WHERE username IN ({placeholders}) AND status IN ('active', 'suspended')
+        """, list(usernames))}
+        return usernames - kept
+    
+    def _change_status(self, username, old_status, new_status):
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE reseller_accounts SET status = ?, updated_at = ? WHERE username = ? AND status = ?",
+                (new_status, datetime.utcnow().isoformat(), username, old_status)
+            )
+        return cursor.rowcount > 0
+    
+    def set_bandwidth(self, username, **limits):
+        """Override package FTP limits given as read_limit= and/or write_limit=
+        
+        Values are bytes/second; 0 is unlimited and None restores the
+        package default. Running FTP servers apply the change within
+        RELOAD_INTERVAL seconds, including to transfers in progress.
+        """
+        unknown = set(limits) - {"read_limit", "write_limit"}
+        if unknown:
+            raise ValueError(f"unknown bandwidth setting(s): {', '.join(sorted(unknown))}")
+        if not limits:
+            return self.connect().execute(
+                "SELECT 1 FROM reseller_accounts WHERE username = ?", (username,)
+            ).fetchone() is not None
+        assignments = ", ".join(f"{column} = ?" for column in limits)
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE reseller_accounts SET {assignments}, updated_at = ? WHERE username = ?",
+                (*limits.values(), datetime.utcnow().isoformat(), username)
+            )
+        return cursor.rowcount > 0
+    
+    def apply_usage_deltas(self, deltas):
+        """Add {account_id: (bytes, files)} changes to the usage index"""
+        now = datetime.utcnow().isoformat()
+        with self.transaction() as conn:
+            # An upsert can't clamp the inserted row without clamping the
+            # delta, so update existing rows first and insert the rest
+            conn.executemany("""
+                UPDATE account_usage
+                SET bytes_used = MAX(0, bytes_used + ?), file_count = MAX(0, file_count + ?), updated_at = ?
+                WHERE account_id = ?
+            """, [(size, files, now, account_id) for account_id, (size, files) in deltas.items()])
+            conn.executemany("""
+                INSERT OR IGNORE INTO account_usage (account_id, bytes_used, file_count, updated_at)
+                VALUES (?, MAX(0, ?), MAX(0, ?), ?)
+            """, [(account_id, size, files, now) for account_id, (size, files) in deltas.items()])
+    
+    def reconcile_usage(self, limit=None, workers=BULK_WORKERS):
+        """Re-measure site folders and overwrite their usage rows
+        
+        Sites that were never measured come first, then the least recently
+        measured, so repeated calls with a limit cycle through every site.
+        Returns the number of sites measured.
+        """
+        rows = self.connect().execute("""
+            SELECT a.id, a.site_path
+            FROM reseller_accounts a
+            LEFT JOIN account_usage u ON u.account_id = a.id
+            ORDER BY u.reconciled_at IS NOT NULL, u.reconciled_at, a.id
+            LIMIT ?
+        """, (-1 if limit is None else limit,)).fetchall()
+        if not rows:
+            return 0
+        
+        # Walking is I/O bound; measure several sites at once
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sizes = list(pool.map(lambda row: measure_site(row[1]), rows))
+        
+        with self.transaction() as conn:
+            self._store_usage(conn, [(account_id, size, files)
+                                     for (account_id, _), (size, files) in zip(rows, sizes)])
+        return len(rows)
+    
+    def _store_usage(self, conn, measured):
+        """Overwrite usage rows with measured (account_id, bytes, files) and mark them reconciled now"""
+        now = datetime.utcnow().isoformat()
+        conn.executemany("""
+            INSERT INTO account_usage (account_id, bytes_used, file_count, reconciled_at, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(account_id) DO UPDATE SET
+                bytes_used = excluded.bytes_used,
+                file_count = excluded.file_count,
+                reconciled_at = excluded.reconciled_at,
+                updated_at = excluded.updated_at
+        """, [(account_id, size, files, now, now) for account_id, size, files in measured])
+    
+    def _manifest_diff(self, account_id, root, rel=""):
+        """Compare files under root/rel with the manifest
+        
+        Returns (changed, removed): changed lists (path, size, mtime_ns,
+        old_hash) for new files and files whose size or mtime moved;
+        removed lists manifest paths that are gone from disk.
+        """
+        on_disk = scan_files(root, rel)
+        if rel:
+            # Keys are '/'-separated, and '0' sorts right after '/'
+            rows = self.connect().execute("""
+                SELECT path, size, mtime_ns, hash FROM site_manifest
+                WHERE account_id = ? AND deleted = 0 AND (path = ? OR (path > ? AND path < ?))
+            """, (account_id, rel, rel + "/", rel + "0"))
+        else:
+            rows = self.connect().execute("""
+                SELECT path, size, mtime_ns, hash FROM site_manifest
+                WHERE account_id = ? AND deleted = 0
+            """, (account_id,))
+        known = {path: (size, mtime_ns, digest) for path, size, mtime_ns, digest in rows}
+        changed = []
+        for path, (size, mtime_ns) in on_disk.items():
+            entry = known.get(path)
+            if entry is None or entry[:2] != (size, mtime_ns):
+                changed.append((path, size, mtime_ns, entry[2] if entry else None))
+        removed = [path for path in known if path not in on_disk]
+        return changed, removed
+    
+    def _apply_manifest_changes(self, account_id, hashed, removed, scanned=False):
+        """Store hashed files and removals; returns the account's manifest version
+        
+        hashed lists (path, size, mtime_ns, old_hash, new_hash). Only
+        content changes and removals start a new version; a file that was
+        touched but kept its contents just has its size/mtime refreshed.
+        """
+        content = [entry for entry in hashed if entry[4] is not None and entry[4] != entry[3]]
+        touched = [entry for entry in hashed if entry[4] is not None and entry[4] == entry[3]]
+        now = datetime.utcnow().isoformat()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT version FROM manifest_versions WHERE account_id = ?",
+                               (account_id,)).fetchone()
+            version = row[0] if row else 0
+            if content or removed:
+                version += 1
+                conn.executemany("""
+                    INSERT INTO site_manifest (account_id, path, size, mtime_ns, hash, version, deleted)
+                    VALUES (?, ?, ?, ?, ?, ?, 0)
+                    ON CONFLICT(account_id, path) DO UPDATE SET
+                        size = excluded.size,
+                        mtime_ns = excluded.mtime_ns,
+                        hash = excluded.hash,
+                        version = excluded.version,
+                        deleted = 0
+                """, [(account_id, path, size, mtime_ns, new_hash, version)
+                      for path, size, mtime_ns, _, new_hash in content])
+                conn.executemany("""
+                    UPDATE site_manifest SET deleted = 1, version = ?
+                    WHERE account_id = ? AND path = ?
+                """, [(version, account_id, path) for path in removed])
+            conn.executemany("""
+                UPDATE site_manifest SET size = ?, mtime_ns = ?
+                WHERE account_id = ? AND path = ?
+            """, [(size, mtime_ns, account_id, path) for path, size, mtime_ns, _, _ in touched])
+            if row is None or version != row[0] or scanned:
+                conn.execute("""
+                    INSERT INTO manifest_versions (account_id, version, scanned_at, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(account_id) DO UPDATE SET
+                        version = excluded.version,
+                        scanned_at = COALESCE(excluded.scanned_at, manifest_versions.scanned_at),
+                        updated_at = excluded.updated_at
+                """, (account_id, version, now if scanned else None, now))
+        return version
+    
+    def refresh_manifest(self, account_id, site_path, paths=("",), link_blobs=False):
+        """Re-check paths (relative to the site's wwwroot; "" = all of it) and update the manifest
+        
+        Only files whose size or mtime changed are hashed. With link_blobs,
+        new contents that already have a blob in the dedup store are
+        replaced by links to it. Returns the account's manifest version.
+        """
+        root = os.path.join(site_path, MANIFEST_DIR)
+        # A path inside another one in the list is already covered
+        checked = []
+        for rel in sorted(set(paths)):
+            if not any(rel == parent or not parent or rel.startswith(parent + "/") for parent in checked):
+                checked.append(rel)
+        changed = []
+        removed = []
+        for rel in checked:
+            files, gone = self._manifest_diff(account_id, root, rel)
+            changed.extend(files)
+            removed.extend(gone)
+        hashed = [entry + (hash_file(os.path.join(root, entry[0])),) for entry in changed]
+        version = self._apply_manifest_changes(account_id, hashed, removed)
+        if link_blobs:
+            self._link_to_blobs([(account_id, site_path, path, size, mtime_ns, new_hash)
+                                 for path, size, mtime_ns, _, new_hash in hashed
+                                 if new_hash is not None and size >= DEDUP_MIN_SIZE], create=False)
+        return version
+    
+    def rescan_manifest(self, username=None, workers=MANIFEST_HASH_WORKERS):
+        """Bring site manifests up to date with what is on disk
+        
+        Every file is stat()ed, but only new files and files whose size or
+        mtime changed are read and hashed, on a process pool shared by a
+        batch of sites. Returns a summary dict.
+        """
+        query = "SELECT id, site_path FROM reseller_accounts"
+        params = ()
+        if username:
+            query += " WHERE username = ?"
+            params = (username,)
+        accounts = self.connect().execute(query + " ORDER BY id", params).fetchall()
+        
+        started = time.perf_counter()
+        summary = {"sites": 0, "files_hashed": 0, "files_changed": 0, "files_removed": 0}
+        pool = None
+        try:
+            for offset in range(0, len(accounts), MANIFEST_RESCAN_BATCH):
+                diffs = []
+                paths = []
+                for account_id, site_path in accounts[offset:offset + MANIFEST_RESCAN_BATCH]:
+                    root = os.path.join(site_path, MANIFEST_DIR)
+                    changed, removed = self._manifest_diff(account_id, root)
+                    diffs.append((account_id, changed, removed))
+                    paths.extend(os.path.join(root, entry[0]) for entry in changed)
+                
+                if paths and pool is None:
+                    # Started (and multiprocessing imported) only once something needs hashing
+                    from concurrent.futures import ProcessPoolExecutor
+                    pool = ProcessPoolExecutor(max_workers=workers or None)
+                hashes = iter(pool.map(hash_file, paths, chunksize=16) if paths else ())
+                for account_id, changed, removed in diffs:
+                    hashed = [entry + (next(hashes),) for entry in changed]
+                    self._apply_manifest_changes(account_id, hashed, removed, scanned=True)
+                    summary["sites"] += 1
+                    summary["files_hashed"] += len(hashed)
+                    summary["files_changed"] += sum(1 for entry in hashed if entry[4] and entry[4] != entry[3])
+                    summary["files_removed"] += len(removed)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        return summary
+    
+    def _link_to_blobs(self, entries, create=True, min_age=0):
+        """Link manifest entries (account_id, site_path, path, size, mtime_ns, hash) to dedup blobs"""
+        summary = {"files_linked": 0, "blobs_created": 0, "bytes_reclaimed": 0, "skipped": 0}
+        cutoff = time.time_ns() - int(min_age * 1e9)
+        relinked = []
+        for account_id, site_path, path, size, mtime_ns, digest in entries:
+            full_path = os.path.join(site_path, MANIFEST_DIR, path)
+            try:
+                st = os.lstat(full_path)
+                # Skip files that changed since they were indexed, or are still being written
+                if (st.st_size, st.st_mtime_ns) != (size, mtime_ns) or st.st_mtime_ns > cutoff:
+                    action, freed = None, 0
+                else:
+                    action, freed = self.dedup.link(full_path, digest, create=create)
+            except OSError:
+                action, freed = None, 0
+            if action is None:
+                summary["skipped"] += 1
+                continue
+            if action == "blob":
+                summary["blobs_created"] += 1
+                continue
+            summary["files_linked"] += 1
+            summary["bytes_reclaimed"] += freed
+            try:
+                relinked.append((os.lstat(full_path).st_mtime_ns, account_id, path))
+            except OSError:
+                pass
+        if relinked:
+            # The link carries the blob's mtime; keep the manifest in step
+            # so the next rescan doesn't re-hash these files
+            with self.transaction() as conn:
+                conn.executemany("UPDATE site_manifest SET mtime_ns = ? WHERE account_id = ? AND path = ?",
+                                 relinked)
+        return summary
+    
+    def dedupe_sites(self, username=None, min_size=DEDUP_MIN_SIZE, min_age=DEDUP_MIN_AGE):
+        """Hardlink identical wwwroot files across sites to shared blobs
+        
+        Works from the content manifest, so run rescan_manifest first.
+        Only contents found in more than one place are touched, and only
+        files unchanged for min_age seconds. Blobs no longer linked from
+        any site are removed afterwards. Returns a summary dict including
+        bytes_reclaimed.
+        """
+        started = time.perf_counter()
+        params = [min_size]
+        account_filter = ""
+        if username:
+            account_filter = "AND a.username = ?"
+            params.append(username)
+        entries = self.connect().execute(f"""
+            SELECT m.account_id, a.site_path, m.path, m.size, m.mtime_ns, m.hash
+            FROM site_manifest m
+            JOIN reseller_accounts a ON a.id = m.account_id
+            WHERE m.deleted = 0 AND m.size >= ? {account_filter}
+              AND m.hash IN (SELECT hash FROM site_manifest WHERE deleted = 0
+                             GROUP BY hash HAVING COUNT(*) > 1)
+            ORDER BY m.hash
+        """, params).fetchall()
+        summary = self._link_to_blobs(entries, min_age=min_age)
+        summary["blobs_removed"], summary["bytes_released"] = self.dedup.collect_garbage()
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        return summary
+    
+    def compress_sites(self, username=None, workers=COMPRESS_WORKERS):
+        """Write missing or stale precompressed variants for existing wwwroot files
+        
+        Catches up sites whose assets were not uploaded over FTP (or were
+        skipped while the compression queue was full). Returns a summary.
+        """
+        query = "SELECT site_path FROM reseller_accounts"
+        params = ()
+        if username:
+            query += " WHERE username = ?"
+            params = (username,)
+        started = time.perf_counter()
+        paths = []
+        for site_path, in self.connect().execute(query, params).fetchall():
+            root = os.path.join(site_path, MANIFEST_DIR)
+            files = scan_files(root)
+            for rel, (size, mtime_ns) in files.items():
+                if not is_compressible(rel) or not COMPRESS_MIN_SIZE <= size <= COMPRESS_MAX_SIZE:
+                    continue
+                # Up to date if every variant we'd write exists with the source's mtime
+                if all(files.get(rel + suffix, (0, -1))[1] >= mtime_ns for _, suffix in asset_encodings()):
+                    continue
+                paths.append(os.path.join(root, *rel.split("/")))
+        
+        def compress(path):
+            try:
+                return compress_asset(path)
+            except OSError:
+                return None
+        
+        summary = {"files": len(paths), "compressed": 0, "skipped": 0, "errors": 0}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for result in pool.map(compress, paths):
+                key = "errors" if result is None else "compressed" if result else "skipped"
+                summary[key] += 1
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        return summary
+    
+    def manifest_changes(self, username, since=0):
+        """Manifest entries changed after version `since`, or None for an unknown account
+        
+        Returns {"version": current version, "changes": [...]}; each change
+        has path, size, hash, deleted and the version it changed in. With
+        since=0 this is the whole manifest (plus tombstones).
+        """
+        conn = self.connect()
+        account = conn.execute("""
+            SELECT a.id, v.version FROM reseller_accounts a
+            LEFT JOIN manifest_versions v ON v.account_id = a.id
+            WHERE a.username = ?
+        """, (username,)).fetchone()
+        if account is None:
+            return None
+        rows = conn.execute("""
+            SELECT path, size, hash, deleted, version FROM site_manifest
+            WHERE account_id = ? AND version > ?
+            ORDER BY version, path
+        """, (account[0], since)).fetchall()
+        return {
+            "version": account[1] or 0,
+            "changes": [
+                {"path": path, "size": size, "hash": digest, "deleted": bool(deleted), "version": version}
+                for path, size, digest, deleted, version in rows
+            ]
+        }
+    
+    def manifest_versions(self, account_ids=None):
+        """Current manifest version of every account that has one (or only of account_ids)"""
+        if account_ids is None:
+            return dict(self.connect().execute("SELECT account_id, version FROM manifest_versions"))
+        account_ids = list(account_ids)
+        versions = {}
+        for offset in range(0, len(account_ids), 500):
+            chunk = account_ids[offset:offset + 500]
+            versions.update(self.connect().execute(
+                f"SELECT account_id, version FROM manifest_versions WHERE account_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ))
+        return versions
+    
+    def manifest_paths_since(self, account_id, since):
+        """Manifest paths (including removed ones) that changed after version `since`"""
+        return [path for path, in self.connect().execute(
+            "SELECT path FROM site_manifest WHERE account_id = ? AND version > ?", (account_id, since)
+        )]
+    
+    def show_manifests(self):
+        """Print manifest version and size per account"""
+        rows = self.connect().execute("""
+            SELECT a.username, v.version, v.scanned_at,
+                   (SELECT COUNT(*) FROM site_manifest m WHERE m.account_id = a.id AND m.deleted = 0)
+            FROM reseller_accounts a
+            LEFT JOIN manifest_versions v ON v.account_id = a.id
+            ORDER BY a.id
+        """).fetchall()
+        if not rows:
+            print("No accounts found.")
+            return
+        print(f"{'USERNAME':<20} {'VERSION':>8} {'FILES':>8}  SCANNED")
+        for name, version, scanned_at, files in rows:
+            print(f"{name:<20} {version or 0:>8} {files:>8}  {scanned_at or 'never'}")
+    
+    def file_event_partitions(self):
+        """Months (YYYYMM) that have a file_events table, oldest first"""
+        rows = self.connect().execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'file_events_[0-9]*'"
+        ).fetchall()
+        return sorted(name[len("file_events_"):] for name, in rows)
+    
+    def _rebuild_file_events_view(self, conn):
+        """Point the file_events view at the current monthly tables"""
+        months = sorted(name[len("file_events_"):] for name, in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'file_events_[0-9]*'"
+        ))
+        conn.execute("DROP VIEW IF EXISTS file_events")
+        if months:
+            conn.execute("CREATE VIEW file_events AS " + " UNION ALL ".join(
+                f"SELECT {', '.join(FILE_EVENT_COLUMNS)} FROM file_events_{month}" for month in months
+            ))
+    
+    def ensure_file_events_partition(self, month, keep_months=FILE_EVENTS_RETENTION_MONTHS):
+        """Create the table for month (YYYYMM) if needed, dropping expired months"""
+        table = f"file_events_{int(month):06d}"
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (table,)).fetchone():
+                return False
+            conn.execute(f"""
+                CREATE TABLE {table} (
+                    id INTEGER PRIMARY KEY,
+                    time TEXT NOT NULL,
+                    account_id INTEGER,
+                    username TEXT,
+                    event TEXT NOT NULL,
+                    path TEXT,
+                    target TEXT,
+                    bytes INTEGER,
+                    ip TEXT
+                )
+            """)
+            conn.execute(f"CREATE INDEX {table}_account ON {table} (account_id, time)")
+            conn.execute(f"CREATE INDEX {table}_time ON {table} (time)")
+            self._rebuild_file_events_view(conn)
+        self.prune_file_events(keep_months)
+        return True
+    
+    def prune_file_events(self, keep_months=FILE_EVENTS_RETENTION_MONTHS):
+        """Drop file_events tables for months before the last keep_months; returns the months dropped
+        
+        keep_months counts calendar months including the current one; 0 keeps everything.
+        """
+        now = datetime.utcnow()
+        cutoff = now.year * 12 + now.month - keep_months
+        expired = [month for month in self.file_event_partitions()
+                   if keep_months > 0 and int(month[:4]) * 12 + int(month[4:]) <= cutoff]
+        if expired:
+            # Dropping a whole month is instant, unlike DELETE of millions of rows
+            with self.transaction() as conn:
+                for month in expired:
+                    conn.execute(f"DROP TABLE IF EXISTS file_events_{month}")
+                self._rebuild_file_events_view(conn)
+        return expired
+    
+    def get_file_events(self, username=None, since=None, until=None, event=None, limit=100):
+        """FTP file events, newest first, as dicts
+        
+        since/until are ISO timestamps or dates (UTC); only the monthly
+        tables overlapping the range are read.
+        """
+        conditions = []
+        params = []
+        if username:
+            row = self.connect().execute(
+                "SELECT id FROM reseller_accounts WHERE username = ?", (username,)
+            ).fetchone()
+            if row is None:
+                return []
+            conditions.append("account_id = ?")
+            params.append(row[0])
+        if since:
+            conditions.append("time >= ?")
+            params.append(since)
+        if until:
+            conditions.append("time < ?")
+            params.append(until)
+        if event:
+            conditions.append("event = ?")
+            params.append(event)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        first = since[:7].replace("-", "") if since else None
+        last = until[:7].replace("-", "") if until else None
+        events = []
+        for month in reversed(self.file_event_partitions()):
+            if (last and month > last) or (first and month < first):
+                continue
+            rows = self.connect().execute(f"""
+                SELECT {', '.join(FILE_EVENT_COLUMNS)} FROM file_events_{month}
+                {where} ORDER BY time DESC LIMIT ?
+            """, params + [limit - len(events)]).fetchall()
+            events.extend(dict(zip(FILE_EVENT_COLUMNS, row)) for row in rows)
+            if len(events) >= limit:
+                break
+        return events
+    
+    def show_file_events(self, username=None, since=None, until=None, event=None, limit=100):
+        """Print FTP file events, newest first"""
+        events = self.get_file_events(username, since, until, event, limit)
+        if not events:
+            print("No file events found.")
+            return
+        print(f"{'TIME':<24} {'USERNAME':<16} {'EVENT':<19} {'BYTES':>10}  PATH")
+        for entry in events:
+            path = entry["path"] if not entry["target"] else f"{entry['path']} -> {entry['target']}"
+            size = entry["bytes"] if entry["bytes"] is not None else ""
+            print(f"{entry['time']:<24} {entry['username'] or '-':<16} {entry['event']:<19} {size:>10}  {path}")
+    
+    def show_usage(self, username=None):
+        """Print indexed disk usage against quota"""
+        query = """
+            SELECT a.username, a.package_type, a.quota_bytes, u.bytes_used, u.file_count, u.reconciled_at
+            FROM reseller_accounts a
+            LEFT JOIN account_usage u ON u.account_id = a.id
+        """
+        params = ()
+        if username:
+            query += " WHERE a.username = ?"
+            params = (username,)
+        rows = self.connect().execute(query + " ORDER BY a.id", params).fetchall()
+        if not rows:
+            print("No accounts found.")
+            return
+        
+        print(f"{'USERNAME':<20} {'USED MB':>10} {'QUOTA MB':>10} {'FILES':>8}  MEASURED")
+        for name, package_type, quota_bytes, used, files, reconciled_at in rows:
+            quota = package_quota(package_type, quota_bytes)
+            quota_text = f"{quota / 1048576:.1f}" if quota is not None else "unlimited"
+            print(f"{name:<20} {(used or 0) / 1048576:>10.1f} {quota_text:>10} {files or 0:>8}  "
+                  f"{reconciled_at or 'never'}")
+
+
+class ProvisioningQueue:
+    """Worker threads that run queued provisioning jobs from the reseller database
+    
+    Jobs live in the provisioning_jobs table, so they survive restarts and
+    several queue processes can share one database. A worker claims a job
+    under BEGIN IMMEDIATE and holds a lease on it. If the worker dies, the
+    lease expires and another worker takes the job over. Failed steps are
+    retried with exponential backoff up to the job's max_attempts. The
+    number of workers caps how many jobs run at once.
+    """
+    
+    def __init__(self, manager, workers=PROVISION_WORKERS, poll_interval=PROVISION_POLL_INTERVAL,
+                 lease=PROVISION_LEASE, retry_delay=PROVISION_RETRY_DELAY):
+        self.manager = manager
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.handlers = {
+            "create_site": self.run_create_site,
+            "remove_site": self.run_remove_site
+        }
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+    
+    def submit(self, username, password, email, site_name, package_type):
+        """Queue a new account (see ResellerManager.enqueue_account); return the job id"""
+        job_id = self.manager.enqueue_account(username, password, email, site_name, package_type)
+        if job_id is not None:
+            self._wakeup.set()
+        return job_id
+    
+    def status(self, job_id):
+        """Return the job dict for job_id, or None"""
+        return self.manager.get_job(job_id)
+    
+    def wait(self, job_id, timeout=None):
+        """Block until a job is done or failed; return its final job dict"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.status(job_id)
+            if job is None or job["status"] in ("done", "failed"):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(0.05)
+    
+    def start(self):
+        """Start the worker threads"""
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"provision-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"✓ Provisioning queue started ({self.workers} workers)")
+    
+    def stop(self):
+        """Stop the workers after their current job"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+    
+    def _claim(self):
+        """Take the next runnable job, or return None"""
+        now = time.time()
+        with self.manager.transaction() as conn:
+            row = conn.execute("""
+                SELECT id, kind, account_id, payload, attempts, max_attempts
+                FROM provisioning_jobs
+                WHERE (status = 'queued' AND run_after <= ?)
+                   OR (status = 'running' AND locked_until < ?)
+                ORDER BY id
+                LIMIT 1
+            """, (now, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("""
+                UPDATE provisioning_jobs
+                SET status = 'running', attempts = attempts + 1, locked_until = ?, updated_at = ?
+                WHERE id = ?
+            """, (now + self.lease, datetime.utcnow().isoformat(), row[0]))
+        keys = ("id", "kind", "account_id", "payload", "attempts", "max_attempts")
+        job = dict(zip(keys, row))
+        job["attempts"] += 1
+        job["payload"] = json.loads(job["payload"])
+        return job
+    
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"✗ [JOB] Error claiming job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self._run(job)
+            except sqlite3.Error as e:
+                # Could not record the outcome; the lease expiry hands the
+                # job to a worker again
+                print(f"✗ [JOB] #{job['id']} Error updating job: {e}")
+    
+    def _run(self, job):
+        try:
+            handler = self.handlers[job["kind"]]
+            if handler(job) is False:
+                print(f"[JOB] #{job['id']} {job['kind']} paused")
+                return
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            now = datetime.utcnow().isoformat()
+            if job["attempts"] >= job["max_attempts"]:
+                with self.manager.transaction() as conn:
+                    conn.execute("""
+                        UPDATE provisioning_jobs
+                        SET status = 'failed', last_error = ?, locked_until = 0, updated_at = ?
+                        WHERE id = ?
+                    """, (error, now, job["id"]))
+                print(f"✗ [JOB] #{job['id']} {job['kind']} failed after {job['attempts']} attempts: {error}")
+            else:
+                delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+                with self.manager.transaction() as conn:
+                    conn.execute("""
+                        UPDATE provisioning_jobs
+                        SET status = 'queued', last_error = ?, run_after = ?, locked_until = 0, updated_at = ?
+                        WHERE id = ?
+                    """, (error, time.time() + delay, now, job["id"]))
+                print(f"✗ [JOB] #{job['id']} {job['kind']} attempt {job['attempts']} failed, "
+                      f"retrying in {delay}s: {error}")
+            return
+        
+        print(f"[JOB] #{job['id']} {job['kind']} done")
+    
+    def _finish(self, conn, job):
+        """Mark a job done inside the handler's final transaction"""
+        conn.execute("""
+            UPDATE provisioning_jobs
+            SET status = 'done', last_error = NULL, locked_until = 0, updated_at = ?
+            WHERE id = ?
+        """, (datetime.utcnow().isoformat(), job["id"]))
+    
+    def run_create_site(self, job):
+        """Build the site folder for a queued account, then activate it"""
+        payload = job["payload"]
+        site_path = Path(payload["site_path"])
+        # Every step is safe to repeat, so a retry just finishes the work
+        self.manager.create_site_dirs(site_path)
+        self.manager.create_default_files(site_path, payload["site_name"], payload["features"], verbose=False)
+        usage = measure_site(site_path)
+        with self.manager.transaction() as conn:
+            conn.execute("""
+                UPDATE reseller_accounts
+                SET status = 'active', updated_at = ?
+                WHERE id = ? AND status = 'provisioning'
+            """, (datetime.utcnow().isoformat(), job["account_id"]))
+            self.manager._store_usage(conn, [(job["account_id"], *usage)])
+            self._finish(conn, job)
+    
+    def run_remove_site(self, job):
+        """Take a terminated account's site folder offline, then archive it or delete it in batches
+        
+        Progress lives in the database: site_path moves to ARCHIVE_DIR or
+        TRASH_DIR together with the rename, and the payload counts deleted
+        entries. A retry, or a worker taking over an expired lease, carries
+        on from there. When the job finishes, the account's username and
+        site name become "<name>~<id>" so both can be used again; the row
+        stays for billing history. Returns False when the queue is
+        stopping; the job is then put back to continue later.
+        """
+        manager = self.manager
+        row = manager.connect().execute(
+            "SELECT site_path, status FROM reseller_accounts WHERE id = ?", (job["account_id"],)
+        ).fetchone()
+        if row is None or row[1] != "terminated":
+            # Deleted, or already reaped by an earlier run
+            with manager.transaction() as conn:
+                self._finish(conn, job)
+            return
+        site_path = Path(row[0])
+        archive = job["payload"].get("archive", False)
+        holding = manager.sites_root / (ARCHIVE_DIR if archive else TRASH_DIR)
+        
+        if holding not in site_path.parents:
+            # One rename takes the whole tree away from FTP sessions and frees its folder name
+            target = holding / f"{site_path.name}-{job['account_id']}"
+            manager.remove_site_links(site_path)
+            holding.mkdir(parents=True, exist_ok=True)
+            if site_path.is_dir() and not site_path.is_symlink():
+                os.rename(site_path, target)
+                manager._remove_empty_buckets(site_path.parent)
+            with manager.transaction() as conn:
+                conn.execute("UPDATE reseller_accounts SET site_path = ?, updated_at = ? WHERE id = ?",
+                             (str(target), datetime.utcnow().isoformat(), job["account_id"]))
+            site_path = target
+        
+        if not archive and not self._remove_tree(job, site_path):
+            return False
+        with manager.transaction() as conn:
+            # "~" can't appear in a username or site folder name, so the
+            # released names never clash with a new account
+            conn.execute("""
+                UPDATE reseller_accounts
+                SET status = ?, username = username || '~' || id, site_name = site_name || '~' || id,
+                    updated_at = ?
+                WHERE id = ?
+            """, ("archived" if archive else "removed", datetime.utcnow().isoformat(), job["account_id"]))
+            self._finish(conn, job)
+    
+    def _remove_tree(self, job, root):
+        """Delete root bottom-up, REAP_BATCH entries at a time; returns False if stopped part way"""
+        payload = job["payload"]
+        done = 0
+        for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+            # Symlinks to folders are listed with the folders but unlinked like files
+            entries = [(name, os.unlink) for name in filenames]
+            entries += [(name, os.unlink if os.path.islink(os.path.join(dirpath, name)) else os.rmdir)
+                        for name in dirnames]
+            for name, remove in entries:
+                try:
+                    remove(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                done += 1
+                if done % REAP_BATCH:
+                    continue
+                # Record progress and renew the lease, then give the disk a break
+                payload["removed"] = payload.get("removed", 0) + REAP_BATCH
+                with self.manager.transaction() as conn:
+                    conn.execute("""
+                        UPDATE provisioning_jobs SET payload = ?, locked_until = ?, updated_at = ? WHERE id = ?
+                    """, (json.dumps(payload), time.time() + self.lease, datetime.utcnow().isoformat(), job["id"]))
+                if self._stop.is_set():
+                    with self.manager.transaction() as conn:
+                        conn.execute("""
+                            UPDATE provisioning_jobs
+                            SET status = 'queued', attempts = attempts - 1, locked_until = 0, updated_at = ?
+                            WHERE id = ?
+                        """, (datetime.utcnow().isoformat(), job["id"]))
+                    return False
+                time.sleep(REAP_PAUSE)
+        try:
+            os.rmdir(root)
+        except FileNotFoundError:
+            pass
+        return True
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after a fixed TTL"""
+    
+    def __init__(self, maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+    
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, key=None):
+        """Drop one key, or every entry when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+    
+    def stats(self):
+        """Return cache counters as a dict"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+class AccountChangeWatcher:
+    """Detects account changes made by other connections to the reseller database
+    
+    PRAGMA data_version only changes when another connection commits, so
+    polling it is nearly free. When it moves, the account_changes log is
+    read from the last seen id to find which usernames were touched.
+    """
+    
+    def __init__(self, db_path, retention=CHANGE_LOG_RETENTION):
+        self.db_path = db_path
+        self._conn = None
+        self._pid = None
+        self.retention = retention
+        self.data_version = self._read_data_version()
+        row = self.conn.execute("SELECT MAX(id) FROM account_changes").fetchone()
+        self.last_change_id = row[0] or 0
+        self._last_prune = time.monotonic()
+    
+    @property
+    def conn(self):
+        """Connection for this process (re-opened after a fork)"""
+        if self._conn is None or self._pid != os.getpid():
+            # A pre-forked worker must not share the parent's SQLite handle
+            self._conn = open_connection(self.db_path)
+            self._pid = os.getpid()
+        return self._conn
+    
+    def _read_data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+    
+    def poll(self):
+        """Return the set of changed usernames since the last poll
+        
+        Returns None when changes may have been missed (the log was pruned
+        past our position), meaning every cached account should be dropped.
+        """
+        self._prune()
+        data_version = self._read_data_version()
+        if data_version == self.data_version:
+            return set()
+        self.data_version = data_version
+        
+        rows = self.conn.execute("""
+            SELECT id, username FROM account_changes
+            WHERE id > ?
+            ORDER BY id
+        """, (self.last_change_id,)).fetchall()
+        if not rows:
+            return set()
+        
+        missed = rows[0][0] != self.last_change_id + 1
+        self.last_change_id = rows[-1][0]
+        if missed:
+            return None
+        return {username for _, username in rows if username is not None}
+    
+    def _prune(self):
+        """Drop change log rows older than the retention window"""
+        if time.monotonic() - self._last_prune < self.retention / 4:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            self.conn.execute(
+                "DELETE FROM account_changes WHERE changed_at < datetime('now', ?)",
+                (f"-{int(self.retention)} seconds",)
+            )
+        except sqlite3.OperationalError:
+            # Database busy; try again on a later poll
+            pass
+    
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+
+class UsageTracker:
+    """Collects per-account disk usage changes from FTP sessions
+    
+    Uploads, deletes and overwrites add byte/file deltas here; they are
+    written to account_usage in one batch by flush() instead of one write
+    per transfer. Quota checks add the unflushed deltas to the indexed
+    value, so they stay accurate between flushes.
+    """
+    
+    def __init__(self, manager):
+        self.manager = manager
+        # Per-session child processes have no flush timer of their own
+        self.flush_on_disconnect = False
+        self._pending = {}
+        self._lock = threading.Lock()
+    
+    def add(self, account_id, bytes_delta, files_delta=0):
+        if not bytes_delta and not files_delta:
+            return
+        with self._lock:
+            size, files = self._pending.get(account_id, (0, 0))
+            self._pending[account_id] = (size + bytes_delta, files + files_delta)
+    
+    def check(self, account_id):
+        """Return (bytes_used, quota_bytes) for an account; quota None = unlimited"""
+        usage = self.manager.get_usage(account_id)
+        if usage is None:
+            return 0, None
+        with self._lock:
+            pending = self._pending.get(account_id, (0, 0))[0]
+        return max(0, usage["bytes_used"] + pending), usage["quota_bytes"]
+    
+    def flush(self):
+        """Write pending deltas to the usage index; returns accounts updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            self.manager.apply_usage_deltas(pending)
+        except sqlite3.Error:
+            # Keep the deltas for the next flush
+            with self._lock:
+                for account_id, (size, files) in pending.items():
+                    current = self._pending.get(account_id, (0, 0))
+                    self._pending[account_id] = (current[0] + size, current[1] + files)
+            raise
+        return len(pending)
+
+
+# Sentinel distinguishing "not cached" from a cached unknown user (None)
+_NOT_CACHED = object()
+
+
+class JSONLogFormatter(logging.Formatter):
+    """Format log records as one JSON object per line"""
+    
+    def format(self, record):
+        entry = {
+            "time": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "event": record.getMessage()
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        elif record.name != FTPEventLog.LOGGER_NAME:
+            # Plain messages from other loggers (pyftpdlib)
+            entry["event"] = record.name
+            entry["message"] = record.getMessage()
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: records are dropped when the queue is full"""
+    
+    def __init__(self, event_log):
+        super().__init__(event_log.queue)
+        self.event_log = event_log
+    
+    def prepare(self, record):
+        # Formatting happens on the writer thread, not the event loop
+        return record
+    
+    def enqueue(self, record):
+        self.event_log.ensure_writer()
+        try:
+            self.event_log.queue.put_nowait(record)
+        except queue.Full:
+            self.event_log.dropped += 1
+            METRICS.ftp_log_dropped.inc()
+
 
-## Getting Started
-1. Upload your website files to the `wwwroot` directory
-2. Customize the default index.html file
-3. Add your content and media files
+class _BlockingSentinelListener(QueueListener):
+    """QueueListener whose stop() waits for room instead of failing on a full queue"""
+    
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
 
-For support, please contact your reseller provider.
-"""
-        
-        with open(site_path / "README.md", "w") as f:
-            f.write(readme_content)
-        
-        print(f"✓ Default files created in {site_path}")
+
+class FTPEventLog:
+    """Queue-backed structured logger for FTP session events
     
-    def list_accounts(self):
-        """List all reseller accounts"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, username, email, site_name, package_type, status, created_at
-            FROM reseller_accounts
-            ORDER BY created_at DESC
-        """)
-        
-        accounts = cursor.fetchall()
-        conn.close()
-        
-        if not accounts:
-            print("No accounts found.")
+    Callers only build a record and put it on a bounded queue; a background
+    thread formats and writes it. When the writer falls behind, new events
+    are dropped and counted rather than slowing down the FTP event loop.
+    """
+    
+    LOGGER_NAME = "reseller.ftp"
+    
+    def __init__(self, level=None, sampling=None, queue_size=FTP_LOG_QUEUE_SIZE, stream=None):
+        level = level or FTP_LOG_LEVEL
+        self.level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+        self.sampling = FTP_LOG_SAMPLING if sampling is None else sampling
+        self.queue_size = queue_size
+        self.stream = stream
+        self.logger = logging.getLogger(self.LOGGER_NAME)
+        self.queue = None
+        self.handler = None
+        self.listener = None
+        self._pid = None
+        self.dropped = 0
+        self.sampled_out = 0
+        self.logged = 0
+    
+    def start(self):
+        """Attach the queue handler and start the writer thread"""
+        self.ensure_writer()
+        self.handler = _DroppingQueueHandler(self)
+        self.logger.setLevel(self.level)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        # pyftpdlib logs every transfer and command itself; keep only its
+        # warnings unless DEBUG is asked for, and route them off the loop too
+        library = logging.getLogger("pyftpdlib")
+        library.setLevel(logging.DEBUG if self.level <= logging.DEBUG else logging.WARNING)
+        library.propagate = False
+        library.addHandler(self.handler)
+        return self
+    
+    def ensure_writer(self):
+        """Start a writer thread for this process (again, after a fork)"""
+        if self._pid == os.getpid():
             return
-        
-        print("\n" + "="*80)
-        print("RESELLER ACCOUNTS")
-        print("="*80)
-        for account in accounts:
-            print(f"\nID: {account[0]}")
-            print(f"Username: {account[1]}")
-            print(f"Email: {account[2]}")
-            print(f"Site Name: {account[3]}")
-            print(f"Package: {PACKAGES.get(account[4], {}).get('name', account[4])}")
-            print(f"Status: {account[5]}")
-            print(f"Created: {account[6]}")
-            print("-" * 80)
+        # Threads do not survive fork(); a pre-forked or per-session child
+        # gets its own queue and writer
+        self._pid = os.getpid()
+        self.queue = queue.Queue(self.queue_size)
+        output = logging.StreamHandler(self.stream or sys.stdout)
+        output.setFormatter(JSONLogFormatter())
+        self.listener = _BlockingSentinelListener(self.queue, output)
+        self.listener.start()
+        register_exit_hook(self, self.stop)
     
-    def get_account_credentials(self, username):
-        """Get account credentials for FTP authorization"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT username, password_hash, site_path, ftp_enabled
-            FROM reseller_accounts
-            WHERE username = ? AND status = 'active'
-        """, (username,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result
+    def event(self, name, level=logging.INFO, **fields):
+        """Log a structured event; cheap enough to call from the event loop"""
+        if not self.logger.isEnabledFor(level):
+            return
+        rate = self.sampling.get(name, 1.0)
+        if level < logging.WARNING and rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return
+        self.logged += 1
+        self.logger.log(level, name, extra={"fields": fields})
     
-    def get_all_active_accounts(self):
-        """Get all active accounts for FTP server"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT username, password_hash, site_path
-            FROM reseller_accounts
-            WHERE status = 'active' AND ftp_enabled = 1
-        """)
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        return results
+    def stop(self):
+        """Flush queued events and stop the writer thread"""
+        listener, self.listener = self.listener, None
+        if listener is not None and self._pid == os.getpid():
+            listener.stop()
+    
+    def close(self):
+        """Stop writing and detach from the loggers"""
+        self.stop()
+        if self.handler is not None:
+            self.logger.removeHandler(self.handler)
+            logging.getLogger("pyftpdlib").removeHandler(self.handler)
+            self.handler = None
+    
+    def stats(self):
+        return {
+            "logged": self.logged,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "queued": self.queue.qsize() if self.queue is not None else 0
+        }
 
 
-class CustomFTPHandler(FTPHandler):
-    """Custom FTP handler with logging"""
+class FileEventWriter:
+    """Batched background writer for the FTP file history (file_events tables)
+    
+    record() only appends a tuple to a bounded queue, so it is safe to
+    call from the FTP event loop. One writer thread per process collects
+    up to `batch_size` events or `flush_interval` seconds' worth and
+    inserts them with a single executemany per monthly table. When the
+    writer falls behind, new events are dropped and counted.
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, manager, batch_size=FILE_EVENTS_BATCH, flush_interval=FILE_EVENTS_FLUSH_INTERVAL,
+                 buffer_size=FILE_EVENTS_BUFFER, keep_months=FILE_EVENTS_RETENTION_MONTHS):
+        self.manager = manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.keep_months = keep_months
+        self.queue = None
+        self.thread = None
+        self._pid = None
+        self._partitions = set()
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.write_errors = 0
+        self.max_queued = 0
+    
+    def ensure_writer(self):
+        """Start a writer thread for this process (again, after a fork)"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self.queue = queue.Queue(self.buffer_size)
+        self.thread = threading.Thread(target=self._run, name="file-events", daemon=True)
+        self.thread.start()
+        register_exit_hook(self, self.stop)
+    
+    def record(self, event, account_id, username, path, target=None, bytes=None, ip=None):
+        """Queue one file event; never blocks"""
+        self.ensure_writer()
+        try:
+            self.queue.put_nowait((time.time(), account_id, username, event, path, target, bytes, ip))
+        except queue.Full:
+            self.dropped += 1
+            return
+        self.recorded += 1
     
-    def on_connect(self):
-        print(f"[FTP] New connection from {self.remote_ip}:{self.remote_port}")
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = max(0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                self._write_with_retry(batch, final=True)
+                return
+            if item is not None:
+                self.max_queued = max(self.max_queued, self.queue.qsize())
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            self._write_with_retry(batch)
+            batch = []
     
-    def on_disconnect(self):
-        print(f"[FTP] Disconnected: {self.username or 'anonymous'}@{self.remote_ip}")
+    def _write_with_retry(self, batch, final=False):
+        """Write a batch, retrying while the database is busy (new events queue up meanwhile)"""
+        while batch:
+            try:
+                self._write(batch)
+                return
+            except sqlite3.Error as e:
+                self.write_errors += 1
+                if final or self.write_errors % 100 == 1:
+                    print(f"✗ Error writing file events: {e}", file=sys.stderr)
+                if final:
+                    self.dropped += len(batch)
+                    return
+                time.sleep(self.flush_interval)
     
-    def on_login(self, username):
-        print(f"[FTP] User logged in: {username}")
+    def _write(self, batch):
+        by_month = {}
+        for timestamp, *fields in batch:
+            when = datetime.utcfromtimestamp(timestamp)
+            by_month.setdefault(when.strftime("%Y%m"), []).append(
+                (when.isoformat(timespec="milliseconds"), *fields)
+            )
+        for month in by_month:
+            if month not in self._partitions:
+                self.manager.ensure_file_events_partition(month, self.keep_months)
+                self._partitions.add(month)
+        placeholders = ", ".join("?" * len(FILE_EVENT_COLUMNS))
+        with self.manager.transaction() as conn:
+            for month, rows in by_month.items():
+                conn.executemany(
+                    f"INSERT INTO file_events_{month} ({', '.join(FILE_EVENT_COLUMNS)}) VALUES ({placeholders})",
+                    rows
+                )
+        self.written += len(batch)
+        self.batches += 1
     
-    def on_file_received(self, file):
-        print(f"[FTP] File uploaded: {file}")
+    def stop(self):
+        """Write everything queued and stop the writer thread"""
+        thread, self.thread = self.thread, None
+        if thread is not None and self._pid == os.getpid():
+            self.queue.put(self._STOP)
+            thread.join()
     
-    def on_file_sent(self, file):
-        print(f"[FTP] File downloaded: {file}")
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "write_errors": self.write_errors,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "max_queued": self.max_queued
+        }
 
 
-class ResellerFTPServer:
-    """FTP Server for reseller accounts"""
+class ManifestUpdater:
+    """Keeps site manifests current for files changed over FTP
     
-    def __init__(self, manager):
+    Handlers only note which paths changed. A background thread re-checks
+    them every `interval` seconds and hashes what actually changed, so
+    file contents are never read on the event loop.
+    """
+    
+    def __init__(self, manager, interval=MANIFEST_UPDATE_INTERVAL):
         self.manager = manager
-        self.server = None
+        self.interval = interval
+        self.thread = None
+        self.updates = 0
+        self.errors = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
     
-    def setup_authorizer(self):
-        """Setup FTP authorizer with reseller accounts"""
-        authorizer = DummyAuthorizer()
-        
-        # Add all active reseller accounts
-        accounts = self.manager.get_all_active_accounts()
-        
-        for username, password_hash, site_path in accounts:
-            # Note: pyftpdlib expects plaintext password for DummyAuthorizer
-            # In production, use a custom authorizer that checks hashed passwords
-            # For now, we'll use a simple approach
+    def ensure_thread(self):
+        """Start the update thread for this process (again, after a fork)"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="manifest", daemon=True)
+        self.thread.start()
+        register_exit_hook(self, self.stop)
+    
+    def touch(self, account_id, site_path, path):
+        """Note that path (absolute) changed; ignored unless it affects the site's wwwroot"""
+        root = os.path.join(site_path, MANIFEST_DIR)
+        rel = os.path.relpath(path, root)
+        if rel == os.curdir:
+            rel = ""
+        elif rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            if os.path.relpath(root, path).startswith(os.pardir):
+                return
+            # A parent of wwwroot was renamed or removed
+            rel = ""
+        self.ensure_thread()
+        with self._lock:
+            self._pending.setdefault(account_id, (site_path, set()))[1].add(rel.replace(os.sep, "/"))
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+    
+    def flush(self):
+        """Update manifests for everything touched so far"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for account_id, (site_path, paths) in pending.items():
             try:
-                authorizer.add_user(
-                    username=username,
-                    password=password_hash[:16],  # Use first 16 chars as temp password
-                    homedir=site_path,
-                    perm="elradfmwMT"  # Full permissions
-                )
-                print(f"✓ Added FTP user: {username} -> {site_path}")
-            except Exception as e:
-                print(f"✗ Error adding FTP user {username}: {e}")
-        
-        return authorizer
+                self.manager.refresh_manifest(account_id, site_path, paths, link_blobs=DEDUP_ON_UPLOAD)
+                self.updates += 1
+            except (sqlite3.Error, OSError) as e:
+                self.errors += 1
+                if self.errors % 100 == 1:
+                    print(f"✗ Error updating manifest: {e}", file=sys.stderr)
+                # Retry on the next tick
+                with self._lock:
+                    self._pending.setdefault(account_id, (site_path, set()))[1].update(paths)
     
-    def start(self):
-        """Start the FTP server"""
+    def stop(self):
+        """Apply pending updates and stop the update thread"""
+        thread, self.thread = self.thread, None
+        if thread is not None and self._pid == os.getpid():
+            self._stop.set()
+            thread.join()
+            self.flush()
+
+
+class AssetCompressor:
+    """Writes precompressed variants of text assets uploaded over FTP
+    
+    submit() runs on the FTP event loop and only hands the path to a small
+    thread pool (zlib and brotli release the GIL while compressing). At
+    most `max_pending` files wait at once; beyond that uploads are skipped
+    and counted, and `reseller.py compress` can catch them up later. A file
+    uploaded again before its turn is compressed once.
+    """
+    
+    def __init__(self, workers=COMPRESS_WORKERS, max_pending=COMPRESS_QUEUE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = None
+        self._pid = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.errors = 0
+    
+    def ensure_pool(self):
+        """Start the worker threads for this process (again, after a fork)"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compress")
+        register_exit_hook(self, self.stop)
+    
+    def submit(self, path):
+        """Queue path (absolute) if it is a compressible asset; never blocks"""
+        if not self.workers or not is_compressible(path):
+            return False
+        self.ensure_pool()
+        with self._lock:
+            if path in self._pending:
+                return True
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            if self.executor is None:
+                # Stopped; the server is shutting down
+                return False
+            self._pending.add(path)
+        self.executor.submit(self._compress, path)
+        return True
+    
+    def _compress(self, path):
+        with self._lock:
+            # A new upload from here on queues the file again
+            self._pending.discard(path)
         try:
-            authorizer = self.setup_authorizer()
-            
-            handler = CustomFTPHandler
-            handler.authorizer = authorizer
-            handler.banner = "AGP CMS Reseller FTP Server Ready"
-            
-            # Set passive ports
-            handler.passive_ports = range(60000, 60100)
-            
-            self.server = FTPServer((FTP_HOST, FTP_PORT), handler)
-            
-            # Set limits
-            self.server.max_cons = 256
-            self.server.max_cons_per_ip = 5
-            
-            print(f"\n{'='*80}")
-            print(f"FTP SERVER STARTED")
-            print(f"{'='*80}")
-            print(f"Host: {FTP_HOST}")
-            print(f"Port: {FTP_PORT}")
-            print(f"Max Connections: {self.server.max_cons}")
-            print(f"Max Connections per IP: {self.server.max_cons_per_ip}")
-            print(f"{'='*80}\n")
-            
-            # Start serving
-            self.server.serve_forever()
-            
-        except PermissionError:
-            print(f"\n✗ Error: Permission denied to bind to port {FTP_PORT}")
-            print(f"  On Unix/Linux, you need root privileges to use port 21.")
-            print(f"  Try running: sudo python3 {sys.argv[0]} ftp")
-            print(f"  Or use a port > 1024 by editing FTP_PORT in the script")
-            sys.exit(1)
-        except Exception as e:
-            print(f"✗ Error starting FTP server: {e}")
-            sys.exit(1)
+            written = compress_asset(path)
+        except OSError as e:
+            with self._lock:
+                self.errors += 1
+                errors = self.errors
+            if errors % 100 == 1 and not isinstance(e, FileNotFoundError):
+                print(f"✗ Error compressing {path}: {e}", file=sys.stderr)
+            return
+        with self._lock:
+            if written:
+                self.compressed += 1
+            else:
+                self.skipped += 1
     
     def stop(self):
-        """Stop the FTP server"""
-        if self.server:
-            self.server.close_all()
+        """Finish queued files and stop the worker threads"""
+        executor, self.executor = self.executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=True)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "compressed": self.compressed,
+                "skipped": self.skipped,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "pending": len(self._pending)
+            }
+
+
+class TokenBucket:
+    """Token bucket refilled at rate bytes/second, holding at most one second of tokens
+    
+    consume() always succeeds and may leave the bucket in debt; the
+    returned delay is how long the caller should pause to pay it back.
+    """
+    
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+    
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def set_rate(self, rate, now):
+        self._refill(now)
+        self.rate = rate
+        self.tokens = min(self.tokens, rate)
+    
+    def consume(self, amount, now):
+        """Take amount tokens; return seconds to wait (0.0 when within the rate)"""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class ThroughputMeter:
+    """Byte counter with a recent bytes/second estimate"""
+    
+    WINDOW = 5  # Seconds averaged by rate()
+    
+    def __init__(self):
+        self.total = 0
+        self.last_active = time.monotonic()
+        self._window_start = self.last_active
+        self._window_bytes = 0
+        self._rate = 0.0
+    
+    def _roll(self, now):
+        elapsed = now - self._window_start
+        if elapsed >= self.WINDOW:
+            self._rate = self._window_bytes / elapsed
+            self._window_start = now
+            self._window_bytes = 0
+    
+    def add(self, amount, now):
+        self._roll(now)
+        self.total += amount
+        self._window_bytes += amount
+        self.last_active = now
+    
+    def rate(self, now):
+        self._roll(now)
+        return self._rate
+
+
+class _AccountBandwidth:
+    """Bandwidth state of one account in a BandwidthScheduler"""
+    
+    def __init__(self, username):
+        self.username = username
+        self.limits = {"read": 0, "write": 0}
+        self.transfers = {"read": 0, "write": 0}
+        self.buckets = {"read": TokenBucket(), "write": TokenBucket()}
+        self.meters = {"read": ThroughputMeter(), "write": ThroughputMeter()}
+
+
+class BandwidthScheduler:
+    """Shares FTP bandwidth between accounts with per-account token buckets
+    
+    All transfers of an account in one direction draw from the same bucket,
+    so opening more connections does not raise its speed. The bucket rate is
+    the account's own limit, lowered to a max-min fair share of the global
+    limit among the accounts transferring in that direction: accounts that
+    need less than an equal share keep their limit and the rest is split
+    evenly between the others.
+    """
+    
+    DIRECTIONS = ("read", "write")
+    
+    def __init__(self, read_limit=0, write_limit=0):
+        self.global_limits = {"read": read_limit, "write": write_limit}
+        self._accounts = {}
+        self._lock = threading.Lock()
+    
+    def open(self, account_id, username, direction, limit):
+        """Register a transfer; limit is the account's own bytes/second (0 = none)"""
+        with self._lock:
+            account = self._accounts.get(account_id)
+            if account is None:
+                account = self._accounts[account_id] = _AccountBandwidth(username)
+            account.limits[direction] = limit
+            account.transfers[direction] += 1
+            self._rebalance(direction)
+    
+    def close(self, account_id, direction):
+        with self._lock:
+            account = self._accounts.get(account_id)
+            if account is None or not account.transfers[direction]:
+                return
+            account.transfers[direction] -= 1
+            self._rebalance(direction)
+    
+    def set_limits(self, account_id, read_limit, write_limit):
+        """Apply changed account limits to transfers already running"""
+        with self._lock:
+            account = self._accounts.get(account_id)
+            if account is None:
+                return
+            account.limits = {"read": read_limit, "write": write_limit}
+            for direction in self.DIRECTIONS:
+                self._rebalance(direction)
+    
+    def active_accounts(self):
+        """{account_id: username} for accounts with transfers in progress"""
+        with self._lock:
+            return {
+                account_id: account.username for account_id, account in self._accounts.items()
+                if any(account.transfers.values())
+            }
+    
+    def consume(self, account_id, direction, amount):
+        """Count amount bytes; return seconds the transfer should pause"""
+        now = time.monotonic()
+        with self._lock:
+            account = self._accounts.get(account_id)
+            if account is None:
+                return 0.0
+            account.meters[direction].add(amount, now)
+            return account.buckets[direction].consume(amount, now)
+    
+    def _rebalance(self, direction):
+        """Recompute bucket rates for one direction (lock held)"""
+        now = time.monotonic()
+        active = [account for account in self._accounts.values() if account.transfers[direction]]
+        remaining = self.global_limits[direction]
+        if not remaining:
+            for account in active:
+                account.buckets[direction].set_rate(account.limits[direction], now)
+            return
+        
+        # Water-filling: serve the smallest demands first, then share what is left
+        active.sort(key=lambda account: account.limits[direction] or float("inf"))
+        for index, account in enumerate(active):
+            share = remaining / (len(active) - index)
+            own = account.limits[direction]
+            rate = min(own, share) if own else share
+            account.buckets[direction].set_rate(max(1, int(rate)), now)
+            remaining -= rate
+    
+    def stats(self, idle=None):
+        """Per-username throughput counters
+        
+        Accounts without running transfers that have been idle for more than
+        idle seconds are dropped after being reported.
+        """
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for account_id, account in list(self._accounts.items()):
+                entry = {}
+                for direction in self.DIRECTIONS:
+                    meter = account.meters[direction]
+                    entry[f"{direction}_bytes"] = meter.total
+                    entry[f"{direction}_rate"] = round(meter.rate(now))
+                    entry[f"{direction}_limit"] = account.buckets[direction].rate
+                    entry[f"{direction}_transfers"] = account.transfers[direction]
+                result[account.username] = entry
+                last_active = max(meter.last_active for meter in account.meters.values())
+                if idle is not None and not any(account.transfers.values()) and now - last_active > idle:
+                    del self._accounts[account_id]
+        return result
 
 
 def print_banner():
@@ -461,6 +4192,36 @@ def show_package_menu():
     print("-" * 40)
 
 
+def validate_account_field(field, value):
+    """Error message for one account field, or None if the value is acceptable"""
+    if field == "username":
+        if not value or len(value) < 3 or len(value) > 20:
+            return "Username must be 3-20 characters"
+        if not value.isalnum():
+            return "Username must be alphanumeric"
+    elif field == "password":
+        if not value or len(value) < 6:
+            return "Password must be at least 6 characters"
+    elif field == "email":
+        if not value or "@" not in value:
+            return "Invalid email address"
+    elif field == "site_name":
+        if not value:
+            return "Site name is required"
+    elif field == "package_type":
+        if value not in PACKAGES:
+            return f"Package must be one of: {', '.join(sorted(PACKAGES))}"
+    return None
+
+
+def validate_account(username, password, email, site_name, package_type):
+    """Error messages for a new account (the rules of the interactive prompts); empty if valid"""
+    fields = {"username": username, "password": password, "email": email,
+              "site_name": site_name, "package_type": package_type}
+    errors = (validate_account_field(field, value) for field, value in fields.items())
+    return [error for error in errors if error]
+
+
 def create_new_account(manager):
     """Interactive account creation"""
     print("\n" + "="*80)
@@ -470,19 +4231,18 @@ def create_new_account(manager):
     # Get username
     while True:
         username = input("Enter username (alphanumeric, 3-20 chars): ").strip()
-        if not username or len(username) < 3 or len(username) > 20:
-            print("✗ Username must be 3-20 characters")
-            continue
-        if not username.isalnum():
-            print("✗ Username must be alphanumeric")
+        error = validate_account_field("username", username)
+        if error:
+            print(f"✗ {error}")
             continue
         break
     
     # Get password
     while True:
         password = input("Enter password (min 6 chars): ").strip()
-        if len(password) < 6:
-            print("✗ Password must be at least 6 characters")
+        error = validate_account_field("password", password)
+        if error:
+            print(f"✗ {error}")
             continue
         confirm = input("Confirm password: ").strip()
         if password != confirm:
@@ -492,15 +4252,17 @@ def create_new_account(manager):
     
     # Get email
     email = input("Enter email address: ").strip()
-    if not email or "@" not in email:
-        print("✗ Invalid email address")
+    error = validate_account_field("email", email)
+    if error:
+        print(f"✗ {error}")
         return
     
     # Get site name
     while True:
         site_name = input("Enter website name (e.g., 'My Cool Site'): ").strip()
-        if not site_name:
-            print("✗ Site name is required")
+        error = validate_account_field("site_name", site_name)
+        if error:
+            print(f"✗ {error}")
             continue
         break
     
@@ -536,30 +4298,464 @@ def create_new_account(manager):
         print("\nNEXT STEPS:")
         print("1. Start the FTP server (Option 3 from main menu)")
         print(f"2. Connect via FTP to upload your files")
-        print(f"3. Your site files will be in: {SITES_ROOT}/{site_name.lower().replace(' ', '-')}")
+        print(f"3. Your site files will be in: {manager.site_path_for(manager.safe_site_name(site_name))}")
 
 
-def main():
-    """Main application entry point"""
-    print_banner()
+def load_ftp_server():
+    """Import the FTP server (and pyftpdlib) on first use; exits with install hints if missing"""
+    try:
+        from reseller_ftp import ResellerFTPServer
+    except ImportError as e:
+        if not (e.name or "").startswith("pyftpdlib"):
+            raise
+        print("✗ Error: pyftpdlib is not installed")
+        print("\nTo install dependencies, run:")
+        print("  pip install pyftpdlib")
+        sys.exit(1)
+    return ResellerFTPServer
+
+
+# Classes that moved to the server modules stay importable from here
+_LAZY_ATTRIBUTES = {
+    "DatabaseAuthorizer": "reseller_ftp",
+    "LoopThreadPool": "reseller_ftp",
+    "AccountThrottledDTPHandler": "reseller_ftp",
+    "CustomFTPHandler": "reseller_ftp",
+    "ResellerFTPServer": "reseller_ftp",
+    "StaticFile": "reseller_http",
+    "StaticFileCache": "reseller_http",
+    "StaticSiteServer": "reseller_http"
+}
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module), name)
+
+
+def create_command(args):
+    """Non-interactive account creation: reseller.py create USERNAME ..."""
+    password = os.environ.get(args.password_env) if args.password_env else None
+    if args.password_stdin:
+        password = sys.stdin.readline().rstrip("\r\n")
+    if password is None:
+        print("✗ Error: give the password with --password-stdin or --password-env VAR", file=sys.stderr)
+        sys.exit(2)
+    errors = validate_account(args.username, password, args.email, args.site_name, args.package)
+    if errors:
+        for error in errors:
+            print(f"✗ {error}", file=sys.stderr)
+        sys.exit(2)
     
-    # Initialize manager
     manager = ResellerManager()
+    if args.queue:
+        job_id = manager.enqueue_account(args.username, password, args.email, args.site_name, args.package)
+        if not job_id:
+            sys.exit(1)
+        print(f"✓ Account '{args.username}' queued (job {job_id})")
+    elif not manager.create_account(args.username, password, args.email, args.site_name, args.package):
+        sys.exit(1)
+
+
+def list_command(args):
+    """Non-interactive account listing: reseller.py list [options]"""
+    filters = {
+        "status": args.status,
+        "package_type": args.package,
+        "feature": args.feature,
+        "before": args.before,
+        "page_size": args.page_size
+    }
+    manager = ResellerManager()
+    if args.format == "text":
+        manager.list_accounts(limit=args.limit, **filters)
+        return
     
-    # Check for command line arguments
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "ftp":
-            # Start FTP server directly
-            ftp_server = ResellerFTPServer(manager)
-            try:
-                ftp_server.start()
-            except KeyboardInterrupt:
-                print("\n\nShutting down FTP server...")
-                ftp_server.stop()
-                print("✓ FTP server stopped")
-            return
+    # Keep stdout clean for the machine-readable stream
+    with redirect_stdout(sys.stderr):
+        manager.init_database()
+    try:
+        manager.export_accounts(sys.stdout, args.format, limit=args.limit, **filters)
+    except BrokenPipeError:
+        # Reader went away (e.g. piped into head)
+        sys.stderr.close()
+
+
+def import_command(args):
+    """Import accounts from a CSV or JSON Lines file, resuming an interrupted run"""
+    manager = ResellerManager()
+    errors = open(args.errors, "a", encoding="utf-8") if args.errors else None
+    try:
+        result = manager.import_accounts(args.file, fmt=args.format, chunk_size=args.chunk_size,
+                                         workers=args.workers, restart=args.restart, errors=errors)
+    except KeyboardInterrupt:
+        print("\n✗ Import interrupted; run the same command again to resume", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        if errors is not None:
+            errors.close()
+    if result is None:
+        sys.exit(1)
+
+
+def suspend_command(args):
+    """Suspend (or with --resume, reactivate) accounts"""
+    manager = ResellerManager()
+    failed = 0
+    for username in args.usernames:
+        if args.resume:
+            changed, state = manager.resume_account(username), "resumed"
+        else:
+            changed, state = manager.suspend_account(username), "suspended"
+        if changed:
+            print(f"✓ Account '{username}' {state}")
+        else:
+            print(f"✗ Account '{username}' not found or not {'suspended' if args.resume else 'active'}",
+                  file=sys.stderr)
+            failed += 1
+    if failed:
+        sys.exit(1)
+
+
+def terminate_command(args):
+    """Terminate accounts; a `worker` process removes (or archives) their sites"""
+    manager = ResellerManager()
+    failed = 0
+    for username in args.usernames:
+        job_id = manager.terminate_account(username, archive=args.archive or None)
+        if job_id:
+            print(f"✓ Account '{username}' terminated; its site will be "
+                  f"{'archived' if args.archive or TERMINATE_ARCHIVE else 'removed'} by job {job_id}")
+        else:
+            print(f"✗ Account '{username}' not found or not active or suspended", file=sys.stderr)
+            failed += 1
+    if failed:
+        sys.exit(1)
+
+
+def relayout_command(args):
+    """Move site folders into another layout, or remove the links left by a move"""
+    manager = ResellerManager()
+    if args.prune_links:
+        manager.prune_site_links()
+        return
+    result = manager.relayout_sites(args.to, batch_size=args.batch_size, pause=args.pause,
+                                    limit=args.limit, links=not args.no_links)
+    if result["failed"]:
+        sys.exit(1)
+
+
+def worker_command(args):
+    """Run queued provisioning jobs until interrupted"""
+    manager = ResellerManager()
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = MetricsServer(port=args.metrics_port)
+        metrics_server.start()
+        print(f"✓ Metrics: {metrics_server.url}")
+    jobs = ProvisioningQueue(manager)
+    jobs.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\n\nStopping provisioning workers...")
+        jobs.stop()
+        if metrics_server:
+            metrics_server.stop()
+        print("✓ Provisioning workers stopped")
+
+
+def ftp_command(args):
+    """Start the FTP server directly"""
+    ftp_server = load_ftp_server()(ResellerManager(), mode=args.mode, workers=args.workers,
+                                   max_cons=args.max_cons, max_cons_per_ip=args.max_cons_per_ip,
+                                   log_level=args.log_level, metrics_port=args.metrics_port)
+    try:
+        ftp_server.start()
+    except KeyboardInterrupt:
+        pass
+    # pyftpdlib handles Ctrl+C itself and returns from serve_forever
+    print("\n\nShutting down FTP server...")
+    ftp_server.stop()
+    print("✓ FTP server stopped")
+
+
+def serve_command(args):
+    """Serve every site's wwwroot over HTTP"""
+    from reseller_http import StaticSiteServer
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = MetricsServer(port=args.metrics_port).start()
+        print(f"✓ Metrics: {metrics_server.url}")
+    http_server = StaticSiteServer(ResellerManager(), host=args.host, port=args.port, cache_mb=args.cache_mb)
+    http_server.start()
+    print("\n\nShutting down HTTP server...")
+    http_server.stop()
+    if metrics_server:
+        metrics_server.stop()
+    print("✓ HTTP server stopped")
+
+
+def usage_command(args):
+    """Disk usage index: report, re-measure, set per-account quotas"""
+    manager = ResellerManager()
+    if args.set_quota is not None:
+        if not args.username:
+            args.parser.error("--set-quota needs a username")
+        quota = None if args.set_quota < 0 else args.set_quota * 1024 * 1024
+        if not manager.set_quota(args.username, quota):
+            print(f"✗ Account '{args.username}' not found")
+            sys.exit(1)
+        print(f"✓ Quota for '{args.username}' updated")
+    if args.reconcile:
+        started = time.perf_counter()
+        measured = manager.reconcile_usage()
+        print(f"✓ Measured {measured} site(s) in {time.perf_counter() - started:.1f}s")
+    manager.show_usage(args.username)
+
+
+def manifest_command(args):
+    """Content manifest of each site's wwwroot"""
+    manager = ResellerManager()
+    if args.rescan:
+        summary = manager.rescan_manifest(args.username, workers=args.workers)
+        print(f"✓ Rescanned {summary['sites']} site(s) in {summary['seconds']}s: "
+              f"{summary['files_hashed']} hashed, {summary['files_changed']} changed, "
+              f"{summary['files_removed']} removed")
+    if not args.username:
+        manager.show_manifests()
+        return
+    result = manager.manifest_changes(args.username, args.since)
+    if result is None:
+        print(f"✗ Account '{args.username}' not found")
+        sys.exit(1)
+    print(f"Manifest version {result['version']}, {len(result['changes'])} change(s) since {args.since}")
+    for change in result["changes"]:
+        if change["deleted"]:
+            print(f"  v{change['version']:<6} deleted  {change['path']}")
+        else:
+            print(f"  v{change['version']:<6} {change['hash'][:12]}  {change['path']} ({change['size']} bytes)")
+
+
+def dedupe_command(args):
+    """Share identical files between sites"""
+    manager = ResellerManager()
+    if not args.stats:
+        scanned = manager.rescan_manifest(args.username)
+        print(f"✓ Manifest updated: {scanned['files_hashed']} file(s) hashed in {scanned['seconds']}s")
+        summary = manager.dedupe_sites(args.username, min_size=args.min_size)
+        print(f"✓ Deduplicated in {summary['seconds']}s: {summary['files_linked']} file(s) linked, "
+              f"{summary['blobs_created']} new blob(s), {summary['skipped']} skipped")
+        print(f"  Reclaimed: {summary['bytes_reclaimed'] / 1048576:.1f} MB")
+        if summary["blobs_removed"]:
+            print(f"  Removed {summary['blobs_removed']} unused blob(s) "
+                  f"({summary['bytes_released'] / 1048576:.1f} MB)")
+    stats = manager.dedup.stats()
+    print(f"Blob store: {stats['blobs']} blob(s), {stats['bytes_stored'] / 1048576:.1f} MB stored, "
+          f"{stats['bytes_saved'] / 1048576:.1f} MB saved by sharing")
+
+
+def compress_command(args):
+    """Precompressed variants for assets not uploaded over FTP"""
+    summary = ResellerManager().compress_sites(args.username, workers=args.workers)
+    encodings = ", ".join(suffix for _, suffix in asset_encodings())
+    print(f"✓ Checked {summary['files']} outdated asset(s) in {summary['seconds']}s: "
+          f"{summary['compressed']} compressed ({encodings}), {summary['skipped']} not worth it, "
+          f"{summary['errors']} errors")
+
+
+def events_command(args):
+    """FTP upload/download/delete history"""
+    ResellerManager().show_file_events(args.username, args.since, args.until, args.event, args.limit)
+
+
+def bandwidth_command(args):
+    """Per-account FTP speed limits"""
+    manager = ResellerManager()
+    limits = {}
+    for column, value in (("read_limit", args.read_kb), ("write_limit", args.write_kb)):
+        if value is not None:
+            limits[column] = None if value < 0 else value * 1024
+    if not manager.set_bandwidth(args.username, **limits):
+        print(f"✗ Account '{args.username}' not found")
+        sys.exit(1)
+    row = manager.connect().execute(
+        "SELECT package_type, read_limit, write_limit FROM reseller_accounts WHERE username = ?",
+        (args.username,)
+    ).fetchone()
+    read_limit, write_limit = package_bandwidth(*row)
+    print(f"{args.username}: upload {format_rate(read_limit)}, download {format_rate(write_limit)}")
+
+
+def build_parser():
+    """Command line parser; each subcommand sets `func` to its *_command function"""
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(sys.argv[0]) or "reseller.py",
+        description="AGP CMS reseller provisioning and FTP server. Without a command, "
+                    "runs the interactive menu.",
+        epilog="Any command also takes --profile, --profile-output FILE, --profile-cprofile FILE "
+               "and --profile-window SECONDS."
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    
+    def command(name, func, summary):
+        sub = commands.add_parser(name, help=summary, description=summary)
+        sub.set_defaults(func=func, parser=sub)
+        return sub
     
-    # Interactive menu
+    sub = command("create", create_command, "Create an account without prompts")
+    sub.add_argument("username")
+    sub.add_argument("--email", required=True)
+    sub.add_argument("--site-name", required=True, help="Website name, e.g. 'My Cool Site'")
+    sub.add_argument("--package", choices=sorted(PACKAGES), default="4",
+                     help="Package type (default: %(default)s, " +
+                          ", ".join(f"{key} = {package['name']}" for key, package in PACKAGES.items()) + ")")
+    sub.add_argument("--password-stdin", action="store_true", help="Read the password from the first line of stdin")
+    sub.add_argument("--password-env", metavar="VAR", help="Read the password from this environment variable")
+    sub.add_argument("--queue", action="store_true",
+                     help="Only record the account; a `worker` process builds the site folder")
+    
+    sub = command("list", list_command, "List reseller accounts")
+    sub.add_argument("--format", choices=["text", "jsonl", "csv"], default="text")
+    sub.add_argument("--status", help="Only accounts with this status (e.g. active)")
+    sub.add_argument("--package", choices=sorted(PACKAGES), help="Only accounts with this package type")
+    sub.add_argument("--feature", help="Only accounts with this feature enabled (e.g. blog)")
+    sub.add_argument("--before", help="Only accounts created before this ISO timestamp")
+    sub.add_argument("--limit", type=int, help="Stop after this many accounts")
+    sub.add_argument("--page-size", type=int, default=LIST_PAGE_SIZE)
+    
+    sub = command("import", import_command, "Create accounts from a CSV or JSON Lines file (resumable)")
+    sub.add_argument("file", help="Rows with username, password, email, site_name and package_type")
+    sub.add_argument("--format", choices=["csv", "jsonl"], help="File format (default: from the extension)")
+    sub.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE,
+                     help="Rows per committed checkpoint (default: %(default)s)")
+    sub.add_argument("--workers", type=int, default=BULK_WORKERS,
+                     help="Threads building site folders (default: %(default)s)")
+    sub.add_argument("--errors", metavar="FILE", help="Append rejected rows to this file as JSON lines")
+    sub.add_argument("--restart", action="store_true",
+                     help="Ignore the saved checkpoint and import the file from the first row")
+    
+    sub = command("suspend", suspend_command, "Suspend accounts (FTP logins are refused, files are kept)")
+    sub.add_argument("usernames", nargs="+", metavar="username")
+    sub.add_argument("--resume", action="store_true", help="Reactivate suspended accounts instead")
+    
+    sub = command("terminate", terminate_command,
+                  "Terminate accounts (FTP servers drop them within RELOAD_INTERVAL seconds; "
+                  "a `worker` removes their sites)")
+    sub.add_argument("usernames", nargs="+", metavar="username")
+    sub.add_argument("--archive", action="store_true",
+                     help="Keep the site folders in SITES_ROOT/.archive instead of deleting them")
+    
+    sub = command("relayout", relayout_command, "Move existing site folders into another layout (online)")
+    sub.add_argument("--to", choices=SITES_LAYOUTS, default=SITES_LAYOUT,
+                     help="Target layout (default: SITES_LAYOUT, currently %(default)s)")
+    sub.add_argument("--batch-size", type=int, default=RELAYOUT_BATCH, help="Sites per batch (default: %(default)s)")
+    sub.add_argument("--pause", type=float, default=RELAYOUT_PAUSE,
+                     help="Seconds to wait between batches (default: %(default)s)")
+    sub.add_argument("--limit", type=int, help="Stop after moving this many sites")
+    sub.add_argument("--no-links", action="store_true",
+                     help="Don't leave symlinks at the old paths (only when no FTP server is running)")
+    sub.add_argument("--prune-links", action="store_true",
+                     help="Remove the symlinks an earlier move left behind, then exit")
+    
+    sub = command("ftp", ftp_command, "Run the reseller FTP server")
+    sub.add_argument("--mode", choices=FTP_MODES, default=FTP_MODE,
+                     help="Concurrency model (default: %(default)s)")
+    sub.add_argument("--workers", type=int, default=FTP_WORKERS,
+                     help="Pre-forked processes in async mode, 0 = one per core (default: %(default)s)")
+    sub.add_argument("--max-cons", type=int, default=FTP_MAX_CONS,
+                     help="Max simultaneous sessions (default: %(default)s)")
+    sub.add_argument("--max-cons-per-ip", type=int, default=FTP_MAX_CONS_PER_IP,
+                     help="Max sessions per client IP (default: %(default)s)")
+    sub.add_argument("--log-level", type=str.upper, default=FTP_LOG_LEVEL,
+                     choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                     help="FTP event log level (default: %(default)s)")
+    sub.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                     help="Serve Prometheus metrics on this port")
+    
+    sub = command("serve", serve_command, "Run the static site HTTP server")
+    sub.add_argument("--host", default=HTTP_HOST, help="Address to listen on (default: %(default)s)")
+    sub.add_argument("--port", type=int, default=HTTP_PORT, help="Port (default: %(default)s)")
+    sub.add_argument("--cache-mb", type=int, default=HTTP_CACHE_MB,
+                     help="Memory for cached small files (default: %(default)s)")
+    sub.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                     help="Serve Prometheus metrics on this port")
+    
+    sub = command("worker", worker_command, "Run queued provisioning jobs")
+    sub.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                     help="Serve Prometheus metrics on this port")
+    
+    sub = command("usage", usage_command, "Show site disk usage")
+    sub.add_argument("username", nargs="?", help="Only show this account")
+    sub.add_argument("--reconcile", action="store_true",
+                     help="Re-measure site folders before reporting")
+    sub.add_argument("--set-quota", type=int, metavar="MB",
+                     help="Override the package quota for USERNAME (-1 = package default)")
+    
+    sub = command("manifest", manifest_command, "Show or rebuild site content manifests")
+    sub.add_argument("username", nargs="?", help="Show this account's changes")
+    sub.add_argument("--rescan", action="store_true",
+                     help="Re-check files on disk, hashing only new or modified ones")
+    sub.add_argument("--since", type=int, default=0, metavar="VERSION",
+                     help="Only list changes after this version")
+    sub.add_argument("--workers", type=int, default=MANIFEST_HASH_WORKERS,
+                     help="Hashing processes for --rescan (0 = one per CPU core)")
+    
+    sub = command("dedupe", dedupe_command, "Hardlink identical site files to shared blobs")
+    sub.add_argument("username", nargs="?", help="Only link this account's files")
+    sub.add_argument("--min-size", type=int, default=DEDUP_MIN_SIZE, metavar="BYTES",
+                     help="Skip files smaller than this (default: %(default)s)")
+    sub.add_argument("--stats", action="store_true", help="Only show blob store statistics")
+    
+    sub = command("compress", compress_command, "Write missing .gz/.br variants of site assets")
+    sub.add_argument("username", nargs="?", help="Only this account")
+    sub.add_argument("--workers", type=int, default=COMPRESS_WORKERS or 1,
+                     help="Compression threads (default: %(default)s)")
+    
+    sub = command("events", events_command, "Show FTP file history")
+    sub.add_argument("username", nargs="?", help="Only show this account")
+    sub.add_argument("--since", help="Start time (UTC), e.g. 2024-05-01 or 2024-05-01T12:00")
+    sub.add_argument("--until", help="End time (UTC, exclusive)")
+    sub.add_argument("--event", help="upload, download, delete, rename, ...")
+    sub.add_argument("--limit", type=int, default=100)
+    
+    sub = command("bandwidth", bandwidth_command, "Show or set FTP bandwidth limits for an account")
+    sub.add_argument("username")
+    sub.add_argument("--read-kb", type=int, metavar="KBPS",
+                     help="Upload limit in KB/s (0 = unlimited, -1 = package default)")
+    sub.add_argument("--write-kb", type=int, metavar="KBPS",
+                     help="Download limit in KB/s (0 = unlimited, -1 = package default)")
+    return parser
+
+
+def configure_profiling(argv):
+    """Enable the profiler from --profile* flags or RESELLER_PROFILE* variables; returns argv without the flags"""
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--profile-output")
+    parser.add_argument("--profile-cprofile")
+    parser.add_argument("--profile-window", type=float)
+    args, rest = parser.parse_known_args(argv)
+    env = os.environ
+    output = args.profile_output or env.get("RESELLER_PROFILE_OUTPUT") or PROFILE_OUTPUT
+    cprofile_path = args.profile_cprofile or env.get("RESELLER_PROFILE_CPROFILE") or PROFILE_CPROFILE
+    window = args.profile_window
+    if window is None:
+        window = float(env.get("RESELLER_PROFILE_WINDOW") or PROFILE_WINDOW)
+    enabled = (args.profile or env.get("RESELLER_PROFILE", "").lower() in ("1", "true", "yes", "on")
+               or PROFILE or bool(args.profile_output or args.profile_cprofile))
+    if enabled:
+        PROFILER.enable(output=output, cprofile_path=cprofile_path, window=window)
+    return rest
+
+
+def interactive_menu():
+    """Banner and main menu (no command given)"""
+    print_banner()
+    manager = ResellerManager()
     while True:
         show_menu()
         choice = input("\nEnter your choice (1-4): ").strip()
@@ -571,7 +4767,7 @@ def main():
         elif choice == "3":
             print("\nStarting FTP server...")
             print("Press Ctrl+C to stop the server\n")
-            ftp_server = ResellerFTPServer(manager)
+            ftp_server = load_ftp_server()(manager)
             try:
                 ftp_server.start()
             except KeyboardInterrupt:
@@ -585,14 +4781,17 @@ def main():
             print("✗ Invalid choice. Please try again.")
 
 
-if __name__ == "__main__":
-    # Check if required module is installed
-    try:
-        import pyftpdlib
-    except ImportError:
-        print("✗ Error: pyftpdlib is not installed")
-        print("\nTo install dependencies, run:")
-        print("  pip install pyftpdlib")
-        sys.exit(1)
+def main():
+    """Main application entry point"""
+    # Profiling flags may appear anywhere on the command line
+    sys.argv[1:] = configure_profiling(sys.argv[1:])
     
+    args = build_parser().parse_args(sys.argv[1:])
+    if args.command is None:
+        interactive_menu()
+        return
+    args.func(args)
+
+
+if __name__ == "__main__":
     main()
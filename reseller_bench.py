@@ -0,0 +1,790 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the AGP CMS Reseller System
+Every benchmark runs on localhost against a throwaway database and sites folder
+"""
+
+import argparse
+import ftplib
+import http.client
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+import reseller
+from reseller import ResellerManager, MANIFEST_DIR, PACKAGES, hash_password
+from reseller_ftp import ResellerFTPServer
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(samples):
+    """Summarize latency samples (seconds) in milliseconds"""
+    return {
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0
+    }
+
+
+def seed_accounts(conn, count, prefix="seed", password_hash="0" * 64, sites_root=None):
+    """Insert count account rows directly for lookup tests
+    
+    Site folders are only created when sites_root is given (needed for FTP
+    logins). Every account gets the same password_hash.
+    """
+    now = datetime.utcnow().isoformat()
+    rows = []
+    for i in range(count):
+        site_path = f"sites/{prefix}{i}"
+        if sites_root is not None:
+            site_path = os.path.join(sites_root, f"{prefix}{i}")
+            for name in reseller.SITE_DIRS:
+                os.makedirs(os.path.join(site_path, name), exist_ok=True)
+        rows.append((f"{prefix}{i}", password_hash, f"{prefix}{i}@example.com", f"{prefix} site {i}", "4",
+                     site_path, now, now))
+    conn.execute("BEGIN")
+    conn.executemany("""
+        INSERT INTO reseller_accounts
+        (username, password_hash, email, site_name, package_type, site_path, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.execute("COMMIT")
+
+
+class LegacyAccess:
+    """Connection-per-call access with the rollback journal (pre-WAL behaviour)"""
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+    
+    def lookup(self, username):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("""
+                SELECT id, username, password_hash, site_path
+                FROM reseller_accounts
+                WHERE username = ? AND status = 'active' AND ftp_enabled = 1
+            """, (username,)).fetchone()
+        finally:
+            conn.close()
+    
+    def provision(self, username, now):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute("""
+                INSERT INTO reseller_accounts
+                (username, password_hash, email, site_name, package_type, site_path, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (username, "0" * 64, f"{username}@example.com", username, "4", username, now, now))
+            for feature in PACKAGES["4"]["features"]:
+                conn.execute(
+                    "INSERT INTO site_features (account_id, feature_name, enabled) VALUES (?, ?, 1)",
+                    (cursor.lastrowid, feature)
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class ManagedAccess:
+    """Access through ResellerManager's per-thread WAL connections"""
+    
+    def __init__(self, manager):
+        self.manager = manager
+    
+    def lookup(self, username):
+        return self.manager.get_ftp_account(username)
+    
+    def provision(self, username, now):
+        with self.manager.transaction() as conn:
+            cursor = conn.execute("""
+                INSERT INTO reseller_accounts
+                (username, password_hash, email, site_name, package_type, site_path, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (username, "0" * 64, f"{username}@example.com", username, "4", username, now, now))
+            conn.executemany(
+                "INSERT INTO site_features (account_id, feature_name, enabled) VALUES (?, ?, 1)",
+                [(cursor.lastrowid, feature) for feature in PACKAGES["4"]["features"]]
+            )
+
+
+def bench_lookup_under_write(mode="managed", accounts=2000, lookups=5000, writers=2):
+    """Measure FTP account lookup latency while writer threads provision accounts
+
+    mode is "managed" (ResellerManager connections, WAL) or "legacy"
+    (a new connection per call on a rollback-journal database).
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="reseller-bench-"))
+    manager = ResellerManager(db_path=str(workdir / "bench.db"), sites_root=str(workdir / "sites"))
+    try:
+        seed_accounts(manager.connect(), accounts)
+        if mode == "legacy":
+            manager.close()
+            conn = sqlite3.connect(manager.db_path)
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.close()
+            access = LegacyAccess(manager.db_path)
+        else:
+            access = ManagedAccess(manager)
+        
+        stop = threading.Event()
+        counters = {"writes": 0, "write_errors": 0}
+        counters_lock = threading.Lock()
+        
+        def writer(worker_id):
+            n = 0
+            while not stop.is_set():
+                now = datetime.utcnow().isoformat()
+                try:
+                    access.provision(f"w{worker_id}x{n}", now)
+                    key = "writes"
+                except sqlite3.OperationalError:
+                    key = "write_errors"
+                with counters_lock:
+                    counters[key] += 1
+                n += 1
+        
+        threads = [threading.Thread(target=writer, args=(i,), daemon=True) for i in range(writers)]
+        for thread in threads:
+            thread.start()
+        
+        samples = []
+        lookup_errors = 0
+        started = time.perf_counter()
+        for i in range(lookups):
+            t0 = time.perf_counter()
+            try:
+                access.lookup(f"seed{i % accounts}")
+            except sqlite3.OperationalError:
+                lookup_errors += 1
+            samples.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+        
+        stop.set()
+        for thread in threads:
+            thread.join()
+        
+        result = {
+            "benchmark": "lookup_under_write",
+            "mode": mode,
+            "case": f"accounts={accounts},writers={writers}",
+            "accounts": accounts,
+            "lookups": lookups,
+            "writers": writers,
+            "lookups_per_sec": round(lookups / elapsed, 1),
+            "lookup_errors": lookup_errors,
+            "writes_committed": counters["writes"],
+            "writes_per_sec": round(counters["writes"] / elapsed, 1),
+            "write_errors": counters["write_errors"]
+        }
+        result.update(latency_summary(samples))
+        return result
+    finally:
+        manager.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def free_port():
+    """Return a TCP port that is free on localhost right now"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    """Block until something accepts connections on localhost:port"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def reseller_command(workdir, args, **settings):
+    """Command line running `reseller.py <args>` on the throwaway database
+    
+    settings override module constants (e.g. FTP_PORT) before main() runs.
+    """
+    settings = dict(RESELLER_DB=str(workdir / "bench.db"), SITES_ROOT=str(workdir / "sites"), **settings)
+    assignments = "; ".join(f"reseller.{name} = {value!r}" for name, value in settings.items())
+    code = f"import sys; sys.path.insert(0, {REPO_DIR!r}); import reseller; {assignments}; reseller.main()"
+    return [sys.executable, "-c", code] + list(args)
+
+
+def start_process(command, port):
+    """Start a server in a child process and wait until it accepts connections"""
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process
+
+
+def stop_process(process):
+    if process is not None:
+        process.terminate()
+        process.wait()
+
+
+def start_static_server(server, workdir, root, port):
+    """Start `reseller.py serve` or `python -m http.server` in a child process"""
+    if server == "stdlib":
+        command = [sys.executable, "-m", "http.server", str(port), "--bind", "127.0.0.1", "--directory", root]
+    else:
+        command = reseller_command(workdir, ["serve", "--host", "127.0.0.1", "--port", str(port)])
+    return start_process(command, port)
+
+
+def start_ftp_server(workdir, port, mode="async"):
+    """Start `reseller.py ftp` on localhost:port without connection limits"""
+    command = reseller_command(workdir, ["ftp", "--mode", mode, "--max-cons", "4096", "--max-cons-per-ip", "0",
+                                         "--log-level", "WARNING"],
+                               FTP_HOST="127.0.0.1", FTP_PORT=port)
+    return start_process(command, port)
+
+
+def bench_static(server="reseller", requests=5000, concurrency=8, file_kb=4):
+    """Measure static file requests/second against a server in another process
+
+    server is "reseller" (`reseller.py serve`) or "stdlib" (http.server's
+    ThreadingHTTPServer on the same folder). Clients are keep-alive
+    http.client connections in threads; HTTP/1.0 servers make them reconnect.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="reseller-bench-"))
+    manager = ResellerManager(db_path=str(workdir / "bench.db"), sites_root=str(workdir / "sites"))
+    process = None
+    try:
+        site = workdir / "sites" / "bench"
+        root = site / MANIFEST_DIR
+        root.mkdir(parents=True)
+        seed_accounts(manager.connect(), 1, prefix="bench")
+        manager.connect().execute("UPDATE reseller_accounts SET site_path = ?", (str(site),))
+        manager.connect().commit()
+        (root / "file.bin").write_bytes(os.urandom(file_kb * 1024))
+        manager.close()
+        
+        port = free_port()
+        process = start_static_server(server, workdir, str(root), port)
+        
+        per_client = requests // concurrency
+        samples = []
+        errors = [0]
+        lock = threading.Lock()
+        
+        def client():
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            local = []
+            failed = 0
+            for _ in range(per_client):
+                t0 = time.perf_counter()
+                try:
+                    conn.request("GET", "/file.bin", headers={"Host": f"bench0.localhost:{port}"})
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        failed += 1
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    conn.close()
+                local.append(time.perf_counter() - t0)
+            conn.close()
+            with lock:
+                samples.extend(local)
+                errors[0] += failed
+        
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        
+        result = {
+            "benchmark": "static",
+            "mode": server,
+            "case": f"file_kb={file_kb},concurrency={concurrency}",
+            "file_kb": file_kb,
+            "requests": len(samples),
+            "concurrency": concurrency,
+            "requests_per_sec": round(len(samples) / elapsed, 1),
+            "mb_per_sec": round(len(samples) * file_kb / 1024 / elapsed, 1),
+            "errors": errors[0]
+        }
+        result.update(latency_summary(samples))
+        return result
+    finally:
+        stop_process(process)
+        manager.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_create_account(existing=100, samples=50, fast_kdf=False):
+    """Measure create_account throughput on a database that already holds `existing` accounts
+
+    Password hashing dominates each call; fast_kdf lowers the scrypt cost
+    for the run so database and filesystem regressions stand out.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="reseller-bench-"))
+    scrypt_n = reseller.PASSWORD_SCRYPT_N
+    if fast_kdf:
+        reseller.PASSWORD_SCRYPT_N = 2 ** 8
+    try:
+        with redirect_stdout(io.StringIO()):
+            manager = ResellerManager(db_path=str(workdir / "bench.db"), sites_root=str(workdir / "sites"))
+            manager.init_database()
+        try:
+            seed_accounts(manager.connect(), existing)
+            latencies = []
+            failed = 0
+            started = time.perf_counter()
+            for i in range(samples):
+                t0 = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    account_id = manager.create_account(f"new{i}", "benchpass", f"new{i}@example.com",
+                                                        f"new site {i}", "4")
+                latencies.append(time.perf_counter() - t0)
+                failed += account_id is None
+            elapsed = time.perf_counter() - started
+        finally:
+            manager.close()
+        
+        t0 = time.perf_counter()
+        hash_password("benchpass")
+        kdf_seconds = time.perf_counter() - t0
+        
+        result = {
+            "benchmark": "create_account",
+            "mode": "fast_kdf" if fast_kdf else "default",
+            "case": f"existing={existing}",
+            "existing_accounts": existing,
+            "created": samples - failed,
+            "failed": failed,
+            "accounts_per_sec": round(samples / elapsed, 1),
+            "kdf_ms": round(kdf_seconds * 1000, 3)
+        }
+        result.update(latency_summary(latencies))
+        return result
+    finally:
+        reseller.PASSWORD_SCRYPT_N = scrypt_n
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_authorizer_startup(accounts=10000):
+    """Measure ResellerFTPServer.setup_authorizer and the first account lookup with `accounts` rows"""
+    workdir = Path(tempfile.mkdtemp(prefix="reseller-bench-"))
+    try:
+        with redirect_stdout(io.StringIO()):
+            manager = ResellerManager(db_path=str(workdir / "bench.db"), sites_root=str(workdir / "sites"))
+            manager.init_database()
+        try:
+            seed_accounts(manager.connect(), accounts)
+            # A fresh connection, as in a newly started server process
+            manager.close()
+            server = ResellerFTPServer(manager)
+            started = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                authorizer = server.setup_authorizer()
+            startup = time.perf_counter() - started
+            started = time.perf_counter()
+            authorizer.get_account(f"seed{accounts // 2}")
+            first_lookup = time.perf_counter() - started
+        finally:
+            manager.close()
+        return {
+            "benchmark": "authorizer_startup",
+            "mode": "default",
+            "case": f"accounts={accounts}",
+            "accounts": accounts,
+            "startup_ms": round(startup * 1000, 3),
+            "first_lookup_ms": round(first_lookup * 1000, 3)
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_clients(count, target):
+    """Run target(i) on `count` threads at once; returns the elapsed seconds"""
+    barrier = threading.Barrier(count + 1)
+    
+    def client(i):
+        barrier.wait()
+        target(i)
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def ftp_setup(clients, mode):
+    """Throwaway database with one FTP account per client and a server for them"""
+    workdir = Path(tempfile.mkdtemp(prefix="reseller-bench-"))
+    with redirect_stdout(io.StringIO()):
+        manager = ResellerManager(db_path=str(workdir / "bench.db"), sites_root=str(workdir / "sites"))
+        manager.init_database()
+    seed_accounts(manager.connect(), clients, prefix="bench", password_hash=hash_password("benchpass"),
+                  sites_root=str(workdir / "sites"))
+    manager.close()
+    port = free_port()
+    return workdir, port, start_ftp_server(workdir, port, mode)
+
+
+def bench_login(clients=8, rounds=5, mode="async"):
+    """Measure FTP login latency for `clients` concurrent ftplib sessions
+
+    Each client logs in `rounds` times with its own account. The first
+    round pays for the password hash; later ones hit the verified-login cache.
+    """
+    workdir, port, process = ftp_setup(clients, mode)
+    try:
+        cold = []
+        warm = []
+        errors = [0]
+        lock = threading.Lock()
+        
+        def client(i):
+            for round_number in range(rounds):
+                try:
+                    ftp = ftplib.FTP()
+                    ftp.connect("127.0.0.1", port, timeout=30)
+                    t0 = time.perf_counter()
+                    ftp.login(f"bench{i}", "benchpass")
+                    latency = time.perf_counter() - t0
+                    ftp.quit()
+                except (OSError, ftplib.Error):
+                    with lock:
+                        errors[0] += 1
+                    continue
+                with lock:
+                    (cold if round_number == 0 else warm).append(latency)
+        
+        elapsed = run_clients(clients, client)
+        result = {
+            "benchmark": "ftp_login",
+            "mode": mode,
+            "case": f"clients={clients},rounds={rounds}",
+            "clients": clients,
+            "logins": len(cold) + len(warm),
+            "logins_per_sec": round((len(cold) + len(warm)) / elapsed, 1),
+            "errors": errors[0]
+        }
+        for name, samples in (("cold", cold), ("warm", warm)):
+            result.update({f"{name}_{key}": value for key, value in latency_summary(samples).items()})
+        return result
+    finally:
+        stop_process(process)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+TRANSFER_WORKLOADS = {
+    # name: (files per client, file size in KB)
+    "small": (200, 16),
+    "large": (1, 32 * 1024)
+}
+
+
+def bench_transfer(workload="small", clients=4, mode="async"):
+    """Measure FTP upload then download MB/s for `clients` concurrent sessions
+
+    "small" moves many 16 KB files (one data connection each); "large"
+    moves one 32 MB file per client.
+    """
+    files, size_kb = TRANSFER_WORKLOADS[workload]
+    payload = os.urandom(size_kb * 1024)
+    blocksize = 64 * 1024
+    workdir, port, process = ftp_setup(clients, mode)
+    try:
+        errors = [0]
+        lock = threading.Lock()
+        sessions = {}
+        for i in range(clients):
+            ftp = ftplib.FTP()
+            ftp.connect("127.0.0.1", port, timeout=60)
+            ftp.login(f"bench{i}", "benchpass")
+            sessions[i] = ftp
+        
+        def upload(i):
+            for n in range(files):
+                try:
+                    sessions[i].storbinary(f"STOR file{n}.bin", io.BytesIO(payload), blocksize)
+                except (OSError, ftplib.Error):
+                    with lock:
+                        errors[0] += 1
+        
+        def download(i):
+            for n in range(files):
+                try:
+                    sessions[i].retrbinary(f"RETR file{n}.bin", lambda data: None, blocksize)
+                except (OSError, ftplib.Error):
+                    with lock:
+                        errors[0] += 1
+        
+        upload_seconds = run_clients(clients, upload)
+        download_seconds = run_clients(clients, download)
+        for ftp in sessions.values():
+            ftp.quit()
+        
+        total_mb = clients * files * size_kb / 1024
+        return {
+            "benchmark": "ftp_transfer",
+            "mode": mode,
+            "case": f"workload={workload},clients={clients}",
+            "workload": workload,
+            "clients": clients,
+            "files": clients * files,
+            "file_kb": size_kb,
+            "upload_mb_per_sec": round(total_mb / upload_seconds, 1),
+            "download_mb_per_sec": round(total_mb / download_seconds, 1),
+            "upload_files_per_sec": round(clients * files / upload_seconds, 1),
+            "download_files_per_sec": round(clients * files / download_seconds, 1),
+            "errors": errors[0]
+        }
+    finally:
+        stop_process(process)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+STARTUP_CASES = {
+    # case: (code run by the lazy build, code paying for the eager imports it replaced)
+    "interpreter": ("pass", None),
+    "import": ("import reseller", "import reseller, reseller_ftp, reseller_http"),
+    "list": ("import reseller; reseller.main()", "import reseller, reseller_ftp, reseller_http; reseller.main()")
+}
+
+
+def bench_startup(case="list", runs=20, accounts=1000):
+    """Measure wall time of short-lived `python reseller.py` processes, as cron jobs start them
+    
+    The "eager" mode also imports the FTP and HTTP server modules, which
+    is what every command paid for before they were loaded on demand.
+    Bytecode is cached in a temporary directory after a warm-up run.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="reseller-bench-"))
+    try:
+        with redirect_stdout(io.StringIO()):
+            manager = ResellerManager(db_path=str(workdir / "bench.db"), sites_root=str(workdir / "sites"))
+            manager.init_database()
+        try:
+            seed_accounts(manager.connect(), accounts)
+        finally:
+            manager.close()
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=str(workdir / "pycache"), PYTHONPATH=REPO_DIR)
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        settings = f"reseller.RESELLER_DB = {str(workdir / 'bench.db')!r}; "
+        lazy, eager = STARTUP_CASES[case]
+        results = []
+        for mode, code in (("eager", eager), ("lazy", lazy)):
+            if code is None:
+                continue
+            code = code.replace("reseller.main()", settings + "reseller.main()")
+            command = [sys.executable, "-c", code, "list", "--format", "jsonl", "--limit", "1"]
+            samples = []
+            for i in range(runs + 1):
+                started = time.perf_counter()
+                subprocess.run(command, cwd=workdir, env=env, check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                if i:
+                    samples.append(time.perf_counter() - started)
+            results.append({
+                "benchmark": "startup",
+                "mode": mode if eager else "default",
+                "case": case,
+                "runs": runs,
+                "min_ms": round(min(samples) * 1000, 3),
+                **latency_summary(samples)
+            })
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_suite(args):
+    """The standard set, sized to finish in a few minutes"""
+    results = []
+    for existing in (1, 100, 10000):
+        results.append(bench_create_account(existing, args.samples, args.fast_kdf))
+    for accounts in (0, 1000, 10000, 100000):
+        results.append(bench_authorizer_startup(accounts))
+    results.append(bench_login(args.clients, args.rounds, args.mode))
+    for workload in TRANSFER_WORKLOADS:
+        results.append(bench_transfer(workload, min(args.clients, 4), args.mode))
+    for case in STARTUP_CASES:
+        results.extend(bench_startup(case))
+    return results
+
+
+def run_metadata():
+    """Where and when a run happened, stored next to its results"""
+    return {
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "argv": sys.argv[1:]
+    }
+
+
+def compare_results(baseline, results):
+    """Print the change of every numeric metric against a baseline run"""
+    previous = {(r["benchmark"], r.get("mode"), r.get("case")): r for r in baseline.get("results", baseline)}
+    print("=" * 80)
+    for result in results:
+        key = (result["benchmark"], result.get("mode"), result.get("case"))
+        old = previous.get(key)
+        print(f"{result['benchmark']} [{result.get('mode', '-')}] {result.get('case', '')}")
+        if old is None:
+            print("  (not in baseline)")
+            continue
+        for name, value in result.items():
+            before = old.get(name)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+                continue
+            change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"  {name:<24} {before:>12} -> {value:<12} {change}")
+        print("-" * 80)
+
+
+def print_results(results):
+    """Print benchmark results as an aligned table"""
+    print("=" * 80)
+    for result in results:
+        print(f"{result['benchmark']} [{result.get('mode', '-')}] {result.get('case', '')}")
+        for key, value in result.items():
+            if key not in ("benchmark", "mode", "case"):
+                print(f"  {key:<24} {value}")
+        print("-" * 80)
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description="AGP CMS Reseller benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    
+    lookup = subparsers.add_parser("lookup", help="FTP account lookup latency under concurrent writes")
+    lookup.add_argument("--accounts", type=int, default=2000)
+    lookup.add_argument("--lookups", type=int, default=5000)
+    lookup.add_argument("--writers", type=int, default=2)
+    lookup.add_argument("--mode", choices=["managed", "legacy", "both"], default="both")
+    
+    static = subparsers.add_parser("static", help="Static site requests/second vs. the stdlib http.server")
+    static.add_argument("--requests", type=int, default=5000)
+    static.add_argument("--concurrency", type=int, default=8)
+    static.add_argument("--file-kb", type=int, action="append",
+                        help="Size of the requested file; repeat for several runs (default: 4 and 1024)")
+    static.add_argument("--server", choices=["reseller", "stdlib", "both"], default="both")
+    
+    create = subparsers.add_parser("create", help="create_account throughput vs. accounts already present")
+    create.add_argument("--existing", type=int, action="append",
+                        help="Accounts in the database beforehand; repeat for several runs (default: 1, 100, 10000)")
+    create.add_argument("--samples", type=int, default=50, help="Accounts created per run")
+    create.add_argument("--fast-kdf", action="store_true", help="Cheap scrypt so the rest of the work shows")
+    
+    authorizer = subparsers.add_parser("authorizer", help="FTP authorizer startup time vs. account count")
+    authorizer.add_argument("--accounts", type=int, action="append",
+                            help="Accounts in the database; repeat for several runs (default: 0 to 100000)")
+    
+    ftp_modes = list(reseller.FTP_MODES)
+    login = subparsers.add_parser("login", help="FTP login latency for concurrent ftplib clients")
+    login.add_argument("--clients", type=int, default=8)
+    login.add_argument("--rounds", type=int, default=5, help="Logins per client; the first is uncached")
+    login.add_argument("--mode", choices=ftp_modes, default="async", help="FTP server concurrency model")
+    
+    transfer = subparsers.add_parser("transfer", help="FTP upload/download MB/s")
+    transfer.add_argument("--workload", choices=list(TRANSFER_WORKLOADS) + ["both"], default="both")
+    transfer.add_argument("--clients", type=int, default=4)
+    transfer.add_argument("--mode", choices=ftp_modes, default="async", help="FTP server concurrency model")
+    
+    startup = subparsers.add_parser("startup", help="Process start-up time of the CLI, lazy vs. eager imports")
+    startup.add_argument("--case", choices=list(STARTUP_CASES) + ["all"], default="all")
+    startup.add_argument("--runs", type=int, default=20, help="Timed runs per case and mode")
+    startup.add_argument("--accounts", type=int, default=1000, help="Accounts in the database for `list`")
+    
+    suite = subparsers.add_parser("suite", help="create, authorizer, login and transfer with default sizes")
+    suite.add_argument("--samples", type=int, default=50, help="Accounts created per create_account run")
+    suite.add_argument("--fast-kdf", action="store_true", help="Cheap scrypt for the create_account runs")
+    suite.add_argument("--clients", type=int, default=8)
+    suite.add_argument("--rounds", type=int, default=5)
+    suite.add_argument("--mode", choices=ftp_modes, default="async", help="FTP server concurrency model")
+    
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--output", metavar="FILE", help="Also write the results with run details as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="Show changes against results saved with --output")
+    args = parser.parse_args()
+    
+    results = []
+    if args.benchmark == "lookup":
+        modes = ["legacy", "managed"] if args.mode == "both" else [args.mode]
+        for mode in modes:
+            results.append(bench_lookup_under_write(mode, args.accounts, args.lookups, args.writers))
+    elif args.benchmark == "static":
+        servers = ["stdlib", "reseller"] if args.server == "both" else [args.server]
+        for file_kb in args.file_kb or [4, 1024]:
+            for server in servers:
+                results.append(bench_static(server, args.requests, args.concurrency, file_kb))
+    elif args.benchmark == "create":
+        for existing in args.existing or [1, 100, 10000]:
+            results.append(bench_create_account(existing, args.samples, args.fast_kdf))
+    elif args.benchmark == "authorizer":
+        for accounts in args.accounts or [0, 1000, 10000, 100000]:
+            results.append(bench_authorizer_startup(accounts))
+    elif args.benchmark == "login":
+        results.append(bench_login(args.clients, args.rounds, args.mode))
+    elif args.benchmark == "transfer":
+        workloads = list(TRANSFER_WORKLOADS) if args.workload == "both" else [args.workload]
+        for workload in workloads:
+            results.append(bench_transfer(workload, args.clients, args.mode))
+    elif args.benchmark == "startup":
+        for case in STARTUP_CASES if args.case == "all" else [args.case]:
+            results.extend(bench_startup(case, args.runs, args.accounts))
+    elif args.benchmark == "suite":
+        results = run_suite(args)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"run": run_metadata(), "results": results}, f, indent=2)
+            f.write("\n")
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.compare:
+        with open(args.compare) as f:
+            compare_results(json.load(f), results)
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
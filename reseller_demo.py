@@ -126,7 +126,8 @@ def demo_site_structure():
     print("Each customer site has the following structure:\n")
     
     for site_dir in sorted(sites_root.iterdir()):
-        if site_dir.is_dir():
+        # Skip internal folders such as the package skeletons
+        if site_dir.is_dir() and not site_dir.name.startswith("."):
             print(f"📁 {site_dir.name}/")
             
             for root, dirs, files in os.walk(site_dir):
@@ -0,0 +1,812 @@
+#!/usr/bin/env python3
+"""
+AGP CMS Reseller FTP server
+Database-backed authorizer, session handler and server runner on top of
+pyftpdlib. reseller.py imports this module only when the FTP server starts,
+so provisioning commands never pay for loading pyftpdlib.
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import socket
+import sqlite3
+import stat
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pyftpdlib.authorizers import AuthenticationFailed, AuthorizerError, DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler, ThrottledDTPHandler
+from pyftpdlib.ioloop import AsyncChat
+from pyftpdlib.servers import FTPServer, ThreadedFTPServer
+try:
+    from pyftpdlib.servers import MultiprocessFTPServer
+except ImportError:
+    # Only available on POSIX systems with a working multiprocessing
+    MultiprocessFTPServer = None
+
+from reseller import (
+    AUTH_CACHE_SIZE, AUTH_CACHE_TTL, AUTH_KDF_WORKERS, AUTH_VERIFY_CACHE_TTL,
+    FTP_GLOBAL_READ_LIMIT, FTP_GLOBAL_WRITE_LIMIT, FTP_HOST, FTP_MAX_CONS, FTP_MAX_CONS_PER_IP,
+    FTP_MODE, FTP_MODES, FTP_PERMISSIONS, FTP_PORT, FTP_THROUGHPUT_LOG_INTERVAL, FTP_WORKERS,
+    MANIFEST_DIR, METRICS, METRICS_PORT, METRICS_SNAPSHOT_INTERVAL, PROFILER, RELOAD_INTERVAL,
+    USAGE_FLUSH_INTERVAL, USAGE_RECONCILE_BATCH, USAGE_RECONCILE_INTERVAL, _NOT_CACHED, _Span,
+    AccountChangeWatcher, AssetCompressor, BandwidthScheduler, FileEventWriter, FTPEventLog,
+    ManifestUpdater, MetricsServer, TTLCache, UsageTracker, format_rate, hash_password, profiled,
+    remove_compressed, unshare_file, verify_password
+)
+
+
+class DatabaseAuthorizer(DummyAuthorizer):
+    """FTP authorizer that looks accounts up in the reseller database on demand
+    
+    Nothing is loaded at startup; each username is read from
+    reseller_accounts the first time it is needed and kept in a TTLCache,
+    so startup cost does not depend on the number of accounts.
+    
+    Successful password checks are remembered for AUTH_VERIFY_CACHE_TTL
+    seconds as a keyed HMAC of the stored hash and password, so clients
+    that log in again for every transfer only pay for the KDF once.
+    """
+    
+    def __init__(self, manager, cache=None, perm=FTP_PERMISSIONS):
+        super().__init__()
+        self._check_permissions("", perm)
+        self.manager = manager
+        self.cache = cache if cache is not None else TTLCache()
+        self.verified = TTLCache(ttl=AUTH_VERIFY_CACHE_TTL)
+        self.perm = perm
+        self.upgraded = 0
+        # Per-process key for the verification cache; never stored
+        self._verify_key = os.urandom(32)
+    
+    def get_account(self, username):
+        """Return the account dict for username (cached), or None"""
+        account = self.cache.get(username, _NOT_CACHED)
+        if account is _NOT_CACHED:
+            # Unknown users are cached too so repeated bad logins stay off the DB
+            account = self.manager.get_ftp_account(username)
+            self.cache.set(username, account)
+        return account
+    
+    def _fingerprint(self, account, password):
+        # Changes whenever the stored hash does, so password changes invalidate it
+        message = f"{account['password_hash']}\0{password}".encode()
+        return hmac.new(self._verify_key, message, hashlib.sha256).digest()
+    
+    def _recently_verified(self, account, password):
+        cached = self.verified.get(account["username"])
+        return cached is not None and hmac.compare_digest(cached, self._fingerprint(account, password))
+    
+    def needs_verification(self, username, password):
+        """True when checking this login means running the password KDF"""
+        account = self.get_account(username)
+        return account is not None and not self._recently_verified(account, password)
+    
+    def _upgrade_hash(self, account, password):
+        """Re-hash a legacy or outdated password hash; returns the account as stored"""
+        new_hash = hash_password(password)
+        try:
+            replaced = self.manager.update_password_hash(account["id"], account["password_hash"], new_hash)
+        except sqlite3.Error:
+            # Try again on the next login
+            return account
+        if replaced:
+            self.upgraded += 1
+        # Re-read the account whether we or another process replaced it
+        self.cache.invalidate(account["username"])
+        return self.get_account(account["username"]) or account
+    
+    @profiled("auth.validate")
+    def validate_authentication(self, username, password, handler):
+        started = time.perf_counter()
+        try:
+            account = self.get_account(username)
+            if account is None:
+                if username == "anonymous":
+                    raise AuthenticationFailed("Anonymous access not allowed.")
+                raise AuthenticationFailed("Authentication failed.")
+            if self._recently_verified(account, password):
+                return
+            matches, needs_rehash = verify_password(password, account["password_hash"])
+            if not matches:
+                raise AuthenticationFailed("Authentication failed.")
+            if needs_rehash:
+                account = self._upgrade_hash(account, password)
+            self.verified.set(username, self._fingerprint(account, password))
+        finally:
+            METRICS.ftp_auth_seconds.observe(time.perf_counter() - started)
+    
+    def get_home_dir(self, username):
+        account = self.get_account(username)
+        if account is None:
+            raise AuthenticationFailed("Authentication failed.")
+        return os.path.realpath(account["site_path"])
+    
+    def has_user(self, username):
+        return self.get_account(username) is not None
+    
+    def has_perm(self, username, perm, path=None):
+        # Only called for authenticated sessions; sessions that were already
+        # logged in keep working even if the account changes underneath them
+        return perm in self.perm
+    
+    def get_perms(self, username):
+        return self.perm
+    
+    def get_msg_login(self, username):
+        return "Login successful."
+    
+    def get_msg_quit(self, username):
+        return "Goodbye."
+
+
+class _IOLoopWaker(AsyncChat):
+    """Socket pair that wakes an IOLoop to run callbacks queued by other threads"""
+    
+    def __init__(self, ioloop):
+        self._reader, self._writer = socket.socketpair()
+        self._writer.setblocking(False)
+        self._calls = deque()
+        super().__init__(self._reader, ioloop=ioloop)
+    
+    def call_soon(self, callback, *args):
+        """Run callback(*args) on the loop thread; safe to call from any thread"""
+        self._calls.append((callback, args))
+        try:
+            self._writer.send(b"\0")
+        except OSError:
+            # Socket buffer full: a wake-up is already pending
+            pass
+    
+    def readable(self):
+        return True
+    
+    def writable(self):
+        return False
+    
+    def handle_read(self):
+        try:
+            self._reader.recv(4096)
+        except OSError:
+            pass
+        while self._calls:
+            callback, args = self._calls.popleft()
+            try:
+                callback(*args)
+            except Exception:
+                logging.getLogger("pyftpdlib").exception("Callback from worker thread failed")
+    
+    def close(self):
+        super().close()
+        self._writer.close()
+
+
+class LoopThreadPool:
+    """Runs blocking calls on worker threads and hands the results back to an IOLoop
+    
+    Threads and the wake-up socket are created on first use in each
+    process, so pre-forked workers never share them.
+    """
+    
+    def __init__(self, workers, name):
+        self.workers = workers
+        self.name = name
+        self._pid = None
+        self._executor = None
+        self._waker = None
+    
+    def submit(self, ioloop, callback, fn, *args):
+        """Run fn(*args) on a worker thread, then callback(future) on the loop"""
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+            self._waker = _IOLoopWaker(ioloop)
+            self._pid = os.getpid()
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda done: self._waker.call_soon(callback, done))
+        return future
+    
+    def shutdown(self):
+        if self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._waker.close()
+            self._pid = None
+
+
+class AccountThrottledDTPHandler(ThrottledDTPHandler):
+    """Data channel throttled by the session account's BandwidthScheduler bucket
+    
+    Limits are looked up when the transfer starts, so account changes apply
+    to the next transfer (and to running ones via BandwidthScheduler.set_limits).
+    Unlike ThrottledDTPHandler, sendfile() is kept and throttled per call.
+    """
+    
+    # BandwidthScheduler shared by all sessions; set by ResellerFTPServer.start
+    scheduler = None
+    
+    def __init__(self, sock, cmd_channel):
+        super().__init__(sock, cmd_channel)
+        self._direction = None
+    
+    def use_sendfile(self):
+        return super(ThrottledDTPHandler, self).use_sendfile()
+    
+    def _register(self, direction):
+        """Join the scheduler on the first chunk, when the direction is known"""
+        self._direction = direction
+        account = self.cmd_channel.authorizer.get_account(self.cmd_channel.username)
+        limit = account[f"{direction}_limit"] if account else 0
+        self.scheduler.open(self.cmd_channel.account_id, self.cmd_channel.username, direction, limit)
+        # Smaller buffers give smoother throttling at low limits
+        if limit:
+            attribute = "ac_in_buffer_size" if direction == "read" else "ac_out_buffer_size"
+            size = getattr(self, attribute)
+            while size > limit and size > 4096:
+                size //= 2
+            setattr(self, attribute, size)
+    
+    def _throttle(self, direction, amount):
+        if not amount or self.scheduler is None or self.cmd_channel.account_id is None:
+            return
+        if self._direction is None:
+            self._register(direction)
+        delay = self.scheduler.consume(self.cmd_channel.account_id, direction, amount)
+        if delay <= 0 or self._closed:
+            return
+        
+        # Same pause mechanism as ThrottledDTPHandler._throttle_bandwidth
+        def unsleep():
+            self.add_channel(events=self.ioloop.READ if self.receive else self.ioloop.WRITE)
+        
+        self.del_channel()
+        self._cancel_throttler()
+        self._throttler = self.ioloop.call_later(delay, unsleep, _errback=self.handle_error)
+    
+    def recv(self, buffer_size):
+        chunk = super().recv(buffer_size)
+        self._throttle("read", len(chunk))
+        return chunk
+    
+    def send(self, data):
+        sent = super().send(data)
+        self._throttle("write", sent)
+        return sent
+    
+    def initiate_sendfile(self):
+        before = self.tot_bytes_sent
+        super().initiate_sendfile()
+        self._throttle("write", self.tot_bytes_sent - before)
+    
+    def close(self):
+        if self._direction is not None:
+            self.scheduler.close(self.cmd_channel.account_id, self._direction)
+            self._direction = None
+        super().close()
+
+
+class CustomFTPHandler(FTPHandler):
+    """Custom FTP handler with logging"""
+    
+    # FTPEventLog and UsageTracker shared by all sessions; set by ResellerFTPServer.start
+    events = None
+    usage = None
+    # LoopThreadPool for password checks (async mode only); set by ResellerFTPServer.start
+    auth_pool = None
+    # FileEventWriter for the upload/download/delete history; set by ResellerFTPServer.start
+    file_events = None
+    # ManifestUpdater for the wwwroot content manifest; set by ResellerFTPServer.start
+    manifest = None
+    # AssetCompressor writing .gz/.br variants of uploaded assets; set by ResellerFTPServer.start
+    compressor = None
+    
+    account_id = None
+    _upload_base = None
+    
+    def ftp_PASS(self, line):
+        # The KDF takes tens of milliseconds; run it on a worker thread so the
+        # event loop keeps serving other sessions meanwhile
+        if (self.auth_pool is None or self.authenticated or not self.username
+                or not self.authorizer.needs_verification(self.username, line)):
+            return super().ftp_PASS(line)
+        # Stop reading commands until the password has been checked
+        self.del_channel()
+        self.auth_pool.submit(self.ioloop, partial(self._auth_checked, self.username, line),
+                              self.authorizer.validate_authentication, self.username, line, self)
+    
+    def _auth_checked(self, username, password, future):
+        """Finish a PASS command checked on a worker thread (as FTPHandler.ftp_PASS does)"""
+        if self._closed:
+            return
+        self.add_channel()
+        try:
+            future.result()
+            home = self.authorizer.get_home_dir(username)
+            msg_login = self.authorizer.get_msg_login(username)
+        except (AuthenticationFailed, AuthorizerError) as err:
+            self.handle_auth_failed(str(err), password)
+        except Exception:
+            self.handle_error()
+        else:
+            self.handle_auth_success(home, password, msg_login)
+    
+    def _record_file_event(self, event, path, target=None, bytes=None):
+        if self.file_events is not None:
+            self.file_events.record(event, self.account_id, self.username, self.fs.fs2ftp(path),
+                                    self.fs.fs2ftp(target) if target else None, bytes, self.remote_ip)
+    
+    def _touch_manifest(self, *paths):
+        if self.manifest is not None and self.account_id is not None:
+            for path in paths:
+                self.manifest.touch(self.account_id, self.fs.root, path)
+    
+    def _compress(self, path):
+        """Queue precompressed variants for a public file (uploaded or renamed into place)"""
+        if self.compressor is not None and path.startswith(os.path.join(self.fs.root, MANIFEST_DIR, "")):
+            self.compressor.submit(path)
+    
+    def _file_size(self, path):
+        """Size of a regular file, or None if path is missing or not a file"""
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return None
+        return st.st_size if stat.S_ISREG(st.st_mode) else None
+    
+    def _quota_allows_upload(self):
+        """Check the usage index; responds 552 and returns False when over quota"""
+        if self.usage is None or self.account_id is None:
+            return True
+        try:
+            used, quota = self.usage.check(self.account_id)
+        except sqlite3.Error as e:
+            # Never block uploads because the index is busy
+            self.events.event("quota_check_failed", logging.WARNING, user=self.username, error=str(e))
+            return True
+        if quota is not None and used >= quota:
+            self.respond(f"552 Storage quota exceeded ({used / 1048576:.1f} of {quota / 1048576:.1f} MB used).")
+            return False
+        return True
+    
+    def _record_upload(self, file):
+        if self.usage is None or self.account_id is None:
+            return
+        base = self._upload_base
+        self._upload_base = None
+        old_size = base[1] if base is not None and base[0] == file else None
+        new_size = self._file_size(file)
+        if new_size is None:
+            return
+        self.usage.add(self.account_id, new_size - (old_size or 0), 0 if old_size is not None else 1)
+    
+    def ftp_STOR(self, file, mode="w"):
+        if not self._quota_allows_upload():
+            return
+        self._upload_base = (file, self._file_size(file))
+        # Site files may be hardlinked to a shared skeleton; give the file
+        # its own inode before it is written (APPE also lands here)
+        try:
+            unshare_file(file, keep_data="a" in mode or bool(self._restart_position))
+        except OSError as e:
+            self.respond(f"550 {e.strerror or e}.")
+            return
+        return super().ftp_STOR(file, mode)
+    
+    def ftp_STOU(self, line):
+        if not self._quota_allows_upload():
+            return
+        return super().ftp_STOU(line)
+    
+    def ftp_DELE(self, path):
+        size = self._file_size(path)
+        result = super().ftp_DELE(path)
+        if result is not None:
+            self._record_file_event("delete", path, bytes=size)
+            self._touch_manifest(path)
+            remove_compressed(path)
+        if result is not None and size is not None and self.usage is not None and self.account_id is not None:
+            self.usage.add(self.account_id, -size, -1)
+        return result
+    
+    def ftp_RNTO(self, path):
+        # Renaming over an existing file frees that file's space
+        replaced = None
+        source = self._rnfr
+        if self._rnfr and os.path.normcase(self._rnfr) != os.path.normcase(path):
+            replaced = self._file_size(path)
+        result = super().ftp_RNTO(path)
+        if result is not None:
+            self._record_file_event("rename", source, target=path)
+            self._touch_manifest(source, path)
+            # A renamed folder takes its variants along; a file gets new ones
+            if os.path.isfile(path):
+                remove_compressed(source)
+                self._compress(path)
+        if result is not None and replaced is not None and self.usage is not None and self.account_id is not None:
+            self.usage.add(self.account_id, -replaced, -1)
+        return result
+    
+    def ftp_RMD(self, path):
+        result = super().ftp_RMD(path)
+        if result is not None:
+            self._touch_manifest(path)
+        return result
+    
+    def ftp_SITE_CHMOD(self, path, mode):
+        try:
+            unshare_file(path)
+        except OSError as e:
+            self.respond(f"550 {e.strerror or e}.")
+            return
+        return super().ftp_SITE_CHMOD(path, mode)
+    
+    def ftp_MFMT(self, path, timeval):
+        try:
+            unshare_file(path)
+        except OSError as e:
+            self.respond(f"550 {e.strerror or e}.")
+            return
+        return super().ftp_MFMT(path, timeval)
+    
+    def _handed_off(self):
+        """True in a multiprocess parent closing its copy of a session now run by a child"""
+        return (MultiprocessFTPServer is not None and isinstance(self.server, MultiprocessFTPServer)
+                and getattr(self, "_connected_pid", None) == os.getpid())
+    
+    def process_command(self, cmd, *args, **kwargs):
+        if not PROFILER.enabled:
+            return super().process_command(cmd, *args, **kwargs)
+        # Transfers only start here; their completion shows up in ftp.log_transfer
+        with _Span(PROFILER, f"ftp.{cmd}"):
+            return super().process_command(cmd, *args, **kwargs)
+    
+    @profiled("ftp.on_connect")
+    def on_connect(self):
+        self._connected_at = time.monotonic()
+        self._connected_pid = os.getpid()
+        METRICS.ftp_connections.add(1)
+        self.events.event("connect", ip=self.remote_ip, port=self.remote_port)
+    
+    @profiled("ftp.on_disconnect")
+    def on_disconnect(self):
+        started = getattr(self, "_connected_at", None)
+        if started is None or self._handed_off():
+            return
+        METRICS.ftp_connections.add(-1)
+        duration = round(time.monotonic() - started, 3)
+        self.events.event("disconnect", user=self.username or None, ip=self.remote_ip,
+                          duration=duration)
+        if self.usage is not None and self.usage.flush_on_disconnect and self.account_id is not None:
+            try:
+                self.usage.flush()
+            except sqlite3.Error as e:
+                self.events.event("usage_flush_failed", logging.WARNING, user=self.username, error=str(e))
+    
+    @profiled("ftp.on_login")
+    def on_login(self, username):
+        account = self.authorizer.get_account(username)
+        self.account_id = account["id"] if account else None
+        METRICS.ftp_logins.inc(("success",))
+        self.events.event("login", user=username, ip=self.remote_ip)
+    
+    @profiled("ftp.on_file_received")
+    def on_file_received(self, file):
+        self._record_upload(file)
+        self._touch_manifest(file)
+        self._compress(file)
+    
+    @profiled("ftp.on_incomplete_file_received")
+    def on_incomplete_file_received(self, file):
+        # The partial file stays on disk and counts against the quota
+        self._record_upload(file)
+        self._touch_manifest(file)
+        remove_compressed(file)
+    
+    @profiled("ftp.on_login_failed")
+    def on_login_failed(self, username, password):
+        METRICS.ftp_logins.inc(("failure",))
+        self.events.event("login_failed", logging.WARNING, user=username, ip=self.remote_ip)
+    
+    @profiled("ftp.log_transfer")
+    def log_transfer(self, cmd, filename, receive, completed, elapsed, bytes):
+        # Replaces pyftpdlib's text line; on_file_received/on_file_sent
+        # carry no size or timing
+        direction = "in" if receive else "out"
+        METRICS.ftp_bytes.inc((self.username, direction), bytes)
+        METRICS.ftp_transfer_seconds.observe(elapsed, (direction,))
+        self.events.event("upload" if receive else "download",
+                          logging.INFO if completed else logging.WARNING,
+                          user=self.username, ip=self.remote_ip, cmd=cmd, path=filename,
+                          bytes=bytes, duration=elapsed, completed=completed)
+        if completed:
+            self._record_file_event("upload" if receive else "download", filename, bytes=bytes)
+        else:
+            self._record_file_event("upload_incomplete" if receive else "download_incomplete",
+                                    filename, bytes=bytes)
+    
+    def log_cmd(self, cmd, arg, respcode, respstr):
+        if cmd in self.log_cmds_list:
+            self.events.event("command", logging.INFO if respcode < 400 else logging.WARNING,
+                              user=self.username, ip=self.remote_ip, cmd=cmd.strip(),
+                              path=str(arg).strip(), code=respcode)
+
+
+class ResellerFTPServer:
+    """FTP Server for reseller accounts"""
+    
+    def __init__(self, manager, mode=None, workers=None, max_cons=None, max_cons_per_ip=None,
+                 log_level=None, metrics_port=None):
+        self.manager = manager
+        self.mode = mode or FTP_MODE
+        self.workers = FTP_WORKERS if workers is None else workers
+        self.max_cons = FTP_MAX_CONS if max_cons is None else max_cons
+        self.max_cons_per_ip = FTP_MAX_CONS_PER_IP if max_cons_per_ip is None else max_cons_per_ip
+        self.server = None
+        self.authorizer = None
+        self.watcher = None
+        self.events = FTPEventLog(level=log_level)
+        self.usage = UsageTracker(manager)
+        self.file_events = FileEventWriter(manager)
+        self.manifest = ManifestUpdater(manager)
+        self.compressor = AssetCompressor()
+        self.bandwidth = None
+        self.metrics_port = METRICS_PORT if metrics_port is None else metrics_port
+        self.metrics_server = None
+        self._reconciler = None
+        self._stop_reconciler = threading.Event()
+    
+    def server_class(self):
+        """Return the pyftpdlib server class for the configured mode"""
+        if self.mode == "async":
+            return FTPServer
+        if self.mode == "threaded":
+            return ThreadedFTPServer
+        if self.mode == "multiprocess":
+            if MultiprocessFTPServer is None:
+                raise ValueError("multiprocess mode is not supported on this platform")
+            return MultiprocessFTPServer
+        raise ValueError(f"unknown FTP mode '{self.mode}' (expected one of: {', '.join(FTP_MODES)})")
+    
+    def worker_processes(self):
+        """Number of pre-forked processes (async mode only)"""
+        if self.mode != "async" or os.name != "posix":
+            return 1
+        return self.workers if self.workers > 0 else (os.cpu_count() or 1)
+    
+    @profiled("setup_authorizer")
+    def setup_authorizer(self):
+        """Setup FTP authorizer backed by the reseller database"""
+        # Accounts are resolved on login, so startup no longer scales with
+        # the number of accounts in reseller_accounts
+        self.authorizer = DatabaseAuthorizer(self.manager)
+        print(f"✓ FTP authorizer ready (cache: {AUTH_CACHE_SIZE} accounts, TTL {AUTH_CACHE_TTL}s)")
+        return self.authorizer
+    
+    def reload_accounts(self):
+        """Apply account changes committed since the last check
+        
+        The cached credentials are refreshed, so new logins see new,
+        suspended or FTP-disabled accounts. Live sessions are left alone,
+        except those of terminated accounts, which are closed.
+        """
+        try:
+            changed = self.watcher.poll()
+        except sqlite3.Error as e:
+            # Keep polling; a failed check must not stop future reloads
+            self.events.event("reload_failed", logging.ERROR, error=str(e))
+            return
+        
+        if changed is None:
+            self.authorizer.cache.invalidate()
+            self.events.event("accounts_reloaded", accounts="all")
+        elif changed:
+            for username in changed:
+                self.authorizer.cache.invalidate(username)
+            self.events.event("accounts_reloaded", accounts=len(changed))
+        else:
+            return
+        self.refresh_bandwidth_limits(changed)
+        self.close_terminated_sessions(changed)
+    
+    def close_terminated_sessions(self, changed=None):
+        """Disconnect this process's sessions of terminated accounts (None = check every session)
+        
+        Only sessions on the server's own event loop are found (async mode,
+        including pre-forked workers). Threaded and multiprocess sessions
+        run their own loops; they lose their files when the reaper moves
+        the site folder away.
+        """
+        sessions = [handler for handler in list(self.server.ioloop.socket_map.values())
+                    if isinstance(handler, CustomFTPHandler) and handler.authenticated
+                    and (changed is None or handler.username in changed)]
+        if not sessions:
+            return
+        try:
+            terminated = self.manager.terminated_usernames(handler.username for handler in sessions)
+        except sqlite3.Error as e:
+            self.events.event("reload_failed", logging.ERROR, error=str(e))
+            return
+        for handler in sessions:
+            if handler.username in terminated:
+                self.events.event("session_closed", logging.WARNING, user=handler.username,
+                                  ip=handler.remote_ip, reason="terminated")
+                handler.respond("421 Account terminated, closing connection.")
+                handler.close_when_done()
+    
+    def refresh_bandwidth_limits(self, changed=None):
+        """Re-read limits of accounts with running transfers (None = all of them)"""
+        for account_id, username in self.bandwidth.active_accounts().items():
+            if changed is not None and username not in changed:
+                continue
+            try:
+                account = self.authorizer.get_account(username)
+            except sqlite3.Error:
+                continue
+            if account is not None:
+                self.bandwidth.set_limits(account_id, account["read_limit"], account["write_limit"])
+    
+    def log_throughput(self):
+        """Log per-account transfer counters for accounts active since the last call"""
+        for username, counters in self.bandwidth.stats(idle=FTP_THROUGHPUT_LOG_INTERVAL).items():
+            if counters["read_rate"] or counters["write_rate"] or counters["read_transfers"] or counters["write_transfers"]:
+                self.events.event("throughput", user=username, **counters)
+    
+    def flush_usage(self):
+        """Write disk usage changes batched by FTP sessions"""
+        try:
+            self.usage.flush()
+        except sqlite3.Error as e:
+            # Deltas are kept and retried on the next tick
+            self.events.event("usage_flush_failed", logging.WARNING, error=str(e))
+    
+    def _reconcile_usage(self):
+        """Background thread: re-measure a batch of sites every interval to repair drift"""
+        while not self._stop_reconciler.wait(USAGE_RECONCILE_INTERVAL):
+            try:
+                measured = self.manager.reconcile_usage(limit=USAGE_RECONCILE_BATCH)
+            except (sqlite3.Error, OSError) as e:
+                self.events.event("usage_reconcile_failed", logging.WARNING, error=str(e))
+                continue
+            self.events.event("usage_reconciled", logging.DEBUG, sites=measured)
+    
+    def start(self):
+        """Start the FTP server"""
+        try:
+            laps = PROFILER.laps("ftp.start")
+            # Migrate once here rather than in every pre-forked worker
+            self.manager.init_database()
+            authorizer = self.setup_authorizer()
+            
+            handler = CustomFTPHandler
+            handler.authorizer = authorizer
+            handler.events = self.events.start()
+            handler.usage = self.usage
+            handler.file_events = self.file_events
+            handler.manifest = self.manifest
+            handler.compressor = self.compressor
+            # Threaded and multiprocess sessions can block on the KDF themselves
+            handler.auth_pool = LoopThreadPool(AUTH_KDF_WORKERS, "auth") if self.mode == "async" else None
+            handler.banner = "AGP CMS Reseller FTP Server Ready"
+            
+            # Set passive ports
+            handler.passive_ports = range(60000, 60100)
+            
+            self.server = self.server_class()((FTP_HOST, FTP_PORT), handler)
+            workers = self.worker_processes()
+            laps.lap("listen")
+            
+            # Throttle data connections; each pre-forked worker gets an
+            # equal slice of the global limits. A process per session can't
+            # share them, so multiprocess mode only has per-account limits.
+            if self.mode == "multiprocess":
+                self.bandwidth = BandwidthScheduler()
+            else:
+                self.bandwidth = BandwidthScheduler(FTP_GLOBAL_READ_LIMIT // workers,
+                                                    FTP_GLOBAL_WRITE_LIMIT // workers)
+            AccountThrottledDTPHandler.scheduler = self.bandwidth
+            handler.dtp_handler = AccountThrottledDTPHandler
+            
+            # Set limits
+            self.server.max_cons = self.max_cons
+            self.server.max_cons_per_ip = self.max_cons_per_ip
+            
+            # Pick up account changes without restarting. Pre-forked workers
+            # each run this timer and re-open the watcher's connection.
+            self.watcher = AccountChangeWatcher(self.manager.db_path)
+            self.server.ioloop.call_every(RELOAD_INTERVAL, self.reload_accounts)
+            
+            # Disk usage: batched writes from sessions, plus a slow re-measure
+            # of every site in the background
+            self.usage.flush_on_disconnect = self.mode == "multiprocess"
+            self.server.ioloop.call_every(USAGE_FLUSH_INTERVAL, self.flush_usage)
+            self.server.ioloop.call_every(FTP_THROUGHPUT_LOG_INTERVAL, self.log_throughput)
+            self._reconciler = threading.Thread(target=self._reconcile_usage, name="usage-reconcile",
+                                                daemon=True)
+            self._reconciler.start()
+            
+            # Metrics endpoint runs here; forked workers report through snapshots
+            if self.metrics_port:
+                if workers != 1 or self.mode == "multiprocess":
+                    METRICS.enable_snapshots(tempfile.mkdtemp(prefix="reseller-metrics-"))
+                    self.server.ioloop.call_every(METRICS_SNAPSHOT_INTERVAL, METRICS.write_snapshot)
+                self.metrics_server = MetricsServer(port=self.metrics_port).start()
+            laps.lap("services")
+            if PROFILER.window:
+                self.server.ioloop.call_later(PROFILER.window, PROFILER.stop_cprofile)
+            
+            print(f"\n{'='*80}")
+            print(f"FTP SERVER STARTED")
+            print(f"{'='*80}")
+            print(f"Host: {FTP_HOST}")
+            print(f"Port: {FTP_PORT}")
+            print(f"Mode: {self.mode}")
+            if workers != 1:
+                print(f"Worker Processes: {workers}")
+            print(f"Max Connections: {self.server.max_cons}")
+            print(f"Max Connections per IP: {self.server.max_cons_per_ip}")
+            print(f"Account Reload Interval: {RELOAD_INTERVAL}s")
+            if self.metrics_server:
+                print(f"Metrics: {self.metrics_server.url}")
+            if FTP_GLOBAL_READ_LIMIT or FTP_GLOBAL_WRITE_LIMIT:
+                if self.mode == "multiprocess":
+                    print("Global Bandwidth: not enforced in multiprocess mode")
+                else:
+                    print(f"Global Bandwidth: {format_rate(FTP_GLOBAL_READ_LIMIT)} up, "
+                          f"{format_rate(FTP_GLOBAL_WRITE_LIMIT)} down")
+            print(f"Log Level: {logging.getLevelName(self.events.level)}")
+            print(f"{'='*80}\n")
+            
+            # Start serving
+            if workers != 1:
+                self.server.serve_forever(worker_processes=workers)
+            else:
+                self.server.serve_forever()
+            
+        except PermissionError:
+            print(f"\n✗ Error: Permission denied to bind to port {FTP_PORT}")
+            print(f"  On Unix/Linux, you need root privileges to use port 21.")
+            print(f"  Try running: sudo python3 {sys.argv[0]} ftp")
+            print(f"  Or use a port > 1024 by editing FTP_PORT in the script")
+            sys.exit(1)
+        except Exception as e:
+            print(f"✗ Error starting FTP server: {e}")
+            sys.exit(1)
+    
+    def stop(self):
+        """Stop the FTP server"""
+        if self.server:
+            self.server.close_all()
+        if self.watcher:
+            self.watcher.close()
+        self._stop_reconciler.set()
+        self.flush_usage()
+        self.file_events.stop()
+        self.manifest.stop()
+        self.compressor.stop()
+        stats = self.compressor.stats()
+        if stats["compressed"] or stats["skipped"] or stats["dropped"]:
+            print(f"Precompressed assets: {stats['compressed']} compressed, {stats['skipped']} not worth it, "
+                  f"{stats['dropped']} skipped (queue full), {stats['errors']} errors")
+        stats = self.file_events.stats()
+        if stats["recorded"]:
+            print(f"File events: {stats['written']} written in {stats['batches']} batches, "
+                  f"{stats['dropped']} dropped (max {stats['max_queued']} queued)")
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if CustomFTPHandler.auth_pool:
+            CustomFTPHandler.auth_pool.shutdown()
+        if self.authorizer:
+            stats = self.authorizer.cache.stats()
+            print(f"Auth cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['evictions']} evictions, {stats['size']} cached")
+            stats = self.authorizer.verified.stats()
+            print(f"Verified passwords cached: {stats['size']}, "
+                  f"hashes upgraded: {self.authorizer.upgraded}")
+        self.events.close()
+        stats = self.events.stats()
+        print(f"Event log: {stats['logged']} logged, {stats['dropped']} dropped, "
+              f"{stats['sampled_out']} sampled out")
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+AGP CMS Reseller HTTP server
+Serves every site's wwwroot with asyncio, caching small files in memory.
+reseller.py imports this module only for the serve command, so other
+commands never load asyncio.
+"""
+
+import asyncio
+import mimetypes
+import os
+import posixpath
+import sqlite3
+import stat
+import sys
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote, unquote
+
+from reseller import (
+    AUTH_CACHE_SIZE, AUTH_CACHE_TTL, HTTP_CACHE_MAX_FILE, HTTP_CACHE_MB, HTTP_CACHE_REVALIDATE,
+    HTTP_DOMAINS, HTTP_HOST, HTTP_INDEX, HTTP_INVALIDATE_INTERVAL, HTTP_KEEPALIVE_TIMEOUT, HTTP_PORT,
+    MANIFEST_DIR, METRICS, PROFILER, _NOT_CACHED, AccountChangeWatcher, TTLCache, asset_encodings,
+    is_compressible
+)
+
+
+def _accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows"""
+    accepted = set()
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFile:
+    """A servable file: validators, pre-encoded headers and (when cached) its contents
+    
+    For a precompressed variant (encoding set), path is the variant's and
+    the Content-Type comes from the original file name.
+    """
+    
+    __slots__ = ("size", "mtime_ns", "etag", "validators", "headers", "body", "checked", "variants")
+    
+    def __init__(self, path, st, body=None, encoding=None):
+        self.size = st.st_size if body is None else len(body)
+        self.mtime_ns = st.st_mtime_ns
+        self.etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        self.validators = (f"ETag: {self.etag}\r\n"
+                           f"Last-Modified: {formatdate(st.st_mtime, usegmt=True)}\r\n").encode()
+        headers = ""
+        if encoding is not None:
+            content_type = mimetypes.guess_type(os.path.splitext(path)[0])[0]
+            headers = f"Content-Encoding: {encoding}\r\nVary: Accept-Encoding\r\n"
+        else:
+            content_type, file_encoding = mimetypes.guess_type(path)
+            if file_encoding is not None:
+                # e.g. backup.tar.gz: send the compressed bytes as they are
+                content_type = None
+            elif is_compressible(path):
+                headers = "Vary: Accept-Encoding\r\n"
+        headers += f"Content-Type: {content_type or 'application/octet-stream'}\r\nContent-Length: {self.size}\r\n"
+        self.headers = headers.encode()
+        self.body = body
+        self.checked = time.monotonic()
+        # encoding -> monotonic time until which the variant is known to be missing or stale
+        self.variants = {}
+    
+    def not_modified(self, headers):
+        """True if the request's conditional headers match this version of the file"""
+        etags = headers.get("if-none-match")
+        if etags is not None:
+            return etags.strip() == "*" or self.etag in [tag.strip() for tag in etags.split(",")]
+        since = headers.get("if-modified-since")
+        if since:
+            try:
+                return parsedate_to_datetime(since).timestamp() >= self.mtime_ns // 1_000_000_000
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class StaticFileCache:
+    """LRU cache of small static files, bounded by the bytes it holds
+    
+    Only used from the serving event loop, so there is no lock. Entries
+    are dropped explicitly when a file changes over FTP; an entry older
+    than `revalidate` seconds is also re-checked with stat() so changes
+    made some other way are picked up eventually.
+    """
+    
+    def __init__(self, max_bytes=HTTP_CACHE_MB * 1024 * 1024, max_file=HTTP_CACHE_MAX_FILE,
+                 revalidate=HTTP_CACHE_REVALIDATE):
+        self.max_bytes = max_bytes
+        self.max_file = max_file
+        self.revalidate = revalidate
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+    
+    def get(self, path):
+        """Return the cached StaticFile for path, or None"""
+        entry = self._entries.get(path)
+        if entry is not None:
+            now = time.monotonic()
+            if now - entry.checked > self.revalidate:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    st = None
+                if st is None or (st.st_size, st.st_mtime_ns) != (entry.size, entry.mtime_ns):
+                    self.invalidate(path)
+                    entry = None
+                else:
+                    entry.checked = now
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(path)
+        self.hits += 1
+        return entry
+    
+    def put(self, path, entry):
+        """Cache entry (which must carry its body), evicting least recently used files"""
+        self.invalidate(path)
+        self._entries[path] = entry
+        self.bytes += entry.size
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.size
+            self.evictions += 1
+    
+    def invalidate(self, path=None):
+        """Drop one file, or everything when path is None"""
+        if path is None:
+            self._entries.clear()
+            self.bytes = 0
+            return
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.bytes -= entry.size
+            self.invalidations += 1
+    
+    def stats(self):
+        """Return cache counters as a dict"""
+        lookups = self.hits + self.misses
+        return {
+            "files": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class StaticSiteServer:
+    """asyncio HTTP/1.1 server for every site's public folder (reseller.py serve)
+    
+    The Host header picks the account: an entry in HTTP_DOMAINS, or else
+    the first label of the host name is the username (alice.example.com).
+    Small files are answered from a StaticFileCache; larger ones go out
+    with sendfile(). GET and HEAD only, with ETag/Last-Modified validators
+    and 304 responses.
+    
+    FTP upload, delete and rename hooks feed the site manifest, so this
+    process (usually separate from the FTP server) polls the manifest
+    versions and drops exactly the files that changed.
+    """
+    
+    REASONS = {200: "OK", 301: "Moved Permanently", 304: "Not Modified", 400: "Bad Request",
+               403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed"}
+    
+    def __init__(self, manager, host=None, port=None, cache_mb=None):
+        self.manager = manager
+        self.host = host or HTTP_HOST
+        self.port = port or HTTP_PORT
+        cache_mb = HTTP_CACHE_MB if cache_mb is None else cache_mb
+        self.cache = StaticFileCache(max_bytes=cache_mb * 1024 * 1024)
+        self.sites = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+        self.roots = {}  # account_id -> wwwroot, for every site served so far
+        self.versions = {}  # account_id -> manifest version already applied to the cache
+        self.watcher = None
+        self.requests = 0
+        self._date_second = None
+        self._date = b""
+    
+    def site_root(self, host):
+        """Public folder for a Host header value, or None for unknown or inactive sites"""
+        name = host.split(":", 1)[0].rstrip(".").lower()
+        root = self.sites.get(name, _NOT_CACHED)
+        if root is _NOT_CACHED:
+            site = self.manager.get_site(HTTP_DOMAINS.get(name) or name.split(".", 1)[0])
+            root = None
+            if site is not None:
+                root = self.roots[site["id"]] = os.path.join(site["site_path"], MANIFEST_DIR)
+                if site["id"] not in self.versions:
+                    # Files are only cached from here on; later versions invalidate them
+                    self.versions[site["id"]] = self.manager.manifest_versions([site["id"]]).get(site["id"], 0)
+            self.sites.set(name, root)
+        return root
+    
+    def check_changes(self):
+        """Drop cached sites whose account changed and files changed over FTP"""
+        data_version = self.watcher.data_version
+        changed = self.watcher.poll()
+        if changed is None or changed:
+            # Host names don't map back to usernames; the site cache refills cheaply
+            self.sites.invalidate()
+        if self.watcher.data_version == data_version or not self.roots:
+            # Nothing was committed since the last tick, or nothing is cached
+            return
+        for account_id, version in self.manager.manifest_versions(self.roots).items():
+            since = self.versions.get(account_id, 0)
+            if version == since:
+                continue
+            self.versions[account_id] = version
+            root = self.roots.get(account_id)
+            if root is None:
+                continue
+            for path in self.manager.manifest_paths_since(account_id, since if version > since else 0):
+                path = os.path.join(root, *path.split("/"))
+                self.cache.invalidate(path)
+                # Variants are rewritten after an upload, and the original
+                # remembers which of its variants are usable
+                for _, suffix in asset_encodings():
+                    self.cache.invalidate(path + suffix)
+                    if path.endswith(suffix):
+                        self.cache.invalidate(path[:-len(suffix)])
+    
+    async def _watch_changes(self):
+        while True:
+            await asyncio.sleep(HTTP_INVALIDATE_INTERVAL)
+            try:
+                self.check_changes()
+            except sqlite3.Error as e:
+                # Try again on the next tick; cached files are still re-checked by age
+                print(f"✗ Error checking for site changes: {e}", file=sys.stderr)
+    
+    def _date_header(self):
+        now = int(time.time())
+        if now != self._date_second:
+            self._date_second = now
+            self._date = f"Date: {formatdate(now, usegmt=True)}\r\nServer: AGP-Reseller\r\n".encode()
+        return self._date
+    
+    def _head(self, status, keep_alive, headers=b""):
+        METRICS.http_requests.inc((str(status),))
+        connection = b"Connection: keep-alive\r\n" if keep_alive else b"Connection: close\r\n"
+        return (f"HTTP/1.1 {status} {self.REASONS[status]}\r\n".encode() + self._date_header()
+                + headers + connection + b"\r\n")
+    
+    def _error(self, writer, status, keep_alive, headers=b""):
+        body = f"{status} {self.REASONS[status]}\n".encode()
+        headers += f"Content-Type: text/plain\r\nContent-Length: {len(body)}\r\n".encode()
+        writer.write(self._head(status, keep_alive, headers) + body)
+        return keep_alive
+    
+    def resolve(self, root, target):
+        """Map a request target to (file path, redirect location); both None if it is malformed"""
+        raw = target.split("?", 1)[0]
+        rel = unquote(raw)
+        if not raw.startswith("/") or "\0" in rel:
+            return None, None
+        # normpath on a rooted path can't climb above the site's folder
+        parts = [part for part in posixpath.normpath(rel).split("/") if part]
+        if rel.endswith("/"):
+            parts.append(HTTP_INDEX)
+        elif not parts:
+            return None, "/"
+        # Built from the normalized parts: the raw target could start with
+        # "//" and turn into a redirect to another host
+        return os.path.join(root, *parts), "/" + "/".join(quote(part) for part in parts) + "/"
+    
+    def open_file(self, path, encoding=None):
+        """Open path for serving; returns (StaticFile, open file or None) or an HTTP status"""
+        try:
+            f = open(path, "rb")
+        except IsADirectoryError:
+            return 301
+        except (FileNotFoundError, NotADirectoryError):
+            return 404
+        except OSError:
+            return 403
+        st = os.fstat(f.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            f.close()
+            return 404
+        if st.st_size > self.cache.max_file:
+            return StaticFile(path, st, encoding=encoding), f
+        with f:
+            body = f.read()
+        entry = StaticFile(path, st, body, encoding)
+        if len(body) == st.st_size:
+            # Otherwise it was written to while we read it; serve it once, don't keep it
+            self.cache.put(path, entry)
+        return entry, None
+    
+    def open_variant(self, path, entry, accept):
+        """Precompressed variant of path that the client accepts, as open_file returns it, or None"""
+        accepted = _accepted_encodings(accept)
+        now = time.monotonic()
+        for encoding, suffix in asset_encodings():
+            if encoding not in accepted or entry.variants.get(encoding, 0) > now:
+                continue
+            variant_path = path + suffix
+            f = None
+            variant = self.cache.get(variant_path)
+            if variant is None:
+                opened = self.open_file(variant_path, encoding)
+                if isinstance(opened, int):
+                    entry.variants[encoding] = now + self.cache.revalidate
+                    continue
+                variant, f = opened
+            if variant.mtime_ns < entry.mtime_ns:
+                # Made from an older version of the file; not rewritten yet
+                if f is not None:
+                    f.close()
+                self.cache.invalidate(variant_path)
+                entry.variants[encoding] = now + self.cache.revalidate
+                continue
+            return variant, f
+        return None
+    
+    async def respond(self, head, writer):
+        """Answer one request; returns whether the connection stays open"""
+        self.requests += 1
+        lines = head.decode("latin-1").split("\r\n")
+        request = lines[0].split()
+        if len(request) != 3 or not request[2].startswith("HTTP/1."):
+            return self._error(writer, 400, False)
+        method, target, version = request
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+        if "transfer-encoding" in headers or headers.get("content-length", "0") != "0":
+            # Request bodies are never read, so the stream can't be reused
+            keep_alive = False
+        if method not in ("GET", "HEAD"):
+            return self._error(writer, 405, keep_alive, b"Allow: GET, HEAD\r\n")
+        
+        root = self.site_root(headers.get("host", ""))
+        if root is None:
+            return self._error(writer, 404, keep_alive)
+        path, location = self.resolve(root, target)
+        if path is None:
+            if location is None:
+                return self._error(writer, 400, keep_alive)
+            return self._error(writer, 301, keep_alive, f"Location: {location}\r\n".encode())
+        if path.endswith((".gz", ".br")) and is_compressible(path[:-3]):
+            # Precompressed variants are only served through Accept-Encoding
+            return self._error(writer, 404, keep_alive)
+        
+        f = None
+        entry = self.cache.get(path)
+        METRICS.http_cache.inc(("hit" if entry is not None else "miss",))
+        if entry is None:
+            opened = self.open_file(path)
+            if opened == 301:
+                return self._error(writer, 301, keep_alive, f"Location: {location}\r\n".encode())
+            if isinstance(opened, int):
+                return self._error(writer, opened, keep_alive)
+            entry, f = opened
+        accept = headers.get("accept-encoding")
+        if accept and is_compressible(path):
+            variant = self.open_variant(path, entry, accept)
+            if variant is not None:
+                if f is not None:
+                    f.close()
+                entry, f = variant
+        
+        try:
+            if entry.not_modified(headers):
+                writer.write(self._head(304, keep_alive, entry.validators))
+                return keep_alive
+            response = self._head(200, keep_alive, entry.headers + entry.validators)
+            if method == "HEAD":
+                writer.write(response)
+            elif f is None:
+                writer.write(response + entry.body)
+            else:
+                writer.write(response)
+                await writer.drain()
+                sent = await asyncio.get_running_loop().sendfile(writer.transport, f, 0, entry.size)
+                if sent != entry.size:
+                    # The file shrank while it was sent; the response is short
+                    return False
+            return keep_alive
+        finally:
+            if f is not None:
+                f.close()
+    
+    async def handle(self, reader, writer):
+        """Serve requests from one connection until it closes or stays idle"""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HTTP_KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    break
+                keep_alive = await self.respond(head, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    async def serve(self):
+        """Listen and serve until cancelled"""
+        self.manager.init_database()
+        self.watcher = AccountChangeWatcher(self.manager.db_path)
+        server = await asyncio.start_server(self.handle, self.host, self.port, backlog=1024)
+        watcher = asyncio.create_task(self._watch_changes())
+        if PROFILER.window:
+            asyncio.get_running_loop().call_later(PROFILER.window, PROFILER.stop_cprofile)
+        
+        print(f"\n{'='*80}")
+        print(f"HTTP SERVER STARTED")
+        print(f"{'='*80}")
+        print(f"Listening: http://{self.host}:{self.port}/")
+        print(f"Sites: <username>.<any domain>" + (f", {len(HTTP_DOMAINS)} custom domain(s)" if HTTP_DOMAINS else ""))
+        print(f"Cache: {self.cache.max_bytes // 1048576} MB, files up to {self.cache.max_file // 1024} KB")
+        print(f"{'='*80}\n")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+    
+    def start(self):
+        """Run the server until interrupted"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        except PermissionError:
+            print(f"\n✗ Error: Permission denied to bind to port {self.port}")
+            sys.exit(1)
+        except OSError as e:
+            print(f"✗ Error starting HTTP server: {e}")
+            sys.exit(1)
+    
+    def stop(self):
+        """Release the watcher and print cache statistics"""
+        if self.watcher:
+            self.watcher.close()
+        stats = self.cache.stats()
+        print(f"Requests: {self.requests}")
+        print(f"File cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, "
+              f"{stats['invalidations']} invalidations, {stats['files']} files "
+              f"({stats['bytes'] / 1048576:.1f} MB) cached")